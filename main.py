@@ -1,111 +1,147 @@
-import pandas as pd
 import os
-import numpy as np
 import sys
+import argparse
 
 # Add the src directory to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from data_acquisition import download_historical_data, get_sp500_tickers
-from pair_identification import find_cointegrated_pairs, load_data
-from strategy_development import calculate_hedge_ratio_and_spread, generate_signals
-from backtesting_engine import Backtester
-from performance_analysis import calculate_returns, calculate_sharpe_ratio, calculate_sortino_ratio, calculate_max_drawdown, calculate_volatility
+# Only light modules are imported here; each command imports what it needs when it runs
+# (see `pipeline`), so e.g. `report` starts without loading statsmodels or yfinance.
+from profiling import RunProfiler
+import pipeline
+
+COMMANDS = ('run', 'download', 'screen', 'signals', 'backtest', 'report')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the pairs trading pipeline, or one of its stages.",
+        epilog="Without a command the whole pipeline runs (download if needed, screen, signals, backtest, "
+               "report). Stages pass their results through binary artifacts in data/artifacts/, so each "
+               "command can be run on its own once the previous stages have run.")
+    parser.add_argument('--data-dir', default=os.path.abspath(os.path.join(os.path.dirname(__file__), 'data')),
+                        help="Directory of the price data and artifacts (default: data/)")
+    parser.add_argument('--report', default=None,
+                        help="Path of the JSON run report (default: data/run_report.json)")
+    parser.add_argument('--profile', action='store_true', help="Run every stage under cProfile")
+    parser.add_argument('--trace-memory', action='store_true', help="Trace Python allocations per stage")
+    parser.add_argument('--no-cache', action='store_true', help="Do not read or write the result cache")
+    parser.add_argument('--jobs', type=int, default=-1,
+                        help="Processes for the backtest: -1 for one per CPU (default), 1 to run serially")
+    commands = parser.add_subparsers(dest='command', metavar='command')
+
+    commands.add_parser('run', help="Run every stage (the default)")
+    download = commands.add_parser('download', help="Download S&P 500 prices")
+    download.add_argument('--start', default="2010-01-01")
+    download.add_argument('--end', default="2025-06-30")
+    download.add_argument('--interval', default='1d', help="yfinance bar size, e.g. 1d, 1h, 5m")
+    screen = commands.add_parser('screen', help="Find cointegrated pairs (writes pairs.npz)")
+    screen.add_argument('--prefilter', choices=['correlation', 'distance'], default=None)
+    signals = commands.add_parser('signals', help="Compute hedge ratios and signals (writes signals.npz)")
+    signals.add_argument('--window', default=60, type=window_arg,
+                         help="Z-score window in bars (at least 2), or a time span such as 30D")
+    signals.add_argument('--entry-zscore', type=float, default=2.0)
+    signals.add_argument('--exit-zscore', type=float, default=0.0)
+    backtest = commands.add_parser('backtest', help="Backtest the pairs as one portfolio (writes portfolio.npz)")
+    backtest.add_argument('--capital', type=float, default=100000)
+    report = commands.add_parser('report', help="Print performance metrics of the last backtest")
+    report.add_argument('--input', default=None,
+                        help="portfolio.npz or a CSV such as data/portfolio_value.csv (default: the artifact)")
+
+    args = parser.parse_args(argv)
+    args.command = args.command or 'run'
+    if args.jobs == 0 or args.jobs < -1:
+        parser.error("--jobs must be -1 or a positive number")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    data_dir = args.data_dir
+    data_file_path = os.path.join(data_dir, "sp500_adj_close.csv")
+    profiler = RunProfiler(profile=args.profile, trace_memory=args.trace_memory)
+    try:
+        if args.command == 'run':
+            run_pipeline(data_dir, data_file_path, profiler, use_cache=not args.no_cache, n_jobs=args.jobs)
+        else:
+            run_command(args, data_dir, data_file_path, profiler)
+    finally:
+        report_path = args.report or os.path.join(data_dir, "run_report.json")
+        profiler.write_report(report_path)
+        print(f"\nStage timings:\n{profiler.summary()}")
+        print(f"Run report saved to {report_path}")
+
+def _cache(data_dir, use_cache):
+    if not use_cache:
+        return None
+    from result_cache import ResultCache
+    # Screening, signal and backtest results are reused across runs when their inputs are unchanged
+    return ResultCache(os.path.join(data_dir, "cache"))
+
+def window_arg(value):
+    """argparse type of --window: a bar count of at least 2, or a positive time span such as 30D or 2h."""
+    if value.isdigit() and int(value) >= 2:
+        return int(value)
+    try:
+        float(value)
+    except ValueError:
+        pass
+    else:
+        raise argparse.ArgumentTypeError(f"a window in bars must be a whole number of at least 2, not {value}")
+    import pandas as pd
+
+    try:
+        span = pd.Timedelta(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a bar count or a time span such as 30D or 2h: {value}") from None
+    if span <= pd.Timedelta(0):
+        raise argparse.ArgumentTypeError(f"a time window must be positive, not {value}")
+    return value
+
+def run_command(args, data_dir, data_file_path, profiler):
+    """Runs one stage, reading its inputs from the artifacts of the stages before it."""
+    if args.command == 'download':
+        pipeline.download_stage(data_file_path, profiler, args.start, args.end, args.interval)
+    elif args.command == 'report':
+        pipeline.report_stage(pipeline.load_portfolio_value(data_dir, args.input), profiler)
+    else:
+        stock_data = pipeline.load_stage(data_file_path, profiler)
+        if args.command == 'screen':
+            pipeline.screen_stage(stock_data, data_dir, profiler, cache=_cache(data_dir, not args.no_cache),
+                                  prefilter=args.prefilter)
+        elif args.command == 'signals':
+            from strategy_development import check_window
+            try:
+                check_window(args.window, stock_data.index)
+            except ValueError as error:
+                sys.exit(f"main.py signals: error: argument --window: {error}")
+            pipeline.signals_stage(stock_data, data_dir, profiler, entry_zscore=args.entry_zscore,
+                                   exit_zscore=args.exit_zscore, window=args.window,
+                                   cache=_cache(data_dir, not args.no_cache))
+        else:
+            pipeline.backtest_stage(stock_data, data_dir, profiler, initial_capital=args.capital, n_jobs=args.jobs,
+                                    cache=_cache(data_dir, not args.no_cache))
 
-def main():
+def run_pipeline(data_dir, data_file_path, profiler, use_cache=True, n_jobs=-1):
     # 1. Data Acquisition
-    # Use relative paths for data files
-    data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), 'data'))
-    data_file_path = os.path.join(data_dir, "sp500_adj_close.csv")
-    
     if not os.path.exists(data_file_path):
         print("Historical data not found. Downloading data...")
-        tickers = get_sp500_tickers()
-        start_date = "2010-01-01"
-        end_date = "2025-06-30"
-        print(f"Found {len(tickers)} tickers. Downloading historical data from {start_date} to {end_date}...")
-        
-        adj_close_data, failed_list = download_historical_data(tickers, start_date, end_date)
-        
-        if not adj_close_data.empty:
-            print(f"\nSuccessfully downloaded data for {len(adj_close_data.columns)} tickers.")
-            if failed_list:
-                print(f"Failed to download data for {len(failed_list)} tickers: {failed_list}")
-
-            os.makedirs(data_dir, exist_ok=True)
-            adj_close_data.to_csv(data_file_path)
-            print(f"Historical data saved to {data_file_path}")
-        else:
-            print("\nFailed to download any historical data. Exiting.")
+        if not pipeline.download_stage(data_file_path, profiler):
             return
     else:
         print(f"Found existing data file at {data_file_path}. Loading data...")
-
-    stock_data = load_data(data_file_path)
-    print("Data loaded successfully.")
+    stock_data = pipeline.load_stage(data_file_path, profiler)
+    cache = _cache(data_dir, use_cache)
 
     # 2. Pair Identification
-    print("\nFinding cointegrated pairs...")
-    cointegrated_pairs = find_cointegrated_pairs(stock_data)
+    pairs = pipeline.screen_stage(stock_data, data_dir, profiler, cache=cache)
 
-    if not cointegrated_pairs:
-        print("No cointegrated pairs found. Using a default pair for demonstration (AMZN, NVDA).")
-        cointegrated_pairs = [("AMZN", "NVDA")] 
-    else:
-        print("\nFound cointegrated pairs (Asset1, Asset2, P-value):")
-        for pair in cointegrated_pairs:
-            print(f"  {pair[0]} - {pair[1]} (p-value: {pair[2]:.4f})")
-        # Use the first found pair for backtesting
-        cointegrated_pairs = [cointegrated_pairs[0][:2]]
-
-    for asset1_ticker, asset2_ticker in cointegrated_pairs:
-        print(f"\n--- Processing pair: {asset1_ticker} and {asset2_ticker} ---")
-
-        series1 = stock_data[asset1_ticker].dropna()
-        series2 = stock_data[asset2_ticker].dropna()
-
-        common_index = series1.index.intersection(series2.index)
-        series1 = series1.loc[common_index]
-        series2 = series2.loc[common_index]
-
-        if len(series1) < 60:
-            print(f"Skipping pair {asset1_ticker}-{asset2_ticker}: Not enough data points for strategy.")
-            continue
-
-        # 3. Strategy Development
-        print("\nCalculating hedge ratio and generating signals...")
-        beta, spread = calculate_hedge_ratio_and_spread(series1, series2)
-        signals = generate_signals(spread)
-        print(f"Hedge ratio (beta) for {asset1_ticker} vs {asset2_ticker}: {beta:.4f}")
-
-        # 4. Backtesting
-        print("\nRunning backtest...")
-        backtester = Backtester(initial_capital=100000)
-        portfolio_value = backtester.run_backtest(stock_data, signals, asset1_ticker, asset2_ticker)
-        
-        portfolio_value_path = os.path.join(data_dir, "portfolio_value.csv")
-        portfolio_value.to_csv(portfolio_value_path, header=['Portfolio_Value'])
-        print(f"Portfolio value saved to {portfolio_value_path}")
-
-        print(f"\nFinal Portfolio Value: {portfolio_value.iloc[-1]:.2f}")
-        print(f"Initial Capital: {backtester.initial_capital:.2f}")
-        print(f"Total Return: {((portfolio_value.iloc[-1] - backtester.initial_capital) / backtester.initial_capital * 100):.2f}%")
-
-        # 5. Performance Analysis
-        print("\nCalculating performance metrics...")
-        returns = calculate_returns(portfolio_value)
-        sharpe_ratio = calculate_sharpe_ratio(returns)
-        sortino_ratio = calculate_sortino_ratio(returns)
-        max_drawdown = calculate_max_drawdown(portfolio_value)
-        volatility = calculate_volatility(returns)
-
-        print(f"Sharpe Ratio: {sharpe_ratio:.4f}")
-        if not np.isnan(sortino_ratio):
-            print(f"Sortino Ratio: {sortino_ratio:.4f}")
-        else:
-            print("Sortino Ratio: N/A (no downside deviation)")
-        print(f"Max Drawdown: {max_drawdown:.4f}")
-        print(f"Volatility (Annualized): {volatility:.4f}")
+    # 3. Strategy Development and 4. Backtesting, for every pair in one portfolio
+    pipeline.signals_stage(stock_data, data_dir, profiler, pairs=pairs, cache=cache)
+    backtester = pipeline.backtest_stage(stock_data, data_dir, profiler, n_jobs=n_jobs, cache=cache)
+    if backtester.attribution.empty:
+        return
+
+    # 5. Performance Analysis
+    pipeline.report_stage(backtester.portfolio_value, profiler)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,70 @@
+import numpy as np
+
+def pack_validity(values, chunk_rows=65536):
+    """Packs the non-NaN mask of a (dates x tickers) matrix into one bit per price.
+
+    Returns a (tickers, ceil(dates / 8)) uint8 array: each ticker's bits are contiguous,
+    and the matrix is read `chunk_rows` rows at a time so a memory map is never loaded whole.
+    """
+    n_rows, n_cols = values.shape
+    bits = np.empty((n_cols, (n_rows + 7) // 8), dtype=np.uint8)
+    chunk_rows -= chunk_rows % 8
+    for start in range(0, n_rows, chunk_rows):
+        stop = min(start + chunk_rows, n_rows)
+        bits[:, start // 8:(stop + 7) // 8] = np.packbits(~np.isnan(values[start:stop]).T, axis=1)
+    return bits
+
+class AlignmentIndex:
+    """Per-ticker validity index of a price matrix, built once and shared by all pairs.
+
+    For every ticker it keeps the first valid row, the row after the last valid one, the
+    number of valid rows and the packed validity bitmap. A ticker is gap-free when every
+    row between its first and last price is valid, which is the common case; the common
+    rows of two gap-free tickers are then one contiguous range found in O(1), and aligned
+    arrays are plain slices. Only pairs with an internal gap fall back to the bitmaps.
+    """
+
+    def __init__(self, valid_bits, n_rows, column_chunk=256):
+        self.valid_bits = valid_bits
+        self.n_rows = n_rows
+        n_cols = len(valid_bits)
+        self.first = np.empty(n_cols, dtype=np.intp)
+        self.stop = np.empty(n_cols, dtype=np.intp)
+        self.n_valid = np.empty(n_cols, dtype=np.intp)
+        for lo in range(0, n_cols, column_chunk):
+            valid = np.unpackbits(valid_bits[lo:lo + column_chunk], axis=1, count=n_rows).astype(bool)
+            any_valid = valid.any(axis=1)
+            self.first[lo:lo + column_chunk] = np.where(any_valid, valid.argmax(axis=1), n_rows)
+            self.stop[lo:lo + column_chunk] = np.where(any_valid, n_rows - valid[:, ::-1].argmax(axis=1), n_rows)
+            self.n_valid[lo:lo + column_chunk] = valid.sum(axis=1)
+        self.gap_free = self.n_valid == self.stop - self.first
+
+    @classmethod
+    def from_prices(cls, prices):
+        """Builds the index from a (dates x tickers) price matrix with NaN for missing bars."""
+        return cls(pack_validity(prices), len(prices))
+
+    def common_range(self, i, j):
+        """First common row and the row after the last one for columns i and j (arrays allowed)."""
+        lo = np.maximum(self.first[i], self.first[j])
+        hi = np.maximum(np.minimum(self.stop[i], self.stop[j]), lo)
+        return lo, hi
+
+    def is_contiguous(self, i, j):
+        """True where every row in the common range of i and j is valid for both."""
+        return self.gap_free[i] & self.gap_free[j]
+
+    def common_rows(self, i, j):
+        """Rows on which both columns are valid: a slice if contiguous, else an index array."""
+        lo, hi = self.common_range(i, j)
+        if self.is_contiguous(i, j):
+            return slice(int(lo), int(hi))
+        # Only the bytes covering the common range are combined
+        first_byte = lo // 8
+        bits = self.valid_bits[i, first_byte:(hi + 7) // 8] & self.valid_bits[j, first_byte:(hi + 7) // 8]
+        rows = np.flatnonzero(np.unpackbits(bits)) + 8 * first_byte
+        return rows[rows < hi]
+
+    def common_mask(self, i, j):
+        """Boolean mask over all rows of the dates on which both columns are valid."""
+        return np.unpackbits(self.valid_bits[i] & self.valid_bits[j], count=self.n_rows).astype(bool)
@@ -1,45 +1,268 @@
 import pandas as pd
 import numpy as np
-import statsmodels.api as sm
 import os
 
 from utils import load_data, get_data_dir
+from strategy_development import calculate_hedge_ratio_and_spread, generate_signals
 
-def calculate_hedge_ratio_and_spread(series1, series2):
-    """Calculates the hedge ratio (beta) and spread using OLS regression."""
-    X = sm.add_constant(series2)
-    model = sm.OLS(series1, X)
-    results = model.fit()
-    beta = results.params[1]
-    spread = series1 - beta * series2
-    return beta, spread
-
-def generate_signals(spread, entry_zscore=2.0, exit_zscore=0.0):
-    """Generates trading signals based on the z-score of the spread."""
-    window = 60
-    rolling_mean = spread.rolling(window=window).mean()
-    rolling_std = spread.rolling(window=window).std()
-    
-    z_score = (spread - rolling_mean) / rolling_std
-    
-    signals = pd.DataFrame(index=spread.index)
-    signals['long_entry'] = z_score < -entry_zscore
-    signals['short_entry'] = z_score > entry_zscore
-    signals['long_exit'] = z_score >= exit_zscore
-    signals['short_exit'] = z_score <= exit_zscore
-    
-    return signals
+def _next_true(flags):
+    """For every bar, the index of the first True flag at or after it (len(flags) if none)."""
+    n = len(flags)
+    positions = np.where(flags, np.arange(n), n)
+    return np.minimum.accumulate(positions[::-1])[::-1]
+
+def signal_arrays(index, signals, *prices):
+    """Aligns a signals frame to the backtest dates and returns the four flags as bool arrays.
+
+    `prices` are the price arrays of every leg. Like the bar loop, a tradable bar (all
+    prices present, not the first bar) without a signal row raises KeyError.
+    """
+    has_signal = index.isin(signals.index)
+    tradable = ~np.any([np.isnan(price) for price in prices], axis=0)
+    tradable[:1] = False
+    if not has_signal[tradable].all():
+        raise KeyError(index[tradable & ~has_signal][0])
+    aligned = signals.reindex(index, fill_value=False)
+    return [aligned[col].to_numpy(dtype=bool) for col in ('long_entry', 'short_entry', 'long_exit', 'short_exit')]
+
+def pair_backtest_kernel(price1, price2, long_entry, short_entry, long_exit, short_exit,
+                         capital, shares1=0.0, shares2=0.0, in_trade=False):
+    """Runs the pair trading state machine on NumPy arrays.
+
+    Reproduces `Backtester.run_backtest_loop` exactly, float for float, but only steps
+    from trade to trade: the next entry and exit bars are looked up in precomputed
+    next-signal tables and the portfolio value is filled in one slice per holding period.
+    Returns (portfolio values, (capital, shares1, shares2, in_trade), trades), where
+    trades lists (entry bar, exit bar or None, +1 long / -1 short spread).
+    """
+    n = len(price1)
+    values = np.empty(n)
+    if n == 0:
+        return values, (capital, shares1, shares2, in_trade), []
+    values[0] = capital
+
+    valid = ~(np.isnan(price1) | np.isnan(price2))
+    valid[0] = False  # The first bar only initializes the portfolio value
+    next_long_entry = _next_true(long_entry & valid)
+    next_entry = _next_true((long_entry | short_entry) & valid)
+    next_long_exit = _next_true(long_exit & valid)
+    next_short_exit = _next_true(short_exit & valid)
+
+    trades = []
+    pos = 1
+    while pos < n:
+        if not in_trade:
+            entry = next_entry[pos]
+            stop = min(entry + 1, n)
+            values[pos:stop] = capital
+            if entry == n:
+                break
+            # Buy the spread on a long entry, otherwise sell it
+            amount_to_invest = capital / 2
+            if next_long_entry[entry] == entry:
+                shares1 = amount_to_invest / price1[entry]
+                shares2 = -(amount_to_invest / price2[entry])
+                trades.append([entry, None, 1])
+            else:
+                shares1 = -(amount_to_invest / price1[entry])
+                shares2 = amount_to_invest / price2[entry]
+                trades.append([entry, None, -1])
+            in_trade = True
+            pos = entry + 1
+        else:
+            if shares1 > 0:
+                exit_bar = next_long_exit[pos]
+            elif shares1 < 0:
+                exit_bar = next_short_exit[pos]
+            else:
+                exit_bar = n
+            stop = min(exit_bar + 1, n)
+            values[pos:stop] = capital + shares1 * price1[pos:stop] + shares2 * price2[pos:stop]
+            if exit_bar == n:
+                break
+            capital += shares1 * price1[exit_bar] + shares2 * price2[exit_bar]
+            shares1, shares2 = 0, 0
+            in_trade = False
+            if trades:
+                trades[-1][1] = exit_bar
+            pos = exit_bar + 1
+
+    # Bars with a missing price carry the previous value forward
+    carry = np.where(valid, np.arange(n), 0)
+    carry[0] = 0
+    values = values[np.maximum.accumulate(carry)]
+    return values, (capital, shares1, shares2, in_trade), [tuple(trade) for trade in trades]
+
+def basket_backtest_kernel(prices, weights, long_entry, short_entry, long_exit, short_exit, capital,
+                           shares=None, in_trade=False):
+    """Runs the spread trading state machine for a basket of N legs on NumPy arrays.
+
+    `prices` has one column per leg and `weights` are the hedge weights that define the
+    spread (prices @ weights). A long entry buys `weights` units of every leg, scaled so the
+    gross exposure equals the capital at the entry bar; a short entry sells them. Bar
+    values, missing prices and exits follow `pair_backtest_kernel`.
+    Returns (portfolio values, (capital, shares, in_trade), trades).
+    """
+    prices = np.asarray(prices, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    n = len(prices)
+    shares = np.zeros(len(weights)) if shares is None else np.asarray(shares, dtype=float)
+    values = np.empty(n)
+    if n == 0:
+        return values, (capital, shares, in_trade), []
+    values[0] = capital
+
+    valid = ~np.isnan(prices).any(axis=1)
+    valid[0] = False
+    next_long_entry = _next_true(long_entry & valid)
+    next_entry = _next_true((long_entry | short_entry) & valid)
+    next_long_exit = _next_true(long_exit & valid)
+    next_short_exit = _next_true(short_exit & valid)
+
+    trades = []
+    pos = 1
+    while pos < n:
+        if not in_trade:
+            entry = next_entry[pos]
+            values[pos:min(entry + 1, n)] = capital
+            if entry == n:
+                break
+            direction = 1 if next_long_entry[entry] == entry else -1
+            units = capital / np.abs(weights * prices[entry]).sum()
+            shares = direction * units * weights
+            trades.append([entry, None, direction])
+            in_trade = True
+            pos = entry + 1
+        else:
+            # The side of the open position is the sign of its spread exposure
+            held = shares @ weights
+            if held > 0:
+                exit_bar = next_long_exit[pos]
+            elif held < 0:
+                exit_bar = next_short_exit[pos]
+            else:
+                exit_bar = n
+            stop = min(exit_bar + 1, n)
+            values[pos:stop] = capital + prices[pos:stop] @ shares
+            if exit_bar == n:
+                break
+            capital += prices[exit_bar] @ shares
+            shares = np.zeros(len(weights))
+            in_trade = False
+            if trades:
+                trades[-1][1] = exit_bar
+            pos = exit_bar + 1
+
+    carry = np.where(valid, np.arange(n), 0)
+    values = values[np.maximum.accumulate(carry)]
+    return values, (capital, shares, in_trade), [tuple(trade) for trade in trades]
+
+def pair_backtest_batch(price1, price2, long_entry, short_entry, long_exit, short_exit, capital):
+    """Runs many independent pair backtests at once, one per column of the signal flags.
+
+    The flags are (bars x paths) boolean matrices; the prices are either one array shared
+    by all paths or (bars x paths) matrices, e.g. resampled price paths. The state machine
+    of `pair_backtest_kernel` is stepped bar by bar with every path updated in the same
+    vector operations, so thousands of simulated backtests cost one pass over the bars.
+    Every column matches `pair_backtest_kernel` on the same inputs exactly.
+    Returns (portfolio values, positions, trade counts), where positions is +1/-1 while
+    long/short the spread (entry bar included, exit bar not) and 0 otherwise.
+    """
+    n, n_paths = np.shape(long_entry)
+    price1 = np.broadcast_to(np.asarray(price1, dtype=float).reshape(n, -1), (n, n_paths))
+    price2 = np.broadcast_to(np.asarray(price2, dtype=float).reshape(n, -1), (n, n_paths))
+    values = np.empty((n, n_paths))
+    positions = np.zeros((n, n_paths))
+    n_trades = np.zeros(n_paths, dtype=np.int64)
+    if n == 0:
+        return values, positions, n_trades
+
+    capital = np.full(n_paths, capital, dtype=float)
+    shares1 = np.zeros(n_paths)
+    shares2 = np.zeros(n_paths)
+    side = np.zeros(n_paths)
+    values[0] = capital
+    for t in range(1, n):
+        p1, p2 = price1[t], price2[t]
+        valid = ~(np.isnan(p1) | np.isnan(p2))
+        in_trade = side != 0
+        # Bars with a missing price carry the previous value forward
+        values[t] = np.where(valid, np.where(in_trade, capital + shares1 * p1 + shares2 * p2, capital),
+                             values[t - 1])
+
+        exit_now = valid & in_trade & (((shares1 > 0) & long_exit[t]) | ((shares1 < 0) & short_exit[t]))
+        if exit_now.any():
+            capital = np.where(exit_now, capital + (shares1 * p1 + shares2 * p2), capital)
+            shares1 = np.where(exit_now, 0.0, shares1)
+            shares2 = np.where(exit_now, 0.0, shares2)
+            side = np.where(exit_now, 0.0, side)
+
+        enter_long = valid & ~in_trade & long_entry[t]
+        enter_short = valid & ~in_trade & ~long_entry[t] & short_entry[t]
+        entering = enter_long | enter_short
+        if entering.any():
+            amount_to_invest = capital / 2
+            shares1 = np.where(enter_long, amount_to_invest / p1, np.where(enter_short, -(amount_to_invest / p1),
+                                                                              shares1))
+            shares2 = np.where(enter_long, -(amount_to_invest / p2), np.where(enter_short, amount_to_invest / p2,
+                                                                                shares2))
+            side = np.where(enter_long, 1.0, np.where(enter_short, -1.0, side))
+            n_trades += entering
+        positions[t] = side
+    return values, positions, n_trades
 
 class Backtester:
     def __init__(self, initial_capital=100000):
         self.initial_capital = initial_capital
         self.capital = initial_capital
         self.portfolio_value = pd.Series(dtype=float)
-        self.positions = {'asset1': 0, 'asset2': 0}
+        # Shares held per ticker, for any number of legs
+        self.positions = {}
         self.in_trade = False
+        self.trades = []
 
     def run_backtest(self, stock_data, signals, asset1_ticker, asset2_ticker):
+        """Backtests a pair and returns the daily portfolio value.
+
+        The prices and signals are pulled out as NumPy arrays once and handed to
+        `pair_backtest_kernel`; the result is identical to `run_backtest_loop`.
+        """
+        price1 = stock_data[asset1_ticker].to_numpy(dtype=float)
+        price2 = stock_data[asset2_ticker].to_numpy(dtype=float)
+        flags = signal_arrays(stock_data.index, signals, price1, price2)
+        values, state, trades = pair_backtest_kernel(price1, price2, *flags, self.capital,
+                                                     self.positions.get(asset1_ticker, 0),
+                                                     self.positions.get(asset2_ticker, 0), self.in_trade)
+        self.capital, shares1, shares2, self.in_trade = state
+        self.positions = {asset1_ticker: shares1, asset2_ticker: shares2}
+        self.trades = self._dated_trades(stock_data.index, trades)
+        self.portfolio_value = pd.Series(values, index=stock_data.index, dtype=float)
+        return self.portfolio_value
+
+    def run_basket_backtest(self, stock_data, signals, tickers, weights):
+        """Backtests a spread of any number of legs (prices @ weights) with `basket_backtest_kernel`."""
+        tickers = list(tickers)
+        prices = stock_data[tickers].to_numpy(dtype=float)
+        flags = signal_arrays(stock_data.index, signals, *prices.T)
+        shares = [self.positions.get(ticker, 0) for ticker in tickers]
+        values, state, trades = basket_backtest_kernel(prices, weights, *flags, self.capital, shares,
+                                                       self.in_trade)
+        self.capital, shares, self.in_trade = state
+        self.positions = dict(zip(tickers, shares))
+        self.trades = self._dated_trades(stock_data.index, trades)
+        self.portfolio_value = pd.Series(values, index=stock_data.index, dtype=float)
+        return self.portfolio_value
+
+    def _dated_trades(self, index, trades):
+        return [(index[entry], None if exit_bar is None else index[exit_bar], side)
+                for entry, exit_bar, side in trades]
+
+    def run_backtest_loop(self, stock_data, signals, asset1_ticker, asset2_ticker):
+        """Reference bar-by-bar implementation of `run_backtest`."""
         self.portfolio_value = pd.Series(index=stock_data.index, dtype=float)
+        trades = []
+        self.positions = {asset1_ticker: self.positions.get(asset1_ticker, 0),
+                          asset2_ticker: self.positions.get(asset2_ticker, 0)}
         
         for i, date in enumerate(stock_data.index):
             if i == 0: # Initialize portfolio value
@@ -56,8 +279,8 @@ class Backtester:
             # Update portfolio value
             if self.in_trade:
                 current_value = self.capital + \
-                                self.positions['asset1'] * price1 + \
-                                self.positions['asset2'] * price2
+                                self.positions[asset1_ticker] * price1 + \
+                                self.positions[asset2_ticker] * price2
                 self.portfolio_value.loc[date] = current_value
             else:
                 self.portfolio_value.loc[date] = self.capital
@@ -75,31 +298,36 @@ class Backtester:
                     shares1 = amount_to_invest / price1
                     shares2 = amount_to_invest / price2
 
-                    self.positions['asset1'] = shares1
-                    self.positions['asset2'] = -shares2 # Short asset2
+                    self.positions[asset1_ticker] = shares1
+                    self.positions[asset2_ticker] = -shares2 # Short asset2
                     self.in_trade = True
+                    trades.append([date, None, 1])
 
                 elif short_entry: # Sell spread
                     amount_to_invest = self.capital / 2
                     shares1 = amount_to_invest / price1
                     shares2 = amount_to_invest / price2
 
-                    self.positions['asset1'] = -shares1 # Short asset1
-                    self.positions['asset2'] = shares2
+                    self.positions[asset1_ticker] = -shares1 # Short asset1
+                    self.positions[asset2_ticker] = shares2
                     self.in_trade = True
+                    trades.append([date, None, -1])
 
             elif self.in_trade:
                 # Check for exit conditions
-                if (self.positions['asset1'] > 0 and long_exit) or \
-                   (self.positions['asset1'] < 0 and short_exit):
+                if (self.positions[asset1_ticker] > 0 and long_exit) or \
+                   (self.positions[asset1_ticker] < 0 and short_exit):
                     
                     # Close positions
-                    self.capital += self.positions['asset1'] * price1 + \
-                                    self.positions['asset2'] * price2
+                    self.capital += self.positions[asset1_ticker] * price1 + \
+                                    self.positions[asset2_ticker] * price2
                     
-                    self.positions = {'asset1': 0, 'asset2': 0}
+                    self.positions = {asset1_ticker: 0, asset2_ticker: 0}
                     self.in_trade = False
+                    if trades:
+                        trades[-1][1] = date
 
+        self.trades = [tuple(trade) for trade in trades]
         return self.portfolio_value
 
 if __name__ == "__main__":
@@ -0,0 +1,86 @@
+import pandas as pd
+import numpy as np
+import math
+
+TRADING_DAYS_PER_YEAR = 252
+TRADING_HOURS_PER_DAY = 6.5
+WEEKS_PER_YEAR = 52
+
+# yfinance interval names that pandas reads differently ('1m' would be a month)
+YAHOO_INTERVALS = {'1m': '1min', '2m': '2min', '5m': '5min', '15m': '15min', '30m': '30min',
+                   '60m': '60min', '90m': '90min', '1h': '1h', '1d': '1D', '5d': '5D', '1wk': '7D'}
+
+def bar_timedelta(frequency):
+    """Length of one bar as a Timedelta, from e.g. '1min', '5min', '1h', '1D' or a yfinance interval."""
+    if isinstance(frequency, str):
+        frequency = YAHOO_INTERVALS.get(frequency, frequency)
+    bar = pd.Timedelta(frequency)
+    if bar <= pd.Timedelta(0):
+        raise ValueError(f"Bar frequency must be positive: {frequency}")
+    return bar
+
+def bars_per_day(frequency, hours_per_day=TRADING_HOURS_PER_DAY):
+    """Bars in one trading session. A last, shorter bar counts as a bar (6.5 hours of 1h bars is 7)."""
+    bar = bar_timedelta(frequency)
+    if bar >= pd.Timedelta(days=1):
+        return 1
+    return math.ceil(pd.Timedelta(hours=hours_per_day) / bar)
+
+def periods_per_year(frequency, trading_days=TRADING_DAYS_PER_YEAR, hours_per_day=TRADING_HOURS_PER_DAY):
+    """Number of bars in a trading year, used to annualize returns, volatility and Sharpe ratios.
+
+    Intraday bars count only trading hours (`hours_per_day` per session, `trading_days`
+    sessions a year), so 1-minute bars give 252 * 390. Daily bars give 252; bars of
+    whole weeks count 52 a year.
+    """
+    bar = bar_timedelta(frequency)
+    day = pd.Timedelta(days=1)
+    if bar < day:
+        return trading_days * bars_per_day(bar, hours_per_day)
+    if bar % pd.Timedelta(days=7) == pd.Timedelta(0):
+        return WEEKS_PER_YEAR / (bar / pd.Timedelta(days=7))
+    return trading_days / (bar / day)
+
+def annualization_factor(frequency, **kwargs):
+    """Square root of `periods_per_year`, the factor that annualizes a per-bar Sharpe ratio or volatility."""
+    return np.sqrt(periods_per_year(frequency, **kwargs))
+
+def infer_frequency(index):
+    """Bar length of a DatetimeIndex: the median gap between bars within the same day, or one day.
+
+    Overnight, weekend and holiday gaps are ignored, so regular intraday sessions are
+    recognized; an index whose bars are mostly a day or more apart is daily.
+    """
+    index = pd.DatetimeIndex(index)
+    if len(index) < 2:
+        return pd.Timedelta(days=1)
+    gaps = np.diff(index.as_unit('ns').asi8)
+    same_day = (index[1:].normalize() == index[:-1].normalize()) & (gaps > 0)
+    if same_day.mean() < 0.5:
+        return pd.Timedelta(days=1)
+    return pd.Timedelta(int(np.median(gaps[same_day])), unit='ns')
+
+def window_bars(window, frequency, hours_per_day=TRADING_HOURS_PER_DAY):
+    """Converts a time window to a number of bars at `frequency`; integers are already bars.
+
+    Windows of whole days count trading sessions ('5D' is five sessions of bars), shorter
+    windows count bars ('2h' of 5-minute bars is 24), so a window keeps its meaning when
+    the bar frequency changes.
+    """
+    if isinstance(window, (int, np.integer)):
+        return int(window)
+    window = pd.Timedelta(window)
+    bar = bar_timedelta(frequency)
+    day = pd.Timedelta(days=1)
+    if window >= day and window % day == pd.Timedelta(0) and bar < day:
+        return int(window / day) * bars_per_day(bar, hours_per_day)
+    return max(int(window // bar), 1)
+
+if __name__ == "__main__":
+    for frequency in ['1min', '5min', '15min', '1h', '1D', '1wk']:
+        print(f"{frequency:>6}: {periods_per_year(frequency):>8.0f} bars a year, "
+              f"annualization factor {annualization_factor(frequency):7.2f}, "
+              f"a 60-day window is {window_bars('60D', frequency)} bars")
+
+    index = pd.date_range("2024-01-02 09:30", periods=78, freq="5min")
+    print(f"Inferred bar length of a 5-minute session: {infer_frequency(index)}")
@@ -0,0 +1,183 @@
+import pandas as pd
+import numpy as np
+import itertools
+import os
+import time
+from statsmodels.tsa.coint_tables import c_sjt
+
+from utils import load_data, get_data_dir
+from pair_identification import correlation_matrix, cluster_tickers
+from strategy_development import generate_signals
+from backtesting_engine import Backtester
+
+CONFIDENCE_LEVELS = {0.90: 0, 0.95: 1, 0.99: 2}
+
+def johansen_moments(values, k_ar_diff=1):
+    """Second moments of the Johansen regression variables for every column of a price matrix.
+
+    `values` is an (n, m) matrix without gaps. The variables are the differences dy_t, the
+    levels y_{t-k} and the lagged differences dy_{t-1}..dy_{t-k} (laid out in that order,
+    m columns each), demeaned as `coint_johansen` does with det_order=0. Any basket of
+    these columns can be tested from a sub-matrix of the result, so one matrix product per
+    group serves every basket drawn from it. Returns (moments, number of observations).
+    """
+    n, m = values.shape
+    dy = np.diff(values, axis=0)
+    blocks = [dy[k_ar_diff:], values[1:n - k_ar_diff]]
+    blocks += [dy[k_ar_diff - lag:n - 1 - lag] for lag in range(1, k_ar_diff + 1)]
+    variables = np.hstack(blocks)
+    variables -= variables.mean(axis=0)
+    n_obs = len(variables)
+    return variables.T @ variables / n_obs, n_obs
+
+def johansen_baskets(moments, n_obs, baskets, n_assets, k_ar_diff=1):
+    """Johansen trace test for many equally sized baskets at once.
+
+    `moments` comes from `johansen_moments` over `n_assets` columns and `baskets` is a
+    (B, s) array of column indices. Every basket's regressions are solved from its
+    sub-matrices, stacked so NumPy handles all baskets together. Matches
+    `statsmodels.tsa.vector_ar.vecm.coint_johansen(..., 0, k_ar_diff)`.
+    Returns (eigenvalues (B, s) in descending order, trace statistics for rank 0 (B,),
+    leading eigenvectors (B, s)).
+    """
+    baskets = np.asarray(baskets)
+    diffs = baskets
+    levels = baskets + n_assets
+    lags = np.concatenate([baskets + (2 + lag) * n_assets for lag in range(k_ar_diff)], axis=1)
+
+    def block(rows, cols):
+        return moments[rows[:, :, None], cols[:, None, :]]
+
+    # Residual moments of the differences (0) and levels (k) after the lagged differences
+    lag_inverse = np.linalg.pinv(block(lags, lags))
+    on_lags_0 = lag_inverse @ block(lags, diffs)
+    on_lags_k = lag_inverse @ block(lags, levels)
+    s00 = block(diffs, diffs) - block(diffs, lags) @ on_lags_0
+    skk = block(levels, levels) - block(levels, lags) @ on_lags_k
+    sk0 = block(levels, diffs) - block(levels, lags) @ on_lags_0
+
+    # Generalized symmetric eigenproblem sk0 s00^-1 s0k v = lambda skk v, via skk^-1/2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        skk_values, skk_vectors = np.linalg.eigh(skk)
+        inverse_root = (skk_vectors / np.sqrt(skk_values)[:, None, :]) @ np.swapaxes(skk_vectors, 1, 2)
+        target = sk0 @ np.linalg.pinv(s00) @ np.swapaxes(sk0, 1, 2)
+        eigenvalues, vectors = np.linalg.eigh(inverse_root @ target @ inverse_root)
+        eigenvalues = np.clip(eigenvalues[:, ::-1], 0.0, 1.0)
+        leading = (inverse_root @ vectors[:, :, -1:])[:, :, 0]
+        trace_stats = -n_obs * np.log(1 - eigenvalues).sum(axis=1)
+    return eigenvalues, trace_stats, leading
+
+def candidate_baskets(corr, members, basket_size, neighbors=8):
+    """Baskets of `basket_size` tickers built around each member and its closest neighbors.
+
+    Each member is combined only with its `neighbors` most correlated tickers of the same
+    group, which keeps the count at about len(members) * C(neighbors, basket_size - 1)
+    instead of C(len(members), basket_size). Returns a sorted (B, basket_size) index array.
+    """
+    members = np.asarray(members)
+    if len(members) < basket_size:
+        return np.empty((0, basket_size), dtype=np.intp)
+    score = np.nan_to_num(corr[np.ix_(members, members)], nan=-np.inf)
+    np.fill_diagonal(score, -np.inf)
+    k = min(neighbors, len(members) - 1)
+    closest = np.argsort(-score, axis=1)[:, :k]
+
+    baskets = set()
+    for seed in range(len(members)):
+        for others in itertools.combinations(closest[seed], basket_size - 1):
+            baskets.add(tuple(sorted((seed,) + others)))
+    if not baskets:
+        return np.empty((0, basket_size), dtype=np.intp)
+    return np.array(sorted(baskets), dtype=np.intp)
+
+def find_cointegrated_baskets(data, basket_sizes=(3, 4), groups=None, n_clusters=20, neighbors=8,
+                              confidence=0.95, k_ar_diff=1, min_obs=250, min_coverage=0.9,
+                              return_stats=False):
+    """Finds baskets of three or more stocks that are cointegrated, using the Johansen trace test.
+
+    Baskets are only drawn from within a group: `groups` maps tickers to a sector label,
+    otherwise `cluster_tickers` groups them by return correlation. Inside a group each
+    ticker is combined with its `neighbors` most correlated peers (`candidate_baskets`).
+    Every group is tested on the dates where all its tickers have prices; tickers covering
+    less than `min_coverage` of the group's best history are left out, and groups with
+    fewer than `min_obs` common dates are skipped. The moment matrix of a group is computed
+    once and reused by all its baskets (`johansen_moments`).
+
+    Returns a list of (tickers, hedge weights, trace statistic, critical value) for the
+    baskets whose rank-0 trace statistic exceeds the `confidence` critical value, strongest
+    first. The weights are the leading eigenvector scaled so the first ticker has weight 1,
+    so the spread is prices @ weights. With `return_stats=True` a dict of counts and
+    timings is returned too.
+    """
+    start = time.perf_counter()
+    if groups is None:
+        groups = cluster_tickers(data, n_clusters=n_clusters)
+    labels = pd.Series(groups).reindex(data.columns)
+    corr = correlation_matrix(data)
+    prices = data.to_numpy(dtype=float)
+    column = CONFIDENCE_LEVELS[confidence]
+
+    found = []
+    n_tested = 0
+    n_groups = 0
+    for label in labels.dropna().unique():
+        members = np.flatnonzero((labels == label).to_numpy())
+        valid = ~np.isnan(prices[:, members])
+        coverage = valid.sum(axis=0)
+        members = members[coverage >= min_coverage * coverage.max()]
+        if len(members) < min(basket_sizes):
+            continue
+        rows = ~np.isnan(prices[:, members]).any(axis=1)
+        if rows.sum() < min_obs:
+            continue
+        n_groups += 1
+        moments, n_obs = johansen_moments(prices[rows][:, members], k_ar_diff=k_ar_diff)
+
+        for basket_size in basket_sizes:
+            baskets = candidate_baskets(corr, members, basket_size, neighbors=neighbors)
+            if len(baskets) == 0:
+                continue
+            n_tested += len(baskets)
+            _, trace_stats, leading = johansen_baskets(moments, n_obs, baskets, len(members), k_ar_diff)
+            critical_value = c_sjt(basket_size, 0)[column]
+            for k in np.flatnonzero(trace_stats > critical_value):
+                if not np.isfinite(leading[k]).all() or leading[k, 0] == 0:
+                    continue
+                tickers = tuple(data.columns[members[baskets[k]]])
+                found.append((tickers, leading[k] / leading[k, 0], trace_stats[k], critical_value))
+
+    found.sort(key=lambda basket: basket[2] / basket[3], reverse=True)
+    if return_stats:
+        stats = {
+            'groups_tested': n_groups,
+            'baskets_tested': n_tested,
+            'baskets_found': len(found),
+            'seconds': time.perf_counter() - start,
+        }
+        return found, stats
+    return found
+
+def basket_spread(data, tickers, weights):
+    """Spread of a basket (prices @ weights) over the dates on which every ticker has a price."""
+    prices = data[list(tickers)].dropna()
+    return pd.Series(prices.to_numpy() @ np.asarray(weights, dtype=float), index=prices.index, name='spread')
+
+if __name__ == "__main__":
+    data_dir = get_data_dir()
+    file_path = os.path.join(data_dir, "sp500_adj_close.csv")
+    stock_data = load_data(file_path)
+
+    baskets, stats = find_cointegrated_baskets(stock_data, return_stats=True)
+    print(f"Tested {stats['baskets_tested']} baskets in {stats['groups_tested']} groups "
+          f"({stats['seconds']:.1f}s), found {stats['baskets_found']}.")
+    for tickers, weights, trace_stat, critical_value in baskets[:10]:
+        legs = " ".join(f"{weight:+.3f}*{ticker}" for ticker, weight in zip(tickers, weights))
+        print(f"  {legs} (trace {trace_stat:.1f} > {critical_value:.1f})")
+
+    if baskets:
+        tickers, weights, _, _ = baskets[0]
+        signals = generate_signals(basket_spread(stock_data, tickers, weights))
+        backtester = Backtester(initial_capital=100000)
+        portfolio_value = backtester.run_basket_backtest(stock_data, signals, tickers, weights)
+        print(f"\nBacktest of the strongest basket: final value {portfolio_value.iloc[-1]:.2f}, "
+              f"{len(backtester.trades)} trades")
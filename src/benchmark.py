@@ -0,0 +1,191 @@
+import pandas as pd
+import numpy as np
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+
+from utils import load_data, get_data_dir, write_price_csv
+from profiling import RunProfiler
+from pair_identification import find_cointegrated_pairs
+from strategy_development import calculate_hedge_ratio_and_spread, generate_signals
+from backtesting_engine import Backtester
+
+DEFAULT_SCALES = ((50, 1), (200, 5), (500, 10))
+FULL_SCALES = DEFAULT_SCALES + ((1000, 15), (2000, 20))
+
+def synthetic_panel(n_tickers=50, n_years=1, n_pairs=10, seed=0, missing_fraction=0.0, start_date="2010-01-01"):
+    """Generates a reproducible daily price panel with planted cointegrated pairs.
+
+    Every ticker follows a geometric random walk, except that the second ticker of each
+    of the `n_pairs` planted pairs is a scaled copy of the first plus a mean-reverting
+    AR(1) spread, so the two are cointegrated by construction. `missing_fraction` of the
+    tickers start trading at a random later date (NaN before), like late listings.
+    Returns (prices DataFrame, list of planted (asset1, asset2) pairs).
+    """
+    rng = np.random.default_rng(seed)
+    n_bars = int(n_years * 252)
+    dates = pd.bdate_range(start_date, periods=n_bars, name='Date')
+    tickers = [f"S{k:04d}" for k in range(n_tickers)]
+
+    drift = rng.normal(0.0002, 0.0002, n_tickers)
+    volatility = rng.uniform(0.01, 0.03, n_tickers)
+    log_returns = drift + volatility * rng.standard_normal((n_bars, n_tickers))
+    prices = rng.uniform(20, 200, n_tickers) * np.exp(np.cumsum(log_returns, axis=0))
+
+    n_pairs = min(n_pairs, n_tickers // 2)
+    planted_columns = rng.permutation(n_tickers)[:2 * n_pairs].reshape(-1, 2)
+    for leader, follower in planted_columns:
+        # AR(1) spread with a half-life of a few days to a few weeks
+        phi = rng.uniform(0.8, 0.97)
+        shocks = rng.standard_normal(n_bars) * prices[:, leader].std() * 0.02
+        spread = np.zeros(n_bars)
+        for t in range(1, n_bars):
+            spread[t] = phi * spread[t - 1] + shocks[t]
+        beta = rng.uniform(0.5, 2.0)
+        follower_prices = beta * prices[:, leader] + spread
+        # Shift up so the follower stays positive
+        prices[:, follower] = follower_prices - min(follower_prices.min(), 0) + rng.uniform(5, 50)
+
+    n_late = int(missing_fraction * n_tickers)
+    for column in rng.choice(n_tickers, n_late, replace=False):
+        prices[:rng.integers(1, n_bars // 2), column] = np.nan
+
+    panel = pd.DataFrame(prices, index=dates, columns=tickers)
+    planted = [tuple(sorted((tickers[a], tickers[b]))) for a, b in planted_columns]
+    return panel, planted
+
+def benchmark_scale(n_tickers, n_years, n_pairs=10, seed=0, prefilter='auto', n_jobs=1, work_dir=None,
+                    missing_fraction=0.0):
+    """Times every pipeline stage on one synthetic panel and checks screening recall.
+
+    Stages: writing and first loading of the CSV (parse plus price store), loading from
+    the store (including one full read of the memory-mapped prices), screening, signal
+    generation and backtesting of the planted pairs. `missing_fraction` of the tickers
+    list late (see `synthetic_panel`), which exercises the gap handling of every stage.
+    `prefilter='auto'` screens all pairs up to 200 tickers and uses the correlation
+    prefilter above that. The store stays on disk until all stages have run. Returns
+    (list of stage records, recall, screening stats).
+    """
+    if prefilter == 'auto':
+        prefilter = None if n_tickers <= 200 else 'correlation'
+    panel, planted = synthetic_panel(n_tickers, n_years, n_pairs=n_pairs, seed=seed,
+                                     missing_fraction=missing_fraction)
+    profiler = RunProfiler()
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "prices.csv")
+        write_price_csv(panel, csv_path)
+        with profiler.stage('load_csv', items=n_tickers, unit='tickers'):
+            load_data(csv_path)
+        with profiler.stage('load_store', items=n_tickers, unit='tickers'):
+            stock_data = load_data(csv_path)
+            # Opening the store only maps it; reading every price makes the stage time real I/O
+            np.nansum(stock_data.to_numpy(dtype=float))
+
+        with profiler.stage('screening', unit='pairs') as stage:
+            found, stats = find_cointegrated_pairs(stock_data, n_jobs=n_jobs, prefilter=prefilter,
+                                                   return_stats=True)
+            stage.items = stats['pairs_tested']
+        found_pairs = {tuple(sorted(pair[:2])) for pair in found}
+        recall = len(found_pairs.intersection(planted)) / len(planted) if planted else np.nan
+
+        spreads = []
+        for asset1_ticker, asset2_ticker in planted:
+            both = stock_data[[asset1_ticker, asset2_ticker]].dropna()
+            _, spread = calculate_hedge_ratio_and_spread(both[asset1_ticker], both[asset2_ticker])
+            spreads.append(spread)
+        with profiler.stage('signals', items=len(planted), unit='pairs'):
+            signals = [generate_signals(spread) for spread in spreads]
+        with profiler.stage('backtesting', items=len(planted), unit='pairs'):
+            for (asset1_ticker, asset2_ticker), pair_signals in zip(planted, signals):
+                Backtester(initial_capital=100000).run_backtest(stock_data, pair_signals, asset1_ticker,
+                                                                asset2_ticker)
+        del stock_data
+
+    return profiler.report()['stages'], recall, stats
+
+def run_benchmarks(scales=DEFAULT_SCALES, n_pairs=10, seed=0, prefilter='auto', n_jobs=1, repeats=1,
+                   missing_fraction=0.0):
+    """Runs `benchmark_scale` for every (n_tickers, n_years) scale.
+
+    With `repeats > 1` each stage keeps its fastest time. Returns a DataFrame with one row
+    per scale and stage.
+    """
+    rows = []
+    for n_tickers, n_years in scales:
+        best = {}
+        for _ in range(repeats):
+            stages, recall, stats = benchmark_scale(n_tickers, n_years, n_pairs=n_pairs, seed=seed,
+                                                    prefilter=prefilter, n_jobs=n_jobs,
+                                                    missing_fraction=missing_fraction)
+            for record in stages:
+                if record['stage'] not in best or record['wall_seconds'] < best[record['stage']]['wall_seconds']:
+                    best[record['stage']] = record
+        for record in best.values():
+            rows.append({
+                'tickers': n_tickers,
+                'years': n_years,
+                'missing_fraction': missing_fraction,
+                'stage': record['stage'],
+                'seconds': record['wall_seconds'],
+                'items': record.get('items'),
+                'items_per_second': record.get('items_per_second'),
+                'recall': recall,
+                'pairs_found': stats['pairs_found'],
+            })
+        print(f"{n_tickers} tickers x {n_years} years: recall {recall:.0%}, "
+              f"{stats['pairs_found']} pairs found")
+    return pd.DataFrame(rows)
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def save_baseline(results, path):
+    """Saves benchmark results, tagged with the current git commit, as a JSON baseline."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    baseline = {'commit': _git_commit(), 'results': results.to_dict(orient='records')}
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, default=float)
+
+def compare_to_baseline(results, path):
+    """Joins results with a saved baseline. `speedup` > 1 means faster than the baseline."""
+    with open(path) as f:
+        baseline = pd.DataFrame(json.load(f)['results'])
+    # Baselines saved before `missing_fraction` was recorded were all without gaps
+    if 'missing_fraction' not in baseline:
+        baseline['missing_fraction'] = 0.0
+    keys = ['tickers', 'years', 'missing_fraction', 'stage']
+    merged = results.merge(baseline[keys + ['seconds', 'recall']], on=keys, how='left',
+                           suffixes=('', '_baseline'))
+    merged['speedup'] = merged['seconds_baseline'] / merged['seconds']
+    return merged
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic price panels.")
+    parser.add_argument('--full', action='store_true', help="Include the 1000 and 2000 ticker scales")
+    parser.add_argument('--pairs', type=int, default=10, help="Planted cointegrated pairs per panel")
+    parser.add_argument('--repeats', type=int, default=1, help="Runs per scale (fastest time is kept)")
+    parser.add_argument('--jobs', type=int, default=1, help="Processes used for screening")
+    parser.add_argument('--missing', type=float, default=0.0,
+                        help="Fraction of tickers that list late, to benchmark data with gaps")
+    parser.add_argument('--baseline', default=os.path.join(get_data_dir(), "benchmarks", "baseline.json"))
+    parser.add_argument('--save', action='store_true', help="Save the results as the new baseline")
+    args = parser.parse_args()
+
+    results = run_benchmarks(FULL_SCALES if args.full else DEFAULT_SCALES, n_pairs=args.pairs,
+                             n_jobs=args.jobs, repeats=args.repeats, missing_fraction=args.missing)
+    if os.path.exists(args.baseline):
+        print(compare_to_baseline(results, args.baseline).to_string(index=False))
+    else:
+        print(results.to_string(index=False))
+    if args.save:
+        save_baseline(results, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
@@ -0,0 +1,222 @@
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+from statsmodels.tsa.stattools import coint
+from statsmodels.tsa.adfvalues import mackinnonp
+
+from utils import share_array, attach_shared_array
+from alignment import AlignmentIndex
+
+# Same collinearity cut-off that statsmodels.coint uses before running the ADF step
+COLLINEARITY_TOLERANCE = 1 - 100 * np.sqrt(np.finfo(float).eps)
+
+def _lagged_product_sums(dresid, maxlag):
+    """Window-sum tables for the products dx[u] * dx[u - d], for every lag distance d <= `maxlag`.
+
+    The ADF cross-products only ever need sums that drop at most `maxlag` terms at either
+    end of the sample, so each distance keeps its full total plus short head and tail sums.
+    """
+    n_diff, n_series = dresid.shape
+    total = np.empty((maxlag + 1, n_series))
+    head = np.zeros((maxlag + 1, maxlag + 1, n_series))
+    tail = np.zeros((maxlag + 1, maxlag + 1, n_series))
+    for d in range(maxlag + 1):
+        total[d] = np.einsum('tg,tg->g', dresid[d:], dresid[:n_diff - d])
+        head_products = dresid[d:maxlag] * dresid[:maxlag - d]
+        np.cumsum(head_products, axis=0, out=head[d, d + 1:])
+        tail_products = dresid[n_diff - maxlag:][::-1] * dresid[n_diff - maxlag - d:n_diff - d][::-1]
+        np.cumsum(tail_products, axis=0, out=tail[d, 1:])
+    return total, head, tail
+
+def _window_sum(sums, d, start, n_dropped, cols):
+    """Sum of dx[u] * dx[u - d] from u = start, leaving out the last `n_dropped` terms."""
+    total, head, tail = sums
+    return total[d, cols] - head[d, start, cols] - tail[d, n_dropped, cols]
+
+def _adf_moments(resid, dresid, sums, lag, cols):
+    """Cross-product matrices of the ADF regression (no constant) at a given lag.
+
+    The design has the lagged level in column 0 and lagged differences 1..lag after it,
+    over rows t = lag .. n_diff - 1. Returns (X'X, X'y, y'y) for the series in `cols`.
+    """
+    n_diff = dresid.shape[0]
+    level = resid[lag:n_diff, cols]
+    dlevel = dresid[:, cols]
+    xtx = np.empty((level.shape[1], lag + 1, lag + 1))
+    xty = np.empty((level.shape[1], lag + 1))
+    xtx[:, 0, 0] = np.einsum('tg,tg->g', level, level)
+    xty[:, 0] = np.einsum('tg,tg->g', level, dlevel[lag:])
+    for k in range(1, lag + 1):
+        xtx[:, 0, k] = xtx[:, k, 0] = np.einsum('tg,tg->g', level, dlevel[lag - k:n_diff - k])
+        xty[:, k] = _window_sum(sums, k, lag, 0, cols)
+        for m in range(k, lag + 1):
+            xtx[:, k, m] = xtx[:, m, k] = _window_sum(sums, m - k, lag - k, k, cols)
+    yty = _window_sum(sums, 0, lag, 0, cols)
+    return xtx, xty, yty
+
+def adf_tstats(resid):
+    """Computes the ADF t-statistics of many residual series at once.
+
+    Mirrors `adfuller(x, maxlag=None, autolag='aic', regression='n')` column by column.
+    The regressions are solved from cross-products built out of shared prefix sums, and
+    all lag lengths are scored from a single Cholesky factor of the largest design, since
+    the factor of every shorter design is its leading block.
+    """
+    n_rows, n_series = resid.shape
+    maxlag = int(np.ceil(12.0 * np.power(n_rows / 100.0, 1 / 4.0)))
+    maxlag = min(n_rows // 2 - 1, maxlag)
+    if maxlag < 0:
+        raise ValueError("sample size is too short to run the ADF regression")
+    dresid = np.diff(resid, axis=0)
+    sums = _lagged_product_sums(dresid, maxlag)
+
+    # Lag selection on a common sample, as in statsmodels' _autolag
+    xtx, xty, yty = _adf_moments(resid, dresid, sums, maxlag, slice(None))
+    chol = np.linalg.cholesky(xtx)
+    z = np.linalg.solve(chol, xty[..., None])[..., 0]
+    ssr = yty[:, None] - np.cumsum(z ** 2, axis=1)
+    n_obs = dresid.shape[0] - maxlag
+    aic = n_obs * np.log(ssr) + 2 * np.arange(1, maxlag + 2)
+    bestlag = np.argmin(aic, axis=1)
+
+    # Re-run the regression at the selected lag on its full sample
+    tstats = np.empty(n_series)
+    for lag in np.unique(bestlag):
+        cols = np.flatnonzero(bestlag == lag)
+        xtx, xty, yty = _adf_moments(resid, dresid, sums, lag, cols)
+        xtx_inv = np.linalg.inv(xtx)
+        params = np.einsum('gjk,gk->gj', xtx_inv, xty)
+        ssr = yty - np.einsum('gk,gk->g', params, xty)
+        sigma2 = ssr / (dresid.shape[0] - lag - lag - 1)
+        tstats[cols] = params[:, 0] / np.sqrt(sigma2 * xtx_inv[:, 0, 0])
+    return tstats
+
+def engle_granger_block(y, x):
+    """Runs the Engle-Granger test of y[:, g] on x[:, g] for every column g.
+
+    Equivalent to calling `statsmodels.tsa.stattools.coint` per column with its defaults
+    and returns (t-statistics, p-values).
+    """
+    x_centered = x - x.mean(axis=0)
+    y_centered = y - y.mean(axis=0)
+    sxx = np.einsum('tg,tg->g', x_centered, x_centered)
+    syy = np.einsum('tg,tg->g', y_centered, y_centered)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = np.einsum('tg,tg->g', x_centered, y_centered) / sxx
+        resid = y_centered - beta * x_centered
+        rsquared = 1 - np.einsum('tg,tg->g', resid, resid) / syy
+
+    tstats = np.full(y.shape[1], np.nan)
+    tstats[rsquared >= COLLINEARITY_TOLERANCE] = -np.inf
+    # Constant residuals make the ADF regression undefined (statsmodels raises)
+    testable = (rsquared < COLLINEARITY_TOLERANCE) & (np.ptp(resid, axis=0) > 0)
+    if testable.any():
+        try:
+            # Near the minimum sample size the longest lag can fit exactly; such
+            # degenerate regressions come out as NaN rather than a spurious statistic
+            with np.errstate(divide='ignore', invalid='ignore'):
+                tstats[testable] = adf_tstats(resid[:, testable])
+        except np.linalg.LinAlgError:
+            # Fall back to the reference implementation for ill-conditioned blocks
+            for g in np.flatnonzero(testable):
+                tstats[g] = coint(y[:, g], x[:, g])[0]
+
+    p_values = np.array([mackinnonp(stat, regression='c', N=2) if not np.isnan(stat) else np.nan
+                         for stat in tstats])
+    return tstats, p_values
+
+def _test_groups(prices, pairs, positions, group_ids, group_rows, p_values, min_obs, block_size):
+    """Tests the pairs at `positions` group by group, each on its group's rows.
+
+    `group_ids` labels every position and `group_rows(g)` returns the rows of group g, as
+    a slice or an index array. Results are written into `p_values`.
+    """
+    order = np.argsort(group_ids, kind='stable')
+    bounds = np.flatnonzero(np.diff(group_ids[order])) + 1
+    for group in np.split(order, bounds):
+        rows = group_rows(group_ids[group[0]])
+        block_prices = prices[rows]
+        if len(block_prices) < min_obs:
+            continue
+        members = positions[group]
+        for start in range(0, len(members), block_size):
+            block = members[start:start + block_size]
+            y = block_prices[:, pairs[block, 0]]
+            x = block_prices[:, pairs[block, 1]]
+            p_values[block] = engle_granger_block(y, x)[1]
+
+def engle_granger_pvalues(prices, pairs, min_obs=20, block_size=64, alignment=None):
+    """Computes Engle-Granger p-values for (i, j) column pairs of a price matrix.
+
+    `prices` is a (dates x tickers) float array with NaN for missing bars. Each pair is
+    tested over the dates where both columns are valid. Pairs sharing the same valid dates
+    are batched together; pairs with fewer than `min_obs` common dates get NaN.
+    The common dates come from an `AlignmentIndex` (built here unless one is passed): for
+    tickers without gaps they are a row range found in O(1) and sliced without copying,
+    and only the remaining pairs are keyed by their packed common-validity mask.
+    """
+    prices = np.asarray(prices, dtype=float)
+    pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+    p_values = np.full(len(pairs), np.nan)
+    if len(pairs) == 0:
+        return p_values
+    if alignment is None:
+        alignment = AlignmentIndex.from_prices(prices)
+    contiguous = alignment.is_contiguous(pairs[:, 0], pairs[:, 1])
+
+    positions = np.flatnonzero(contiguous)
+    if len(positions):
+        lo, hi = alignment.common_range(pairs[positions, 0], pairs[positions, 1])
+        ranges, group_ids = np.unique(np.column_stack((lo, hi)), axis=0, return_inverse=True)
+        _test_groups(prices, pairs, positions, group_ids.ravel(), lambda g: slice(*ranges[g]), p_values,
+                     min_obs, block_size)
+
+    positions = np.flatnonzero(~contiguous)
+    if len(positions):
+        # Key the other pairs by their packed common-validity mask, a few thousand at a time
+        bits = alignment.valid_bits
+        packed = np.empty((len(positions), bits.shape[1]), dtype=np.uint8)
+        for start in range(0, len(positions), 4096):
+            chunk = pairs[positions[start:start + 4096]]
+            packed[start:start + 4096] = bits[chunk[:, 0]] & bits[chunk[:, 1]]
+        keys, group_ids = np.unique(packed, axis=0, return_inverse=True)
+        _test_groups(prices, pairs, positions, group_ids.ravel(),
+                     lambda g: np.flatnonzero(np.unpackbits(keys[g], count=len(prices))), p_values,
+                     min_obs, block_size)
+    return p_values
+
+def _screen_worker(spec, pairs, min_obs, block_size, alignment):
+    """Process-pool entry point: screens a chunk of pairs against the shared price matrix."""
+    shm, prices = attach_shared_array(spec)
+    try:
+        return engle_granger_pvalues(prices, pairs, min_obs=min_obs, block_size=block_size, alignment=alignment)
+    finally:
+        del prices
+        shm.close()
+
+def screen_pairs(prices, pairs, n_jobs=1, min_obs=20, block_size=64, alignment=None):
+    """Computes Engle-Granger p-values for many pairs, optionally over a process pool.
+
+    With `n_jobs > 1` the price matrix is placed in shared memory once and every worker
+    screens a contiguous chunk of the pair list. `n_jobs=-1` uses all available cores.
+    The `AlignmentIndex` is built once here (unless passed in) and shared by all workers.
+    """
+    pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+    if alignment is None:
+        alignment = AlignmentIndex.from_prices(np.asarray(prices, dtype=float))
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs <= 1 or len(pairs) < 2 * block_size:
+        return engle_granger_pvalues(prices, pairs, min_obs=min_obs, block_size=block_size, alignment=alignment)
+
+    chunks = np.array_split(pairs, min(len(pairs), n_jobs * 4))
+    shm, spec = share_array(np.asarray(prices, dtype=float))
+    try:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = executor.map(_screen_worker, [spec] * len(chunks), chunks,
+                                   [min_obs] * len(chunks), [block_size] * len(chunks),
+                                   [alignment] * len(chunks))
+            return np.concatenate(list(results))
+    finally:
+        shm.close()
+        shm.unlink()
@@ -1,7 +1,14 @@
 import yfinance as yf
 import pandas as pd
+import threading
 import time
 import os
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utils import write_price_csv
+from price_store import PriceStore, write_price_store
+from bar_frequency import bar_timedelta
 
 def get_sp500_tickers():
     """Fetches S&P 500 tickers from Wikipedia."""
@@ -13,28 +20,118 @@ def get_sp500_tickers():
     tickers = [ticker.replace('.', '-') for ticker in tickers]
     return tickers
 
-def download_historical_data(tickers, start_date, end_date):
-    """Downloads historical daily price data for a list of tickers."""
-    all_data = []
+class TokenBucket:
+    """Thread-safe token-bucket rate limiter.
+
+    Allows bursts of up to `capacity` calls and `rate` calls per second on average.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available, then takes it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def fetch_yahoo(ticker, start_date, end_date, interval='1d'):
+    """Fetches adjusted close prices for one ticker from Yahoo Finance.
+
+    `interval` is a yfinance bar size ('1m', '5m', '1h', '1d', ...); Yahoo only serves
+    recent history for intraday bars. Returns a Series named after the ticker, indexed by
+    (timezone-naive) date, or by bar timestamp for intraday bars; it is empty when Yahoo
+    has no bars in the range. `end_date` is exclusive.
+    """
+    data = yf.Ticker(ticker).history(start=start_date, end=end_date, interval=interval, auto_adjust=True)
+    if data.empty:
+        return pd.Series(dtype=float, name=ticker)
+    # 'Close' is the adjusted close price with auto_adjust=True
+    closes = data['Close'].rename(ticker)
+    if closes.index.tz is not None:
+        closes.index = closes.index.tz_localize(None)
+    if bar_timedelta(interval) >= pd.Timedelta(days=1):
+        closes.index = closes.index.normalize()
+    closes.index = closes.index.rename('Date')
+    return closes
+
+def _fetch_with_retry(fetch_func, ticker, start_date, end_date, limiter, max_retries, backoff):
+    """Calls `fetch_func` under the rate limiter, retrying with exponential backoff."""
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        try:
+            return fetch_func(ticker, start_date, end_date)
+        except Exception:
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+def fetch_many(tickers, start_dates, end_date, fetch_func=None, max_workers=8, requests_per_second=2.0,
+               max_retries=3, backoff=1.0):
+    """Fetches price series for many tickers over a bounded thread pool.
+
+    `start_dates` is a single date or a dict of per-ticker start dates. `fetch_func(ticker,
+    start, end)` must return a price Series and defaults to `fetch_yahoo`; pass a local fake
+    to run without network access. Requests are rate-limited by a shared token bucket and
+    each ticker is retried `max_retries` times. Returns ({ticker: Series}, failed_tickers).
+    """
+    fetch_func = fetch_func or fetch_yahoo
+    limiter = TokenBucket(requests_per_second)
+    if not isinstance(start_dates, dict):
+        start_dates = dict.fromkeys(tickers, start_dates)
+
+    results = {}
     failed_tickers = []
-    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_fetch_with_retry, fetch_func, ticker, start_dates[ticker], end_date,
+                            limiter, max_retries, backoff): ticker
+            for ticker in tickers
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            ticker = futures[future]
+            try:
+                results[ticker] = future.result()
+                if not results[ticker].empty:
+                    print(f"({done}/{len(tickers)}) Successfully downloaded {ticker}")
+            except Exception:
+                failed_tickers.append(ticker)
+
+    # Report failures in the order the tickers were requested
+    failed_tickers.sort(key=list(tickers).index)
+    return results, failed_tickers
+
+def download_historical_data(tickers, start_date, end_date, fetch_func=None, max_workers=8,
+                             requests_per_second=2.0, max_retries=3, interval='1d'):
+    """Downloads historical price data for a list of tickers, daily bars unless `interval` says otherwise."""
     print("Starting data download...")
-    for i, ticker in enumerate(tickers):
-        try:
-            data = yf.download(ticker, start=start_date, end=end_date, progress=False, auto_adjust=True)
-            
-            if data.empty:
-                raise ValueError("No data downloaded for ticker")
-
-            # 'Close' is the adjusted close price with auto_adjust=True
-            data.rename(columns={'Close': ticker}, inplace=True)
-            all_data.append(data[[ticker]])
-            print(f"({i+1}/{len(tickers)}) Successfully downloaded {ticker}")
-            
-            time.sleep(0.5) # Pause to avoid overwhelming the API
-
-        except Exception as e:
+    fetch_func = fetch_func or partial(fetch_yahoo, interval=interval)
+    results, failed_tickers = fetch_many(tickers, start_date, end_date, fetch_func=fetch_func,
+                                         max_workers=max_workers,
+                                         requests_per_second=requests_per_second,
+                                         max_retries=max_retries)
+
+    all_data = []
+    for ticker in tickers:
+        if ticker not in results:
+            continue
+        if results[ticker].empty:
+            # No data downloaded for ticker
             failed_tickers.append(ticker)
+            continue
+        all_data.append(results[ticker].rename(ticker))
+    failed_tickers.sort(key=list(tickers).index)
 
     if not all_data:
         return pd.DataFrame(), failed_tickers
@@ -42,15 +139,55 @@ def download_historical_data(tickers, start_date, end_date):
     full_df = pd.concat(all_data, axis=1)
     return full_df, failed_tickers
 
+def update_historical_data(store_path, end_date=None, tickers=None, start_date=None, fetch_func=None,
+                           max_workers=8, requests_per_second=2.0, max_retries=3, interval='1d'):
+    """Appends new bars to a price store instead of downloading the full history again.
+
+    Each ticker is fetched only from the bar after its last stored one (the next day for
+    daily bars, the next `interval` for intraday bars). Tickers not yet in the store are
+    fetched from `start_date` (default: the store's first date). `end_date` is exclusive
+    and defaults to tomorrow. Returns (number of new rows, failed_tickers).
+    """
+    store = PriceStore(store_path)
+    existing = store.load().copy()
+    tickers = list(existing.columns) if tickers is None else list(tickers)
+    end_date = end_date or (pd.Timestamp.today().normalize() + pd.Timedelta(days=1))
+    start_date = start_date or existing.index[0]
+    fetch_func = fetch_func or partial(fetch_yahoo, interval=interval)
+    bar = min(bar_timedelta(interval), pd.Timedelta(days=1))
+
+    start_dates = {}
+    for ticker in tickers:
+        if ticker in existing.columns and existing[ticker].notna().any():
+            start_dates[ticker] = existing[ticker].last_valid_index() + bar
+        else:
+            start_dates[ticker] = pd.Timestamp(start_date)
+    pending = [t for t in tickers if start_dates[t] < pd.Timestamp(end_date)]
+
+    results, failed_tickers = fetch_many(pending, start_dates, end_date, fetch_func=fetch_func,
+                                         max_workers=max_workers,
+                                         requests_per_second=requests_per_second,
+                                         max_retries=max_retries)
+    new_bars = [series.rename(ticker) for ticker, series in results.items() if not series.empty]
+    if not new_bars:
+        return 0, failed_tickers
+
+    updates = pd.concat(new_bars, axis=1)
+    combined = existing.combine_first(updates)
+    combined = combined[list(existing.columns) + [t for t in updates.columns if t not in existing.columns]]
+    combined.index.name = existing.index.name
+    write_price_store(combined, store_path)
+    return len(combined) - len(existing), failed_tickers
+
 
 if __name__ == "__main__":
     tickers = get_sp500_tickers()
     start_date = "2010-01-01"
     end_date = "2024-06-30"
     print(f"Found {len(tickers)} tickers. Downloading historical data from {start_date} to {end_date}...")
-    
+
     adj_close_data, failed_list = download_historical_data(tickers, start_date, end_date)
-    
+
     if not adj_close_data.empty:
         print(f"\nSuccessfully downloaded data for {len(adj_close_data.columns)} tickers.")
         if failed_list:
@@ -60,7 +197,7 @@ if __name__ == "__main__":
         data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
         os.makedirs(data_dir, exist_ok=True)
         output_path = os.path.join(data_dir, "sp500_adj_close.csv")
-        adj_close_data.to_csv(output_path)
+        write_price_csv(adj_close_data, output_path)
         print(f"Historical data saved to {output_path}")
     else:
         print("\nFailed to download any historical data.")
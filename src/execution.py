@@ -0,0 +1,291 @@
+import pandas as pd
+import numpy as np
+import os
+from collections import namedtuple
+
+from utils import load_data, get_data_dir
+from strategy_development import calculate_hedge_ratio_and_spread, generate_signals
+from backtesting_engine import Backtester, signal_arrays, _next_true
+
+Order = namedtuple('Order', ['bar', 'leg', 'shares', 'reason'])
+Fill = namedtuple('Fill', ['bar', 'leg', 'shares', 'price', 'cost'])
+
+ENTRY, EXIT = 0, 1
+
+class PerShareCommission:
+    """Broker commission charged per share traded, with a minimum per fill."""
+    name = 'commission'
+
+    def __init__(self, rate=0.005, minimum=1.0):
+        self.rate = rate
+        self.minimum = minimum
+
+    def fill_cost(self, shares, price):
+        return np.where(shares != 0, np.maximum(np.abs(shares) * self.rate, self.minimum), 0.0)
+
+class SpreadSlippage:
+    """Slippage from crossing the bid-ask spread: half the quoted spread is paid on every fill."""
+    name = 'slippage'
+
+    def __init__(self, spread_bps=5.0):
+        self.spread_bps = spread_bps
+
+    def fill_cost(self, shares, price):
+        return np.abs(shares) * price * self.spread_bps / 2 / 10000
+
+class BorrowFee:
+    """Stock-borrow fee on short positions, charged on every bar they are held."""
+    name = 'borrow'
+
+    def __init__(self, annual_rate=0.01, periods_per_year=252):
+        self.annual_rate = annual_rate
+        self.periods_per_year = periods_per_year
+
+    def holding_cost(self, short_value):
+        return short_value * self.annual_rate / self.periods_per_year
+
+class TradeLedger:
+    """Append-only fill ledger stored in a growable NumPy record array."""
+
+    dtype = np.dtype([('bar', np.int64), ('leg', np.int8), ('reason', np.int8), ('shares', np.float64),
+                      ('price', np.float64), ('cost', np.float64)])
+
+    def __init__(self, capacity=64):
+        self.records = np.empty(capacity, dtype=self.dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def record(self, fill, reason):
+        if self.size == len(self.records):
+            self.records = np.resize(self.records, 2 * len(self.records))
+        self.records[self.size] = (fill.bar, fill.leg, reason, fill.shares, fill.price, fill.cost)
+        self.size += 1
+
+    def to_frame(self, index, tickers):
+        """Returns the fills as a DataFrame with dates and tickers instead of positions."""
+        fills = self.records[:self.size]
+        return pd.DataFrame({
+            'date': index[fills['bar']],
+            'ticker': np.asarray(tickers)[fills['leg']],
+            'action': np.where(fills['reason'] == ENTRY, 'entry', 'exit'),
+            'shares': fills['shares'],
+            'price': fills['price'],
+            'cost': fills['cost'],
+        })
+
+class ExecutionHandler:
+    """Fills market orders at the bar's price and charges the fill cost models."""
+
+    def __init__(self, cost_models):
+        self.cost_models = cost_models
+        self.totals = {model.name: 0.0 for model in cost_models}
+
+    def execute(self, order, price):
+        cost = 0.0
+        for model in self.cost_models:
+            model_cost = float(model.fill_cost(order.shares, price))
+            self.totals[model.name] += model_cost
+            cost += model_cost
+        return Fill(order.bar, order.leg, order.shares, price, cost)
+
+class ExecutionBacktester(Backtester):
+    """Pair backtester with commissions, slippage and short borrow fees.
+
+    Follows the `Backtester` rules (half the capital per leg, trades at the close, the
+    bar's value is taken before its orders execute), but every fill goes through an
+    `ExecutionHandler` and is written to `ledger`. Fill costs are paid from capital at
+    the fill; borrow fees accrue on each valid bar a short leg is held and are settled at
+    the exit. `run_backtest` steps from trade to trade on arrays; `event_driven=True`
+    replays the same run bar by bar as market, order and fill events instead.
+    """
+
+    def __init__(self, initial_capital=100000, commission=None, slippage=None, borrow=None):
+        super().__init__(initial_capital)
+        self.cost_models = [model for model in (commission, slippage) if model is not None]
+        self.borrow = borrow
+        self.ledger = TradeLedger()
+        self.costs = {}
+        self.legs = []
+
+    def _entry_orders(self, bar, direction, prices):
+        # Buy the spread on a long entry, otherwise sell it
+        amount_to_invest = self.capital / 2
+        if direction > 0:
+            shares = (amount_to_invest / prices[0], -(amount_to_invest / prices[1]))
+        else:
+            shares = (-(amount_to_invest / prices[0]), amount_to_invest / prices[1])
+        return [Order(bar, leg, shares[leg], ENTRY) for leg in range(2)]
+
+    def _fill(self, handler, orders, prices):
+        cost = 0.0
+        for order in orders:
+            fill = handler.execute(order, prices[order.leg])
+            self.ledger.record(fill, order.reason)
+            cost += fill.cost
+        return cost
+
+    def _short_value(self, shares, prices):
+        """Market value of the short legs for one bar or a block of bars."""
+        value = 0.0
+        for leg in range(2):
+            if shares[leg] < 0:
+                value = value - shares[leg] * prices[..., leg]
+        return value
+
+    def run_backtest(self, stock_data, signals, asset1_ticker, asset2_ticker, event_driven=False):
+        prices = stock_data[[asset1_ticker, asset2_ticker]].to_numpy(dtype=float)
+        flags = signal_arrays(stock_data.index, signals, prices[:, 0], prices[:, 1])
+        handler = ExecutionHandler(self.cost_models)
+        self.ledger = TradeLedger()
+        self.legs = [asset1_ticker, asset2_ticker]
+        run = self._run_events if event_driven else self._run_fast
+        values = run(prices, *flags, handler)
+
+        self.costs = dict(handler.totals)
+        if self.borrow is not None:
+            self.costs[self.borrow.name] = self._borrow_paid
+        self.trades = self._trades_from_ledger(stock_data.index)
+        self.portfolio_value = pd.Series(values, index=stock_data.index, dtype=float)
+        return self.portfolio_value
+
+    def _trades_from_ledger(self, index):
+        fills = self.ledger.records[:len(self.ledger)]
+        first_legs = fills[fills['leg'] == 0]
+        trades = []
+        for fill in first_legs:
+            if fill['reason'] == ENTRY:
+                trades.append([index[fill['bar']], None, 1 if fill['shares'] > 0 else -1])
+            elif trades:
+                trades[-1][1] = index[fill['bar']]
+        return [tuple(trade) for trade in trades]
+
+    def _run_fast(self, prices, long_entry, short_entry, long_exit, short_exit, handler):
+        """Trade-to-trade execution on arrays (see `pair_backtest_kernel`)."""
+        n = len(prices)
+        values = np.empty(n)
+        self._borrow_paid = 0.0
+        if n == 0:
+            return values
+        values[0] = self.capital
+
+        valid = ~np.isnan(prices).any(axis=1)
+        valid[0] = False
+        next_long_entry = _next_true(long_entry & valid)
+        next_entry = _next_true((long_entry | short_entry) & valid)
+        next_long_exit = _next_true(long_exit & valid)
+        next_short_exit = _next_true(short_exit & valid)
+
+        shares = [self.positions.get(ticker, 0) for ticker in self.legs]
+        pos = 1
+        while pos < n:
+            if not self.in_trade:
+                entry = next_entry[pos]
+                values[pos:min(entry + 1, n)] = self.capital
+                if entry == n:
+                    break
+                direction = 1 if next_long_entry[entry] == entry else -1
+                orders = self._entry_orders(entry, direction, prices[entry])
+                shares = [order.shares for order in orders]
+                self.capital -= self._fill(handler, orders, prices[entry])
+                self.in_trade = True
+                pos = entry + 1
+            else:
+                if shares[0] > 0:
+                    exit_bar = next_long_exit[pos]
+                elif shares[0] < 0:
+                    exit_bar = next_short_exit[pos]
+                else:
+                    exit_bar = n
+                stop = min(exit_bar + 1, n)
+                block = prices[pos:stop]
+                segment = self.capital + shares[0] * block[:, 0] + shares[1] * block[:, 1]
+                accrued = 0.0
+                if self.borrow is not None:
+                    fees = np.where(valid[pos:stop], self.borrow.holding_cost(self._short_value(shares, block)), 0.0)
+                    accrued = np.cumsum(fees)
+                    segment = segment - accrued
+                    accrued = float(accrued[-1]) if len(accrued) else 0.0
+                values[pos:stop] = segment
+                # Settle the borrow accrued so far, so capital is net of fees paid
+                self.capital -= accrued
+                self._borrow_paid += accrued
+                if exit_bar == n:
+                    break
+                self.capital += shares[0] * prices[exit_bar, 0] + shares[1] * prices[exit_bar, 1]
+                orders = [Order(exit_bar, leg, -shares[leg], EXIT) for leg in range(2)]
+                self.capital -= self._fill(handler, orders, prices[exit_bar])
+                shares = [0, 0]
+                self.in_trade = False
+                pos = exit_bar + 1
+
+        self.positions = dict(zip(self.legs, shares))
+        carry = np.where(valid, np.arange(n), 0)
+        return values[np.maximum.accumulate(carry)]
+
+    def _run_events(self, prices, long_entry, short_entry, long_exit, short_exit, handler):
+        """Bar-by-bar event loop: mark to market, generate orders from signals, fill them."""
+        n = len(prices)
+        values = np.empty(n)
+        self._borrow_paid = 0.0
+        shares = [self.positions.get(ticker, 0) for ticker in self.legs]
+        accrued = 0.0
+        for bar in range(n):
+            if bar == 0:
+                values[0] = self.capital
+                continue
+            bar_prices = prices[bar]
+            if np.isnan(bar_prices).any():
+                values[bar] = values[bar - 1]
+                continue
+
+            # Market event: accrue borrow and mark the book to market
+            if self.in_trade:
+                if self.borrow is not None:
+                    accrued += self.borrow.holding_cost(self._short_value(shares, bar_prices))
+                values[bar] = self.capital + shares[0] * bar_prices[0] + shares[1] * bar_prices[1] - accrued
+            else:
+                values[bar] = self.capital
+
+            # Signal event -> orders -> fills
+            if not self.in_trade:
+                if long_entry[bar] or short_entry[bar]:
+                    orders = self._entry_orders(bar, 1 if long_entry[bar] else -1, bar_prices)
+                    shares = [order.shares for order in orders]
+                    self.capital -= self._fill(handler, orders, bar_prices)
+                    self.in_trade = True
+            elif (shares[0] > 0 and long_exit[bar]) or (shares[0] < 0 and short_exit[bar]):
+                self.capital -= accrued
+                self._borrow_paid += accrued
+                accrued = 0.0
+                self.capital += shares[0] * bar_prices[0] + shares[1] * bar_prices[1]
+                orders = [Order(bar, leg, -shares[leg], EXIT) for leg in range(2)]
+                self.capital -= self._fill(handler, orders, bar_prices)
+                shares = [0, 0]
+                self.in_trade = False
+
+        # Fees accrued on a position still open at the end are paid as well
+        self.capital -= accrued
+        self._borrow_paid += accrued
+        self.positions = dict(zip(self.legs, shares))
+        return values
+
+if __name__ == "__main__":
+    data_dir = get_data_dir()
+    data_file_path = os.path.join(data_dir, "sp500_adj_close.csv")
+    stock_data = load_data(data_file_path)
+
+    # Demonstrate with a hardcoded pair
+    asset1_ticker, asset2_ticker = "AMZN", "NVDA"
+    both = stock_data[[asset1_ticker, asset2_ticker]].dropna()
+    beta, spread = calculate_hedge_ratio_and_spread(both[asset1_ticker], both[asset2_ticker])
+    signals = generate_signals(spread)
+
+    backtester = ExecutionBacktester(initial_capital=100000, commission=PerShareCommission(),
+                                     slippage=SpreadSlippage(), borrow=BorrowFee())
+    portfolio_value = backtester.run_backtest(stock_data, signals, asset1_ticker, asset2_ticker)
+    print(backtester.ledger.to_frame(stock_data.index, [asset1_ticker, asset2_ticker]).tail())
+    print(f"\nFinal Portfolio Value: {portfolio_value.iloc[-1]:.2f}")
+    for name, cost in backtester.costs.items():
+        print(f"Total {name}: {cost:.2f}")
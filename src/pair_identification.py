@@ -1,43 +1,195 @@
 import pandas as pd
 import numpy as np
-import statsmodels.api as sm
-from statsmodels.tsa.stattools import coint
 import os
+import time
+from scipy.cluster.hierarchy import linkage, fcluster
+from scipy.spatial.distance import squareform
 
 from utils import load_data, get_data_dir
+from cointegration import screen_pairs
+from result_cache import hash_array, make_key
+from alignment import AlignmentIndex
+from price_panel import PricePanel
 
-def find_cointegrated_pairs(data, significance_level=0.05):
-    """Finds cointegrated pairs of stocks using the Engle-Granger test."""
-    n_assets = data.shape[1]
+def _pairwise_moments(values):
+    """Pairwise-complete sums for every pair of columns of a matrix with NaN gaps.
+
+    Returns (n, sx, sxx, sxy) where n[i, j] counts rows valid in both columns, sx[i, j]
+    and sxx[i, j] sum column i (and its square) over those rows, and sxy[i, j] sums the
+    products. All four are built with matrix products in a single pass.
+    """
+    mask = (~np.isnan(values)).astype(float)
+    filled = np.nan_to_num(values)
+    n = mask.T @ mask
+    sx = filled.T @ mask
+    sxx = (filled ** 2).T @ mask
+    sxy = filled.T @ filled
+    return n, sx, sxx, sxy
+
+def _cached_pairwise_moments(values, name, columns, cache):
+    """`_pairwise_moments` that reuses cached sums when rows were only appended since the last call.
+
+    The cached entry remembers how many rows it covers and a hash of them; if those rows
+    are unchanged, only the new rows are summed and added on.
+    """
+    if cache is None:
+        return _pairwise_moments(values)
+    key = make_key(name, columns)
+    cached = cache.get(key)
+    if cached is not None:
+        n_rows, prefix_hash, moments = cached
+        if n_rows == len(values) and hash_array(values) == prefix_hash:
+            return moments
+        if n_rows < len(values) and hash_array(values[:n_rows]) == prefix_hash:
+            moments = tuple(old + new for old, new in zip(moments, _pairwise_moments(values[n_rows:])))
+            cache.put(key, (len(values), hash_array(values), moments))
+            return moments
+    moments = _pairwise_moments(values)
+    cache.put(key, (len(values), hash_array(values), moments))
+    return moments
+
+def correlation_matrix(data, min_obs=20, cache=None):
+    """Pairwise-complete correlation of daily log returns for every pair of tickers."""
+    returns = np.diff(np.log(data.to_numpy(dtype=float)), axis=0)
+    n, sx, sxx, sxy = _cached_pairwise_moments(returns, 'return_moments', data.columns, cache)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = n * sxy - sx * sx.T
+        corr = cov / np.sqrt((n * sxx - sx ** 2) * (n * sxx.T - sx.T ** 2))
+    corr[n < min_obs] = np.nan
+    return corr
+
+def distance_matrix(data, min_obs=20, cache=None):
+    """Mean squared distance between normalized price paths (the SSD method) for every pair.
+
+    Each ticker is rescaled to start at 1.0 on its first valid bar. Lower is closer.
+    """
+    prices = data.to_numpy(dtype=float)
+    first_valid = prices[np.argmax(~np.isnan(prices), axis=0), np.arange(prices.shape[1])]
+    normalized = prices / first_valid
+    n, sx, sxx, sxy = _cached_pairwise_moments(normalized, 'distance_moments', data.columns, cache)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distance = (sxx + sxx.T - 2 * sxy) / n
+    distance[n < min_obs] = np.nan
+    return distance
+
+def cluster_tickers(data, n_clusters=20):
+    """Groups tickers by hierarchical clustering on return correlation. Returns a label per ticker."""
+    corr = np.nan_to_num(correlation_matrix(data), nan=0.0)
+    distance = np.clip(1.0 - corr, 0.0, 2.0)
+    np.fill_diagonal(distance, 0.0)
+    tree = linkage(squareform(distance, checks=False), method='average')
+    labels = fcluster(tree, t=n_clusters, criterion='maxclust')
+    return pd.Series(labels, index=data.columns)
+
+def prefilter_pairs(data, method='correlation', top_k=20, groups=None, cache=None):
+    """Selects candidate pairs for the cointegration test with a cheap vectorized score.
+
+    `method` is 'correlation' (highest return correlation first) or 'distance' (smallest
+    SSD between normalized prices first). Each ticker keeps its `top_k` best partners.
+    `groups` optionally maps tickers to a sector or cluster label (see `cluster_tickers`);
+    only pairs within the same group are kept. Returns an (n, 2) array of column indices
+    (i < j), sorted in the same order as the full pair scan. With a `ResultCache`, the
+    pairwise sums behind the scores are extended with new bars instead of recomputed.
+    """
+    if method == 'correlation':
+        score = -correlation_matrix(data, cache=cache)
+    elif method == 'distance':
+        score = distance_matrix(data, cache=cache)
+    else:
+        raise ValueError(f"Unknown prefilter method: {method}")
+
+    score[np.isnan(score)] = np.inf
+    np.fill_diagonal(score, np.inf)
+    if groups is not None:
+        labels = pd.Series(groups).reindex(data.columns).to_numpy()
+        same_group = labels[:, None] == labels[None, :]
+        score[~same_group] = np.inf
+
+    n_assets = score.shape[0]
+    k = min(top_k, n_assets - 1)
+    if k <= 0:
+        return np.empty((0, 2), dtype=np.intp)
+    partners = np.argpartition(score, k - 1, axis=1)[:, :k]
+    rows = np.repeat(np.arange(n_assets), k)
+    cols = partners.ravel()
+    keep = np.isfinite(score[rows, cols])
+    candidates = np.column_stack((np.minimum(rows, cols), np.maximum(rows, cols)))[keep]
+    return np.unique(candidates, axis=0)
+
+def _screen_pairs_cached(prices, pair_index, n_jobs, min_obs, cache, alignment):
+    """`screen_pairs` that reuses cached p-values of pairs whose two price columns are unchanged.
+
+    A pair's test only depends on its two columns, so results are keyed by the pair of
+    column hashes. Trailing missing bars are left out of the hash, so tickers without new
+    bars keep their cached results when rows are appended for others.
+    """
+    column_hashes = [hash_array(prices[:alignment.stop[k], k]) for k in range(prices.shape[1])]
+    key = make_key('pair_pvalues', min_obs=min_obs)
+    known = cache.get(key) or {}
+    pair_keys = [(column_hashes[i], column_hashes[j]) for i, j in pair_index]
+
+    missing = np.array([pair_key not in known for pair_key in pair_keys], dtype=bool)
+    p_values = np.array([known.get(pair_key, np.nan) for pair_key in pair_keys], dtype=float)
+    if missing.any():
+        p_values[missing] = screen_pairs(prices, pair_index[missing], n_jobs=n_jobs, min_obs=min_obs,
+                                         alignment=alignment)
+
+    # Keep results for the current columns only, so the entry does not grow without bound
+    current = set(column_hashes)
+    known = {pair_key: p for pair_key, p in known.items() if pair_key[0] in current and pair_key[1] in current}
+    known.update(zip(pair_keys, p_values))
+    cache.put(key, known)
+    return p_values, int(missing.sum())
+
+def find_cointegrated_pairs(data, significance_level=0.05, n_jobs=1, prefilter=None, top_k=20,
+                            groups=None, return_stats=False, cache=None):
+    """Finds cointegrated pairs of stocks using the Engle-Granger test.
+
+    All pairs are screened together on the price matrix by the batched test in
+    `cointegration`; `n_jobs` spreads the pairs over a process pool. Setting `prefilter`
+    to 'correlation' or 'distance' first prunes the pair list with `prefilter_pairs`.
+    With `return_stats=True` a dict with pruning counts and stage timings is returned too.
+    Passing a `ResultCache` reuses earlier results for pairs whose prices did not change.
+    """
     keys = data.columns
+    prices = data.to_numpy(dtype=float)
+    # Common dates of every pair come from one validity index (a PricePanel carries its own)
+    alignment = data.alignment if isinstance(data, PricePanel) else AlignmentIndex.from_prices(prices)
+    n_total = len(keys) * (len(keys) - 1) // 2
+
+    start = time.perf_counter()
+    if prefilter is None:
+        # Every unique pair of assets, in the order (0, 1), (0, 2), ..., (1, 2), ...
+        pair_index = np.column_stack(np.triu_indices(len(keys), k=1))
+    else:
+        pair_index = prefilter_pairs(data, method=prefilter, top_k=top_k, groups=groups, cache=cache)
+    prefilter_seconds = time.perf_counter() - start
+
+    # Pairs with fewer than 20 common data points are skipped (p-value NaN)
+    start = time.perf_counter()
+    if cache is None:
+        p_values = screen_pairs(prices, pair_index, n_jobs=n_jobs, min_obs=20, alignment=alignment)
+        n_screened = len(pair_index)
+    else:
+        p_values, n_screened = _screen_pairs_cached(prices, pair_index, n_jobs, 20, cache, alignment)
+    test_seconds = time.perf_counter() - start
+
     pairs = []
-    
-    # Iterate through all unique pairs of assets
-    for i in range(n_assets):
-        for j in range(i + 1, n_assets):
-            asset1 = keys[i]
-            asset2 = keys[j]
-            
-            series1 = data[asset1].dropna()
-            series2 = data[asset2].dropna()
-            
-            # Ensure both series have the same length
-            common_index = series1.index.intersection(series2.index)
-            if len(common_index) == 0:
-                continue
-            
-            series1 = series1.loc[common_index]
-            series2 = series2.loc[common_index]
-            
-            if len(series1) < 20: # Require a minimum number of data points
-                continue
-
-            # Perform the cointegration test
-            score, p_value, _ = coint(series1, series2)
-            
-            if p_value < significance_level:
-                pairs.append((asset1, asset2, p_value))
-                
+    for (i, j), p_value in zip(pair_index, p_values):
+        if p_value < significance_level:
+            pairs.append((keys[i], keys[j], p_value))
+
+    if return_stats:
+        stats = {
+            'pairs_total': n_total,
+            'pairs_tested': len(pair_index),
+            'pairs_pruned': n_total - len(pair_index),
+            'pairs_found': len(pairs),
+            'pairs_from_cache': len(pair_index) - n_screened,
+            'prefilter_seconds': prefilter_seconds,
+            'test_seconds': test_seconds,
+        }
+        return pairs, stats
     return pairs
 
 if __name__ == "__main__":
@@ -0,0 +1,88 @@
+import pandas as pd
+import numpy as np
+import itertools
+import os
+
+from utils import load_data, get_data_dir
+from strategy_development import calculate_hedge_ratio_and_spread
+from backtesting_engine import pair_backtest_kernel
+from performance_analysis import performance_matrix
+
+def rolling_zscores(spread, windows):
+    """Computes the rolling z-score of a spread for several window lengths in one pass.
+
+    Rolling sums for every window come from one pair of cumulative sums, so adding windows
+    costs O(n) each. Matches `spread.rolling(window).mean()/.std()` as used by
+    `generate_signals` up to rounding. `spread` must not contain NaN.
+    Returns an array of shape (len(windows), len(spread)).
+    """
+    values = np.asarray(spread, dtype=float)
+    # Centering first keeps the sums of squares small and the variance accurate
+    centered = values - values.mean()
+    sums = np.concatenate(([0.0], np.cumsum(centered)))
+    squares = np.concatenate(([0.0], np.cumsum(centered ** 2)))
+
+    z_scores = np.full((len(windows), len(values)), np.nan)
+    for k, window in enumerate(windows):
+        if window > len(values) or window < 2:
+            continue
+        window_sum = sums[window:] - sums[:-window]
+        window_squares = squares[window:] - squares[:-window]
+        mean = window_sum / window
+        variance = np.maximum((window_squares - window_sum * mean) / (window - 1), 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z_scores[k, window - 1:] = (centered[window - 1:] - mean) / np.sqrt(variance)
+    return z_scores
+
+def sweep_parameters(stock_data, spread, asset1_ticker, asset2_ticker, windows=(20, 40, 60, 90, 120),
+                     entry_zscores=(1.5, 2.0, 2.5), exit_zscores=(0.0, 0.5), initial_capital=100000):
+    """Backtests every (window, entry, exit) combination of the z-score strategy for one pair.
+
+    All rolling statistics are computed once by `rolling_zscores`, and every threshold
+    combination reuses the same z-scores and price arrays through the array backtest
+    kernel, and the metrics of all equity curves are computed together by
+    `performance_matrix`. Returns a DataFrame with one row per configuration and the
+    metrics as columns.
+    """
+    price1 = stock_data[asset1_ticker].to_numpy(dtype=float)
+    price2 = stock_data[asset2_ticker].to_numpy(dtype=float)
+    # Signals live on the spread's dates; map them onto the backtest dates once
+    positions = stock_data.index.get_indexer(spread.index)
+    if (positions < 0).any():
+        raise KeyError("spread dates must be a subset of stock_data dates")
+    z_scores = rolling_zscores(spread, windows)
+
+    configs = list(itertools.product(enumerate(windows), entry_zscores, exit_zscores))
+    equity = np.empty((len(price1), len(configs)))
+    held = np.zeros((len(price1), len(configs)))
+    rows = []
+    for column, ((k, window), entry_zscore, exit_zscore) in enumerate(configs):
+        z_score = z_scores[k]
+        flags = []
+        for flag in (z_score < -entry_zscore, z_score > entry_zscore,
+                     z_score >= exit_zscore, z_score <= exit_zscore):
+            full = np.zeros(len(price1), dtype=bool)
+            full[positions] = flag
+            flags.append(full)
+        equity[:, column], _, trades = pair_backtest_kernel(price1, price2, *flags, initial_capital)
+        for entry, exit_bar, side in trades:
+            held[entry:exit_bar, column] = side
+        rows.append({'window': window, 'entry_zscore': entry_zscore, 'exit_zscore': exit_zscore,
+                     'trades': len(trades)})
+
+    # Metrics for every configuration in one batch over the equity matrix
+    metrics = performance_matrix(equity, positions=held)
+    return pd.concat([pd.DataFrame(rows), metrics.reset_index(drop=True)], axis=1)
+
+if __name__ == "__main__":
+    data_dir = get_data_dir()
+    data_file_path = os.path.join(data_dir, "sp500_adj_close.csv")
+    stock_data = load_data(data_file_path)
+
+    # Demonstrate with a hardcoded pair
+    asset1_ticker, asset2_ticker = "AMZN", "NVDA"
+    both = stock_data[[asset1_ticker, asset2_ticker]].dropna()
+    beta, spread = calculate_hedge_ratio_and_spread(both[asset1_ticker], both[asset2_ticker])
+
+    results = sweep_parameters(stock_data, spread, asset1_ticker, asset2_ticker)
+    print(results.sort_values('sharpe_ratio', ascending=False).to_string(index=False))
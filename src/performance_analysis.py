@@ -1,30 +1,35 @@
 import pandas as pd
 import numpy as np
 import os
+import warnings
 
 from utils import get_data_dir
 
 def calculate_returns(portfolio_value):
-    """Calculates daily returns from a portfolio value series."""
+    """Calculates per-bar returns from a portfolio value series."""
     returns = portfolio_value.pct_change().dropna()
     return returns
 
-def calculate_sharpe_ratio(returns, risk_free_rate=0.0):
-    """Calculates the annualized Sharpe Ratio."""
-    excess_returns = returns - risk_free_rate / 252
-    sharpe_ratio = np.mean(excess_returns) / np.std(excess_returns) * np.sqrt(252)
+def calculate_sharpe_ratio(returns, risk_free_rate=0.0, periods_per_year=252):
+    """Calculates the annualized Sharpe Ratio.
+
+    `periods_per_year` is the number of bars in a year (252 for daily bars; see
+    `bar_frequency.periods_per_year` for other frequencies).
+    """
+    excess_returns = returns - risk_free_rate / periods_per_year
+    sharpe_ratio = np.mean(excess_returns) / np.std(excess_returns) * np.sqrt(periods_per_year)
     return sharpe_ratio
 
-def calculate_sortino_ratio(returns, risk_free_rate=0.0):
+def calculate_sortino_ratio(returns, risk_free_rate=0.0, periods_per_year=252):
     """Calculates the annualized Sortino Ratio."""
-    excess_returns = returns - risk_free_rate / 252
+    excess_returns = returns - risk_free_rate / periods_per_year
     downside_returns = excess_returns[excess_returns < 0]
     downside_deviation = np.std(downside_returns)
     
     if downside_deviation == 0:
         return np.nan
         
-    sortino_ratio = np.mean(excess_returns) / downside_deviation * np.sqrt(252)
+    sortino_ratio = np.mean(excess_returns) / downside_deviation * np.sqrt(periods_per_year)
     return sortino_ratio
 
 def calculate_max_drawdown(portfolio_value):
@@ -34,11 +39,119 @@ def calculate_max_drawdown(portfolio_value):
     max_drawdown = drawdown.min()
     return max_drawdown
 
-def calculate_volatility(returns):
+def calculate_volatility(returns, periods_per_year=252):
     """Calculates the annualized volatility."""
-    volatility = np.std(returns) * np.sqrt(252)
+    volatility = np.std(returns) * np.sqrt(periods_per_year)
     return volatility
 
+def _as_matrix(equity_curves):
+    """Returns (values, index, strategy names) for a DataFrame, Series or array of curves."""
+    if isinstance(equity_curves, pd.Series):
+        equity_curves = equity_curves.to_frame()
+    if isinstance(equity_curves, pd.DataFrame):
+        return equity_curves.to_numpy(dtype=float), equity_curves.index, equity_curves.columns
+    values = np.asarray(equity_curves, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    return values, pd.RangeIndex(len(values)), pd.RangeIndex(values.shape[1], name='strategy')
+
+def rolling_sharpe_matrix(returns, window=63, risk_free_rate=0.0, periods_per_year=252):
+    """Annualized Sharpe ratio over a trailing window for every column of a return matrix.
+
+    Window means and variances come from cumulative sums, so the cost does not depend on
+    the window length. Rows before the first full window, and windows with missing
+    returns, are NaN.
+    """
+    excess = np.asarray(returns, dtype=float) - risk_free_rate / periods_per_year
+    result = np.full(excess.shape, np.nan)
+    if window > len(excess) or window < 2:
+        return result
+    valid = ~np.isnan(excess)
+    # Centering keeps the sums of squares small and the variance accurate
+    offset = np.where(valid, excess, 0.0).sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+    centered = np.where(valid, excess - offset, 0.0)
+    zeros = np.zeros((1, excess.shape[1]))
+    sums = np.concatenate((zeros, np.cumsum(centered, axis=0)))
+    squares = np.concatenate((zeros, np.cumsum(centered ** 2, axis=0)))
+    counts = np.concatenate((zeros, np.cumsum(valid, axis=0)))
+
+    window_mean = (sums[window:] - sums[:-window]) / window
+    variance = np.maximum((squares[window:] - squares[:-window]) / window - window_mean ** 2, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = (window_mean + offset) / np.sqrt(variance) * np.sqrt(periods_per_year)
+    result[window - 1:] = np.where(counts[window:] - counts[:-window] == window, sharpe, np.nan)
+    return result
+
+def drawdown_matrix(values):
+    """Drawdown from the running peak and bars since that peak, for every column."""
+    peak = np.fmax.accumulate(values, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = (values - peak) / peak
+    bars = np.arange(len(values))[:, None]
+    at_peak = ~(drawdown < 0)
+    last_peak = np.maximum.accumulate(np.where(at_peak, bars, 0), axis=0)
+    return drawdown, bars - last_peak
+
+def performance_matrix(equity_curves, risk_free_rate=0.0, periods_per_year=252, rolling_window=63,
+                       positions=None):
+    """Computes all performance metrics for many equity curves at once.
+
+    `equity_curves` has one column per strategy (DataFrame, Series or 2-D array; columns
+    may end in NaN when curves have different lengths). Every metric is computed for all
+    columns together in one set of array operations, with the same definitions as the
+    single-series functions above. `positions` optionally gives each strategy's position
+    per bar as a fraction of equity (e.g. +1/-1 when fully in a long/short spread); turnover
+    is the annualized sum of absolute position changes and is NaN without it. Hit rate is
+    the share of bars with a non-zero return whose return was positive.
+    Returns a DataFrame with one row per strategy and one column per metric.
+    """
+    values, _, names = _as_matrix(equity_curves)
+    bars = np.arange(len(values))[:, None]
+    columns = np.arange(values.shape[1])
+    # Columns that are all NaN or too short just produce NaN metrics
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        returns = values[1:] / values[:-1] - 1
+        excess = returns - risk_free_rate / periods_per_year
+        n_returns = (~np.isnan(returns)).sum(axis=0)
+        mean = np.nanmean(excess, axis=0)
+        std = np.nanstd(excess, axis=0)
+        downside_deviation = np.nanstd(np.where(excess < 0, excess, np.nan), axis=0)
+
+        last = values[np.where(np.isnan(values), 0, bars).max(axis=0), columns]
+        total_return = last / values[0] - 1
+        annual_return = (1 + total_return) ** (periods_per_year / n_returns) - 1
+
+        drawdown, underwater = drawdown_matrix(values)
+        max_drawdown = np.nanmin(drawdown, axis=0)
+        rolling = rolling_sharpe_matrix(returns, window=rolling_window, risk_free_rate=risk_free_rate,
+                                        periods_per_year=periods_per_year)
+        gains = (returns > 0).sum(axis=0)
+        losses = (returns < 0).sum(axis=0)
+
+        if positions is not None:
+            held = np.asarray(positions, dtype=float).reshape(values.shape)
+            changes = np.abs(np.diff(held, axis=0, prepend=0.0))
+            turnover = np.nansum(changes, axis=0) * periods_per_year / n_returns
+        else:
+            turnover = np.full(len(columns), np.nan)
+
+        return pd.DataFrame({
+            'total_return': total_return,
+            'annual_return': annual_return,
+            'volatility': std * np.sqrt(periods_per_year),
+            'sharpe_ratio': mean / std * np.sqrt(periods_per_year),
+            'sortino_ratio': np.where(downside_deviation == 0, np.nan,
+                                      mean / downside_deviation * np.sqrt(periods_per_year)),
+            'max_drawdown': max_drawdown,
+            'calmar_ratio': np.where(max_drawdown < 0, annual_return / -max_drawdown, np.nan),
+            'max_drawdown_duration': underwater.max(axis=0),
+            'rolling_sharpe_min': np.nanmin(rolling, axis=0),
+            'rolling_sharpe_median': np.nanmedian(rolling, axis=0),
+            'hit_rate': gains / (gains + losses),
+            'turnover': turnover,
+        }, index=names)
+
 if __name__ == "__main__":
     # Load portfolio value data for demonstration
     data_dir = get_data_dir()
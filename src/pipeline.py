@@ -0,0 +1,326 @@
+import os
+
+# Stages import their heavy dependencies (pandas, statsmodels, yfinance) when they run,
+# so a command only pays for what it uses: `report` loads neither statsmodels nor yfinance.
+
+ARTIFACTS_DIR = "artifacts"
+PAIRS_FILE = "pairs.npz"
+SIGNALS_FILE = "signals.npz"
+PORTFOLIO_FILE = "portfolio.npz"
+
+# Bit of each signal flag in the signals artifact
+SIGNAL_BITS = {'long_entry': 1, 'short_entry': 2, 'long_exit': 4, 'short_exit': 8}
+
+DEFAULT_PAIR = ("AMZN", "NVDA")
+
+def artifact_path(data_dir, name):
+    """Path of an intermediate artifact in `data_dir`/artifacts, creating the directory."""
+    directory = os.path.join(data_dir, ARTIFACTS_DIR)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, name)
+
+def _require(path, command):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found; run the '{command}' command first")
+    return path
+
+def _save_npz(path, **arrays):
+    """Writes an .npz atomically, so an interrupted stage never leaves a truncated artifact."""
+    import numpy as np
+
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+def save_pairs(path, pairs):
+    """Saves (asset1, asset2, p_value) tuples as string and float arrays."""
+    import numpy as np
+
+    _save_npz(path, asset1=np.array([str(pair[0]) for pair in pairs]),
+              asset2=np.array([str(pair[1]) for pair in pairs]),
+              p_value=np.array([pair[2] if len(pair) > 2 else np.nan for pair in pairs], dtype=float))
+
+def load_pairs(path):
+    """Loads the pairs saved by `save_pairs` as a list of (asset1, asset2, p_value)."""
+    import numpy as np
+
+    with np.load(path) as saved:
+        return list(zip(saved['asset1'].tolist(), saved['asset2'].tolist(), saved['p_value'].tolist()))
+
+def download_stage(data_file_path, profiler, start_date="2010-01-01", end_date="2025-06-30", interval='1d'):
+    """Downloads S&P 500 prices to `data_file_path`. Returns False if nothing could be downloaded."""
+    from data_acquisition import download_historical_data, get_sp500_tickers
+    from utils import write_price_csv
+
+    tickers = get_sp500_tickers()
+    print(f"Found {len(tickers)} tickers. Downloading historical data from {start_date} to {end_date}...")
+
+    with profiler.stage('download', items=len(tickers), unit='tickers'):
+        adj_close_data, failed_list = download_historical_data(tickers, start_date, end_date, interval=interval)
+
+    if adj_close_data.empty:
+        print("\nFailed to download any historical data. Exiting.")
+        return False
+    print(f"\nSuccessfully downloaded data for {len(adj_close_data.columns)} tickers.")
+    if failed_list:
+        print(f"Failed to download data for {len(failed_list)} tickers: {failed_list}")
+
+    os.makedirs(os.path.dirname(data_file_path), exist_ok=True)
+    write_price_csv(adj_close_data, data_file_path)
+    print(f"Historical data saved to {data_file_path}")
+    return True
+
+def load_stage(data_file_path, profiler):
+    """Opens the prices as a memory-mapped `PricePanel`."""
+    from price_panel import PricePanel
+
+    # Prices stay memory-mapped in a columnar panel instead of a full DataFrame copy
+    with profiler.stage('load_data', unit='tickers') as stage:
+        stock_data = PricePanel.open(data_file_path)
+        stage.items = stock_data.shape[1]
+    print("Data loaded successfully.")
+    return stock_data
+
+def screen_stage(stock_data, data_dir, profiler, cache=None, prefilter=None):
+    """Screens all pairs for cointegration and saves them to the pairs artifact.
+
+    Falls back to `DEFAULT_PAIR` for demonstration when no pair is found. Returns the pairs.
+    """
+    from pair_identification import find_cointegrated_pairs
+
+    print("\nFinding cointegrated pairs...")
+    with profiler.stage('screening', unit='pairs') as stage:
+        pairs, screening_stats = find_cointegrated_pairs(stock_data, cache=cache, prefilter=prefilter,
+                                                         return_stats=True)
+        stage.items = screening_stats['pairs_tested']
+
+    if not pairs:
+        print(f"No cointegrated pairs found. Using a default pair for demonstration ({', '.join(DEFAULT_PAIR)}).")
+        pairs = [DEFAULT_PAIR]
+    else:
+        print("\nFound cointegrated pairs (Asset1, Asset2, P-value):")
+        for pair in pairs:
+            print(f"  {pair[0]} - {pair[1]} (p-value: {pair[2]:.4f})")
+    save_pairs(artifact_path(data_dir, PAIRS_FILE), pairs)
+    return pairs
+
+def _pair_signals(stock_data, asset1_ticker, asset2_ticker, rows, entry_zscore, exit_zscore, window, min_obs):
+    """Hedge ratio and signal codes of one pair on its common rows, or None with too little data."""
+    import numpy as np
+    from strategy_development import calculate_hedge_ratio_and_spread, generate_signals
+
+    both = stock_data[[asset1_ticker, asset2_ticker]].iloc[rows]
+    if len(both) < min_obs:
+        return None
+    beta, spread = calculate_hedge_ratio_and_spread(both[asset1_ticker], both[asset2_ticker])
+    signals = generate_signals(spread, entry_zscore=entry_zscore, exit_zscore=exit_zscore, window=window)
+    codes = np.zeros(len(signals), dtype=np.uint8)
+    for column, bit in SIGNAL_BITS.items():
+        codes[signals[column].to_numpy(dtype=bool)] |= bit
+    return beta, codes
+
+def signals_stage(stock_data, data_dir, profiler, pairs=None, entry_zscore=2.0, exit_zscore=0.0, window=60,
+                  min_obs=60, cache=None):
+    """Computes hedge ratios and z-score signals of every pair and saves them to the signals artifact.
+
+    Pairs default to the pairs artifact. Signals are stored on the full date index, one
+    bit-coded uint8 column per pair; pairs with fewer than `min_obs` common bars get a NaN
+    hedge ratio and no signals. With a `ResultCache`, pairs whose prices and parameters
+    are unchanged are read from the cache. An unusable `window` raises before anything
+    is computed or written.
+    """
+    import numpy as np
+    import pandas as pd
+    from alignment import AlignmentIndex
+    from price_panel import PricePanel
+    from result_cache import make_key, MISSING
+    from strategy_development import check_window
+
+    check_window(window, stock_data.index)
+
+    if pairs is None:
+        pairs = load_pairs(_require(artifact_path(data_dir, PAIRS_FILE), 'screen'))
+    pairs = [tuple(pair[:2]) for pair in pairs]
+    if isinstance(stock_data, PricePanel):
+        alignment = stock_data.alignment
+    else:
+        alignment = AlignmentIndex.from_prices(stock_data.to_numpy(dtype=float))
+    positions = {ticker: k for k, ticker in enumerate(stock_data.columns)}
+
+    betas = np.full(len(pairs), np.nan)
+    codes = np.zeros((len(stock_data.index), len(pairs)), dtype=np.uint8)
+    with profiler.stage('signals', items=len(pairs), unit='pairs'):
+        for k, (asset1_ticker, asset2_ticker) in enumerate(pairs):
+            rows = alignment.common_rows(positions[asset1_ticker], positions[asset2_ticker])
+            result = MISSING
+            if cache is not None:
+                key = make_key('pair_signals', stock_data[[asset1_ticker, asset2_ticker]], entry_zscore=entry_zscore,
+                               exit_zscore=exit_zscore, window=str(window), min_obs=min_obs)
+                result = cache.get(key, MISSING)
+            if result is MISSING:
+                result = _pair_signals(stock_data, asset1_ticker, asset2_ticker, rows, entry_zscore, exit_zscore,
+                                       window, min_obs)
+                if cache is not None:
+                    cache.put(key, result)
+            if result is not None:
+                betas[k], codes[rows, k] = result
+
+    _save_npz(artifact_path(data_dir, SIGNALS_FILE),
+              dates=pd.DatetimeIndex(stock_data.index).as_unit('ns').asi8,
+              asset1=np.array([str(pair[0]) for pair in pairs]), asset2=np.array([str(pair[1]) for pair in pairs]),
+              beta=betas, codes=codes, window=np.array(str(window)),
+              zscores=np.array([entry_zscore, exit_zscore]))
+    return pairs, betas, codes
+
+def _pair_curve(price1, price2, codes, capital):
+    """Portfolio values and number of trades of one pair from its price arrays and signal codes."""
+    from backtesting_engine import pair_backtest_kernel
+
+    flags = [(codes & bit) > 0 for bit in SIGNAL_BITS.values()]
+    values, _, trades = pair_backtest_kernel(price1, price2, *flags, capital)
+    return values, len(trades)
+
+def _backtest_worker(prices_spec, codes_spec, i, j, k, capital):
+    """Process-pool entry point: backtests pair k of the shared signal codes on the shared price matrix."""
+    from utils import attach_shared_array
+
+    prices_shm, prices = attach_shared_array(prices_spec)
+    codes_shm, codes = attach_shared_array(codes_spec)
+    try:
+        return _pair_curve(prices[:, i], prices[:, j], codes[:, k], capital)
+    finally:
+        del prices, codes
+        prices_shm.close()
+        codes_shm.close()
+
+def _run_pair_curves(stock_data, pairs, codes, capitals, tasks, n_jobs):
+    """(values, trades) of the pairs at positions `tasks`, over `n_jobs` processes when there are several."""
+    import numpy as np
+
+    n_jobs = (os.cpu_count() or 1) if n_jobs == -1 else n_jobs
+    if n_jobs == 1 or len(tasks) < 2:
+        return [_pair_curve(stock_data[pairs[k][0]].to_numpy(dtype=float),
+                            stock_data[pairs[k][1]].to_numpy(dtype=float), codes[:, k], capitals[k])
+                for k in tasks]
+
+    from concurrent.futures import ProcessPoolExecutor
+    from utils import share_array
+
+    positions = {ticker: col for col, ticker in enumerate(stock_data.columns)}
+    prices_shm, prices_spec = share_array(stock_data.to_numpy(dtype=float))
+    codes_shm, codes_spec = share_array(np.ascontiguousarray(codes))
+    try:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(_backtest_worker, prices_spec, codes_spec, positions[pairs[k][0]],
+                                       positions[pairs[k][1]], k, capitals[k])
+                       for k in tasks]
+            return [future.result() for future in futures]
+    finally:
+        for shm in (prices_shm, codes_shm):
+            shm.close()
+            shm.unlink()
+
+def backtest_stage(stock_data, data_dir, profiler, initial_capital=100000, allocation='equal', n_jobs=1,
+                   cache=None):
+    """Backtests every pair from the signals artifact and combines them into one portfolio.
+
+    Each pair runs through `pair_backtest_kernel` on its saved signals, which gives the
+    same curves as `PortfolioBacktester.run_backtest`; the portfolio is put together by
+    `PortfolioBacktester.combine`. As there, `n_jobs > 1` spreads the pairs over a process
+    pool reading the prices from shared memory, and with a `ResultCache` pairs whose
+    prices, signals and capital are unchanged are read from the cache. Saves the
+    portfolio artifact and `portfolio_value.csv` and returns the backtester.
+    """
+    import numpy as np
+    import pandas as pd
+    from portfolio import PortfolioBacktester, pair_label
+    from result_cache import make_key, MISSING
+
+    with np.load(_require(artifact_path(data_dir, SIGNALS_FILE), 'signals')) as saved:
+        pairs = list(zip(saved['asset1'].tolist(), saved['asset2'].tolist()))
+        betas = saved['beta']
+        codes = saved['codes']
+        if not np.array_equal(saved['dates'], pd.DatetimeIndex(stock_data.index).as_unit('ns').asi8):
+            raise ValueError("Signals were computed on other dates; run the 'signals' command again")
+
+    print(f"\nBacktesting {len(pairs)} pair(s) as one portfolio...")
+    backtester = PortfolioBacktester(initial_capital=initial_capital, allocation=allocation, n_jobs=n_jobs,
+                                     cache=cache)
+    capitals = backtester.allocate(pairs)
+    with profiler.stage('backtesting', items=len(pairs), unit='pairs'):
+        tradable = [k for k in range(len(pairs)) if not np.isnan(betas[k])]
+        curves = {k: MISSING for k in tradable}
+        keys = {}
+        if cache is not None:
+            for k in tradable:
+                keys[k] = make_key('pair_curve', stock_data[list(pairs[k])], codes[:, k], capital=float(capitals[k]))
+                curves[k] = cache.get(keys[k], MISSING)
+        missing = [k for k in tradable if curves[k] is MISSING]
+        for k, curve in zip(missing, _run_pair_curves(stock_data, pairs, codes, capitals, missing, n_jobs)):
+            curves[k] = curve
+            if cache is not None:
+                cache.put(keys[k], curve)
+        results = [(curves[k][0], betas[k], curves[k][1]) if k in curves else None for k in range(len(pairs))]
+        portfolio_value = backtester.combine(stock_data.index, pairs, capitals, results)
+
+    for asset1_ticker, asset2_ticker in backtester.skipped_pairs:
+        print(f"Skipping pair {asset1_ticker}-{asset2_ticker}: Not enough data points for strategy.")
+    if backtester.attribution.empty:
+        print("No pair could be backtested. Exiting.")
+        return backtester
+
+    print("\nPer-pair attribution:")
+    for pair, row in backtester.attribution.iterrows():
+        print(f"  {pair}: beta {row['beta']:.4f}, capital {row['capital']:.2f}, "
+              f"P&L {row['pnl']:.2f}, trades {row['trades']}")
+
+    _save_npz(artifact_path(data_dir, PORTFOLIO_FILE),
+              dates=pd.DatetimeIndex(portfolio_value.index).as_unit('ns').asi8,
+              portfolio_value=portfolio_value.to_numpy(), pair_values=backtester.pair_values.to_numpy(),
+              pairs=np.array([pair_label(*pair) for pair in pairs if pair not in backtester.skipped_pairs]),
+              initial_capital=np.array(float(initial_capital)))
+    portfolio_value_path = os.path.join(data_dir, "portfolio_value.csv")
+    portfolio_value.to_csv(portfolio_value_path, header=['Portfolio_Value'])
+    print(f"Portfolio value saved to {portfolio_value_path}")
+
+    print(f"\nFinal Portfolio Value: {portfolio_value.iloc[-1]:.2f}")
+    print(f"Initial Capital: {backtester.initial_capital:.2f}")
+    print(f"Total Return: {((portfolio_value.iloc[-1] - backtester.initial_capital) / backtester.initial_capital * 100):.2f}%")
+    return backtester
+
+def load_portfolio_value(data_dir, path=None):
+    """Portfolio value Series from the portfolio artifact, or from a CSV such as `portfolio_value.csv`."""
+    import numpy as np
+    import pandas as pd
+
+    path = path or artifact_path(data_dir, PORTFOLIO_FILE)
+    if not path.endswith('.npz'):
+        return pd.read_csv(path, index_col=0, parse_dates=True).squeeze('columns')
+    with np.load(_require(path, 'backtest')) as saved:
+        return pd.Series(saved['portfolio_value'], index=pd.DatetimeIndex(saved['dates'].view('datetime64[ns]')),
+                         name='Portfolio_Value')
+
+def report_stage(portfolio_value, profiler):
+    """Prints the performance metrics of a portfolio value series, annualized for its bar frequency."""
+    import numpy as np
+    from performance_analysis import (calculate_returns, calculate_sharpe_ratio, calculate_sortino_ratio,
+                                      calculate_max_drawdown, calculate_volatility)
+    from bar_frequency import infer_frequency, periods_per_year
+
+    print("\nCalculating performance metrics...")
+    with profiler.stage('metrics'):
+        # Annualize for the bar frequency of the data (252 bars a year for daily prices)
+        bars_per_year = periods_per_year(infer_frequency(portfolio_value.index))
+        returns = calculate_returns(portfolio_value)
+        sharpe_ratio = calculate_sharpe_ratio(returns, periods_per_year=bars_per_year)
+        sortino_ratio = calculate_sortino_ratio(returns, periods_per_year=bars_per_year)
+        max_drawdown = calculate_max_drawdown(portfolio_value)
+        volatility = calculate_volatility(returns, periods_per_year=bars_per_year)
+
+    print(f"Sharpe Ratio: {sharpe_ratio:.4f}")
+    if not np.isnan(sortino_ratio):
+        print(f"Sortino Ratio: {sortino_ratio:.4f}")
+    else:
+        print("Sortino Ratio: N/A (no downside deviation)")
+    print(f"Max Drawdown: {max_drawdown:.4f}")
+    print(f"Volatility (Annualized): {volatility:.4f}")
@@ -0,0 +1,245 @@
+import pandas as pd
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import load_data, get_data_dir, share_array, attach_shared_array
+from strategy_development import calculate_hedge_ratio_and_spread, generate_signals
+from backtesting_engine import Backtester
+from result_cache import make_key, MISSING
+from alignment import AlignmentIndex
+from price_panel import PricePanel
+
+def pair_label(asset1_ticker, asset2_ticker):
+    """Column label used for a pair in portfolio results."""
+    return f"{asset1_ticker}-{asset2_ticker}"
+
+def backtest_pair(pair_data, asset1_ticker, asset2_ticker, capital, entry_zscore=2.0, exit_zscore=0.0,
+                  min_obs=60, rows=None, window=60):
+    """Runs the single-pair workflow (hedge ratio, signals, backtest) on a two-column frame.
+
+    `rows` are the pair's common valid rows from an `AlignmentIndex` (a slice or an index
+    array); without them they are found with `dropna`. `window` is the z-score window in
+    bars or as a time span (see `generate_signals`). Returns (portfolio value Series,
+    beta, number of trades), or None if the pair has fewer than `min_obs` common data points.
+    """
+    if rows is None:
+        both = pair_data[[asset1_ticker, asset2_ticker]].dropna()
+    else:
+        both = pair_data[[asset1_ticker, asset2_ticker]].iloc[rows]
+    if len(both) < min_obs:
+        return None
+    beta, spread = calculate_hedge_ratio_and_spread(both[asset1_ticker], both[asset2_ticker])
+    signals = generate_signals(spread, entry_zscore=entry_zscore, exit_zscore=exit_zscore, window=window)
+    backtester = Backtester(initial_capital=capital)
+    portfolio_value = backtester.run_backtest(pair_data, signals, asset1_ticker, asset2_ticker)
+    return portfolio_value, beta, len(backtester.trades)
+
+def _pair_worker(prices_spec, dates_spec, columns, i, j, capital, entry_zscore, exit_zscore, min_obs, rows,
+                 window):
+    """Process-pool entry point: backtests one pair against the shared price matrix."""
+    prices_shm, prices = attach_shared_array(prices_spec)
+    dates_shm, dates = attach_shared_array(dates_spec)
+    try:
+        index = pd.DatetimeIndex(dates.view('datetime64[ns]'))
+        pair_data = pd.DataFrame(prices[:, [i, j]], index=index, columns=[columns[i], columns[j]])
+        result = backtest_pair(pair_data, columns[i], columns[j], capital, entry_zscore, exit_zscore, min_obs,
+                               rows, window)
+        if result is None:
+            return None
+        portfolio_value, beta, n_trades = result
+        return portfolio_value.to_numpy(), beta, n_trades
+    finally:
+        del prices, dates
+        prices_shm.close()
+        dates_shm.close()
+
+class PortfolioBacktester:
+    """Backtests a list of pairs side by side and combines them into one portfolio.
+
+    Each pair trades its own slice of the capital, sized by `allocation`: 'equal', a list of
+    weights in pair order, or a dict of weights keyed by (asset1, asset2). Weights are
+    normalized to sum to one. Capital of pairs that cannot be traded stays in cash.
+    With `n_jobs > 1` (or -1 for one process per CPU) pairs are run over a process pool
+    that reads the price matrix from shared memory. With a `ResultCache`, pairs whose
+    prices, capital and parameters were backtested before are read from the cache and
+    only the others are run.
+    """
+
+    def __init__(self, initial_capital=100000, allocation='equal', n_jobs=1, entry_zscore=2.0,
+                 exit_zscore=0.0, min_obs=60, cache=None, window=60):
+        if n_jobs != -1 and n_jobs < 1:
+            raise ValueError(f"n_jobs must be -1 or a positive number, not {n_jobs}")
+        self.initial_capital = initial_capital
+        self.allocation = allocation
+        self.n_jobs = n_jobs
+        self.entry_zscore = entry_zscore
+        self.exit_zscore = exit_zscore
+        self.min_obs = min_obs
+        self.cache = cache
+        self.window = window
+        self.portfolio_value = pd.Series(dtype=float)
+        self.pair_values = pd.DataFrame()
+        self.attribution = pd.DataFrame()
+        self.skipped_pairs = []
+
+    def allocate(self, pairs):
+        """Returns the capital assigned to each pair."""
+        if isinstance(self.allocation, str):
+            if self.allocation != 'equal':
+                raise ValueError(f"Unknown allocation: {self.allocation}")
+            weights = np.ones(len(pairs))
+        elif isinstance(self.allocation, dict):
+            weights = np.array([self.allocation.get(pair, 0.0) for pair in pairs], dtype=float)
+        else:
+            weights = np.asarray(self.allocation, dtype=float)
+            if len(weights) != len(pairs):
+                raise ValueError("allocation must have one weight per pair")
+        if weights.sum() <= 0:
+            raise ValueError("allocation weights must sum to a positive number")
+        return self.initial_capital * weights / weights.sum()
+
+    @staticmethod
+    def _check_pairs(pairs):
+        """Rejects pairs listed twice, whose results would overwrite each other."""
+        seen = set()
+        duplicates = [pair for pair in pairs if pair in seen or seen.add(pair)]
+        if duplicates:
+            raise ValueError(f"Pairs listed more than once: {', '.join(pair_label(*pair) for pair in duplicates)}")
+
+    def _common_rows(self, stock_data, pairs):
+        """Common valid rows of every pair, from one alignment index over all tickers."""
+        if isinstance(stock_data, PricePanel):
+            alignment = stock_data.alignment
+        else:
+            alignment = AlignmentIndex.from_prices(stock_data.to_numpy(dtype=float))
+        positions = {ticker: k for k, ticker in enumerate(stock_data.columns)}
+        return [alignment.common_rows(positions[asset1_ticker], positions[asset2_ticker])
+                for asset1_ticker, asset2_ticker in pairs]
+
+    def _run_serial(self, stock_data, pairs, capitals):
+        results = []
+        for (asset1_ticker, asset2_ticker), capital, rows in zip(pairs, capitals,
+                                                                 self._common_rows(stock_data, pairs)):
+            result = backtest_pair(stock_data[[asset1_ticker, asset2_ticker]], asset1_ticker, asset2_ticker,
+                                   capital, self.entry_zscore, self.exit_zscore, self.min_obs, rows, self.window)
+            if result is not None:
+                portfolio_value, beta, n_trades = result
+                result = portfolio_value.to_numpy(), beta, n_trades
+            results.append(result)
+        return results
+
+    def _run_parallel(self, stock_data, pairs, capitals):
+        columns = list(stock_data.columns)
+        positions = {ticker: k for k, ticker in enumerate(columns)}
+        prices_shm, prices_spec = share_array(stock_data.to_numpy(dtype=float))
+        dates_shm, dates_spec = share_array(pd.DatetimeIndex(stock_data.index).as_unit('ns').asi8)
+        n_jobs = (os.cpu_count() or 1) if self.n_jobs == -1 else self.n_jobs
+        try:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [
+                    executor.submit(_pair_worker, prices_spec, dates_spec, columns,
+                                    positions[asset1_ticker], positions[asset2_ticker], capital,
+                                    self.entry_zscore, self.exit_zscore, self.min_obs, rows, self.window)
+                    for (asset1_ticker, asset2_ticker), capital, rows in zip(pairs, capitals,
+                                                                             self._common_rows(stock_data, pairs))
+                ]
+                return [future.result() for future in futures]
+        finally:
+            for shm in (prices_shm, dates_shm):
+                shm.close()
+                shm.unlink()
+
+    def _pair_key(self, stock_data, asset1_ticker, asset2_ticker, capital):
+        return make_key('backtest_pair', stock_data[[asset1_ticker, asset2_ticker]], capital=float(capital),
+                        entry_zscore=self.entry_zscore, exit_zscore=self.exit_zscore, min_obs=self.min_obs,
+                        window=str(self.window))
+
+    def _run(self, stock_data, pairs, capitals):
+        if self.n_jobs == 1 or len(pairs) < 2:
+            return self._run_serial(stock_data, pairs, capitals)
+        return self._run_parallel(stock_data, pairs, capitals)
+
+    def _run_cached(self, stock_data, pairs, capitals):
+        """Reads cached pair results and runs (then caches) only the missing ones."""
+        keys = [self._pair_key(stock_data, *pair, capital) for pair, capital in zip(pairs, capitals)]
+        results = [self.cache.get(key, MISSING) for key in keys]
+        missing = [k for k, result in enumerate(results) if result is MISSING]
+        if missing:
+            computed = self._run(stock_data, [pairs[k] for k in missing], capitals[missing])
+            for k, result in zip(missing, computed):
+                self.cache.put(keys[k], result)
+                results[k] = result
+        return results
+
+    def run_backtest(self, stock_data, pairs):
+        """Backtests every pair and returns the aggregate daily portfolio value.
+
+        `pairs` may come straight from `find_cointegrated_pairs`; only the first two fields
+        of each entry are used. Per-pair equity curves are kept in `pair_values` and the
+        per-pair P&L breakdown in `attribution`. A pair listed twice raises ValueError.
+        """
+        pairs = [tuple(pair[:2]) for pair in pairs]
+        self._check_pairs(pairs)
+        capitals = self.allocate(pairs)
+        if self.cache is None:
+            results = self._run(stock_data, pairs, capitals)
+        else:
+            results = self._run_cached(stock_data, pairs, capitals)
+        return self.combine(stock_data.index, pairs, capitals, results)
+
+    def combine(self, index, pairs, capitals, results):
+        """Builds the portfolio from per-pair results and returns its value.
+
+        `results` holds (portfolio values, beta, number of trades) per pair, or None for a
+        pair that could not be traded, whose capital stays in cash. This lets pair curves
+        computed elsewhere (e.g. from saved signals) be combined like `run_backtest` does.
+        """
+        self._check_pairs([tuple(pair) for pair in pairs])
+        curves = {}
+        rows = []
+        self.skipped_pairs = []
+        cash = 0.0
+        for (asset1_ticker, asset2_ticker), capital, result in zip(pairs, capitals, results):
+            label = pair_label(asset1_ticker, asset2_ticker)
+            if result is None:
+                self.skipped_pairs.append((asset1_ticker, asset2_ticker))
+                cash += capital
+                continue
+            values, beta, n_trades = result
+            curves[label] = values
+            rows.append({
+                'pair': label,
+                'asset1': asset1_ticker,
+                'asset2': asset2_ticker,
+                'beta': beta,
+                'capital': capital,
+                'final_value': values[-1],
+                'pnl': values[-1] - capital,
+                'trades': n_trades,
+            })
+
+        self.pair_values = pd.DataFrame(curves, index=index)
+        self.attribution = pd.DataFrame(rows, columns=['pair', 'asset1', 'asset2', 'beta', 'capital',
+                                                       'final_value', 'pnl', 'trades']).set_index('pair')
+        total_pnl = self.attribution['pnl'].sum()
+        self.attribution['pnl_share'] = self.attribution['pnl'] / total_pnl if total_pnl != 0 else np.nan
+        self.portfolio_value = self.pair_values.sum(axis=1) + cash
+        return self.portfolio_value
+
+if __name__ == "__main__":
+    from pair_identification import find_cointegrated_pairs
+
+    data_dir = get_data_dir()
+    data_file_path = os.path.join(data_dir, "sp500_adj_close.csv")
+    stock_data = load_data(data_file_path)
+
+    cointegrated_pairs = find_cointegrated_pairs(stock_data)
+    if not cointegrated_pairs:
+        print("No cointegrated pairs found.")
+    else:
+        backtester = PortfolioBacktester(initial_capital=100000, n_jobs=-1)
+        portfolio_value = backtester.run_backtest(stock_data, cointegrated_pairs)
+        print(backtester.attribution.sort_values('pnl', ascending=False))
+        print(f"\nFinal Portfolio Value: {portfolio_value.iloc[-1]:.2f}")
+        print(f"Total Return: {((portfolio_value.iloc[-1] - backtester.initial_capital) / backtester.initial_capital * 100):.2f}%")
@@ -0,0 +1,189 @@
+import pandas as pd
+import numpy as np
+import os
+from collections import namedtuple
+
+from utils import get_data_dir, read_price_csv
+from price_store import PriceStore, default_store_path, is_price_store, store_is_current, write_price_store
+from alignment import AlignmentIndex, pack_validity
+
+PairView = namedtuple('PairView', ['dates', 'price1', 'price2', 'valid'])
+
+class PricePanel:
+    """Columnar (dates x tickers) price matrix with a validity bitmask.
+
+    Prices are one column-major float64 or float32 block, so every ticker is contiguous
+    and can be memory-mapped from a price store. Missing bars are tracked as one bit per
+    price (`valid_bits`), so pairs are aligned by AND-ing two bit rows instead of `dropna`
+    copies. The panel offers the parts of the DataFrame interface the pipeline uses
+    (`index`, `columns`, `shape`, `to_numpy`, `panel[ticker]`, `panel[[tickers]]`), so it
+    can be passed to `find_cointegrated_pairs` and `PortfolioBacktester` directly.
+    """
+
+    def __init__(self, values, dates, tickers, valid_bits=None):
+        self.values = values
+        self.dates = pd.DatetimeIndex(dates)
+        self.tickers = pd.Index(tickers)
+        self.valid_bits = pack_validity(values) if valid_bits is None else valid_bits
+        self._alignment = None
+
+    @classmethod
+    def from_frame(cls, data, dtype=np.float64):
+        """Builds a panel from a (dates x tickers) DataFrame, storing prices as `dtype`."""
+        values = np.asfortranarray(data.to_numpy(dtype=dtype))
+        return cls(values, data.index, data.columns)
+
+    @classmethod
+    def from_store(cls, store_path, dtype=None):
+        """Opens a price store as a memory-mapped panel.
+
+        With the store's own dtype (the default) nothing is read until it is used; the
+        validity mask is read from the store too. Asking for another dtype, e.g. float32,
+        converts the prices one column at a time.
+        """
+        store = PriceStore(store_path)
+        values = store.prices
+        if dtype is not None and values.dtype != np.dtype(dtype):
+            converted = np.empty(values.shape, dtype=dtype, order='F')
+            for k in range(values.shape[1]):
+                converted[:, k] = values[:, k]
+            values = converted
+        return cls(values, store.dates, store.tickers, store.valid_bits)
+
+    @classmethod
+    def open(cls, file_path, dtype=None):
+        """Opens a price CSV or store as a panel, converting the CSV to a store first if needed."""
+        if is_price_store(file_path):
+            return cls.from_store(file_path, dtype=dtype)
+        store_path = default_store_path(file_path)
+        if not store_is_current(store_path, file_path):
+            write_price_store(read_price_csv(file_path), store_path)
+        return cls.from_store(store_path, dtype=dtype)
+
+    # DataFrame-like interface
+
+    @property
+    def index(self):
+        return self.dates
+
+    @property
+    def columns(self):
+        return self.tickers
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    @property
+    def nbytes(self):
+        """Bytes held by the prices and the validity mask."""
+        return self.values.nbytes + self.valid_bits.nbytes
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __getitem__(self, key):
+        if isinstance(key, (list, tuple, pd.Index, np.ndarray)):
+            return self.to_frame(key)
+        return pd.Series(self.values[:, self.tickers.get_loc(key)], index=self.dates, name=key, copy=False)
+
+    def to_numpy(self, dtype=None):
+        """The price matrix; a view unless another dtype is requested."""
+        return np.asarray(self.values, dtype=dtype)
+
+    def _columns(self, tickers):
+        """Column positions of `tickers` as a slice when they are adjacent (so views stay views)."""
+        if tickers is None:
+            return slice(None), self.tickers
+        positions = self.tickers.get_indexer(list(tickers))
+        if (positions < 0).any():
+            missing = [t for t, p in zip(tickers, positions) if p < 0]
+            raise KeyError(f"Tickers not in panel: {missing}")
+        if len(positions) and np.array_equal(positions, np.arange(positions[0], positions[0] + len(positions))):
+            return slice(positions[0], positions[0] + len(positions)), self.tickers[positions]
+        return positions, self.tickers[positions]
+
+    def date_slice(self, start=None, end=None):
+        """Returns the row slice covering dates in [start, end] (both inclusive)."""
+        lo = 0 if start is None else self.dates.searchsorted(pd.Timestamp(start), side='left')
+        hi = len(self.dates) if end is None else self.dates.searchsorted(pd.Timestamp(end), side='right')
+        return slice(lo, hi)
+
+    def to_frame(self, tickers=None, start=None, end=None):
+        """Returns prices as a DataFrame; adjacent tickers and date ranges are views, not copies."""
+        rows = self.date_slice(start, end)
+        cols, columns = self._columns(tickers)
+        return pd.DataFrame(self.values[rows, cols], index=self.dates[rows], columns=columns, copy=False)
+
+    # Validity and pair alignment
+
+    @property
+    def alignment(self):
+        """`AlignmentIndex` over the panel's validity bitmask, built on first use."""
+        if self._alignment is None:
+            self._alignment = AlignmentIndex(self.valid_bits, len(self.dates))
+        return self._alignment
+
+    def valid(self, ticker, rows=slice(None)):
+        """Boolean mask of the bars on which `ticker` has a price."""
+        mask = np.unpackbits(self.valid_bits[self.tickers.get_loc(ticker)], count=len(self.dates))
+        return mask[rows].astype(bool)
+
+    def common_valid(self, asset1_ticker, asset2_ticker, rows=slice(None)):
+        """Boolean mask of the bars on which both tickers have a price."""
+        bits = (self.valid_bits[self.tickers.get_loc(asset1_ticker)]
+                & self.valid_bits[self.tickers.get_loc(asset2_ticker)])
+        return np.unpackbits(bits, count=len(self.dates))[rows].astype(bool)
+
+    def pair_view(self, asset1_ticker, asset2_ticker, start=None, end=None):
+        """Two price columns over a date range with their common validity mask.
+
+        The price arrays are views on the panel (no copy); `valid` marks the aligned bars.
+        """
+        rows = self.date_slice(start, end)
+        return PairView(self.dates[rows],
+                        self.values[rows, self.tickers.get_loc(asset1_ticker)],
+                        self.values[rows, self.tickers.get_loc(asset2_ticker)],
+                        self.common_valid(asset1_ticker, asset2_ticker, rows))
+
+    def pair_series(self, asset1_ticker, asset2_ticker, start=None, end=None):
+        """The pair's prices on their common bars as two Series (the one copy `dropna` would make)."""
+        view = self.pair_view(asset1_ticker, asset2_ticker, start, end)
+        dates = view.dates[view.valid]
+        return (pd.Series(view.price1[view.valid], index=dates, name=asset1_ticker),
+                pd.Series(view.price2[view.valid], index=dates, name=asset2_ticker))
+
+    def iter_chunks(self, chunk_rows=65536, tickers=None, start=None, end=None):
+        """Iterates over a date range in blocks of `chunk_rows` bars.
+
+        Yields (dates, prices, valid) per block. For a memory-mapped panel only the rows of
+        the current block are read, so date ranges larger than memory can be streamed.
+        """
+        rows = self.date_slice(start, end)
+        cols, _ = self._columns(tickers)
+        col_positions = np.arange(self.values.shape[1])[cols]
+        for lo in range(rows.start, rows.stop, chunk_rows):
+            hi = min(lo + chunk_rows, rows.stop)
+            first_byte = lo // 8
+            bits = np.unpackbits(self.valid_bits[col_positions, first_byte:(hi + 7) // 8], axis=1)
+            valid = bits[:, lo - 8 * first_byte:hi - 8 * first_byte].T.astype(bool)
+            yield self.dates[lo:hi], self.values[lo:hi, cols], valid
+
+if __name__ == "__main__":
+    data_dir = get_data_dir()
+    data_file_path = os.path.join(data_dir, "sp500_adj_close.csv")
+
+    panel = PricePanel.open(data_file_path, dtype=np.float32)
+    print(f"{panel.shape[1]} tickers x {panel.shape[0]} dates in {panel.nbytes / 2 ** 20:.1f} MB ({panel.dtype})")
+
+    view = panel.pair_view("AMZN", "NVDA")
+    print(f"AMZN-NVDA: {view.valid.sum()} common bars")
+
+    n_bars = 0
+    for dates, block, valid in panel.iter_chunks(chunk_rows=1000):
+        n_bars += valid.sum()
+    print(f"Valid prices in the panel: {n_bars}")
@@ -0,0 +1,147 @@
+import pandas as pd
+import numpy as np
+import json
+import os
+
+from alignment import pack_validity
+
+PRICES_FILE = "prices.npy"
+DATES_FILE = "dates.npy"
+TICKERS_FILE = "tickers.json"
+VALID_FILE = "valid.npy"
+
+def default_store_path(csv_path):
+    """Returns the store directory that sits next to a price CSV (prices.csv -> prices.store)."""
+    return os.path.splitext(csv_path)[0] + ".store"
+
+def is_price_store(path):
+    """Returns True if `path` is a price store directory."""
+    return os.path.isfile(os.path.join(path, PRICES_FILE))
+
+def write_price_store(data, store_path, dtype=np.float64):
+    """Writes a (dates x tickers) price frame to a binary price store.
+
+    Prices are saved as one column-major matrix (float64, or float32 to halve the size), so
+    every ticker is a contiguous block that can be memory-mapped, next to the date index,
+    the ticker list and a packed validity bitmask (see `alignment`). Files are written
+    under temporary names first so readers never see a half-written store.
+    """
+    os.makedirs(store_path, exist_ok=True)
+    prices = np.asfortranarray(data.to_numpy(dtype=dtype))
+    dates = pd.DatetimeIndex(data.index).as_unit('ns').asi8
+
+    tmp_prices = os.path.join(store_path, PRICES_FILE + ".tmp")
+    tmp_dates = os.path.join(store_path, DATES_FILE + ".tmp")
+    tmp_tickers = os.path.join(store_path, TICKERS_FILE + ".tmp")
+    tmp_valid = os.path.join(store_path, VALID_FILE + ".tmp")
+    with open(tmp_prices, "wb") as f:
+        np.save(f, prices)
+    with open(tmp_dates, "wb") as f:
+        np.save(f, dates)
+    with open(tmp_tickers, "w") as f:
+        json.dump({'tickers': [str(t) for t in data.columns], 'index_name': data.index.name}, f)
+    with open(tmp_valid, "wb") as f:
+        np.save(f, pack_validity(prices))
+    os.replace(tmp_dates, os.path.join(store_path, DATES_FILE))
+    os.replace(tmp_valid, os.path.join(store_path, VALID_FILE))
+    os.replace(tmp_tickers, os.path.join(store_path, TICKERS_FILE))
+    # The price matrix goes last: its timestamp marks the store as complete
+    os.replace(tmp_prices, os.path.join(store_path, PRICES_FILE))
+
+def convert_csv_to_store(csv_path, store_path=None):
+    """Parses a price CSV once and writes it as a binary price store. Returns the store path."""
+    from utils import read_price_csv
+
+    store_path = store_path or default_store_path(csv_path)
+    write_price_store(read_price_csv(csv_path), store_path)
+    return store_path
+
+def store_is_current(store_path, csv_path):
+    """Returns True if the store exists and is at least as new as the CSV it was built from."""
+    if not is_price_store(store_path):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return os.path.getmtime(os.path.join(store_path, PRICES_FILE)) >= os.path.getmtime(csv_path)
+
+class PriceStore:
+    """Read access to a binary price store.
+
+    Nothing is read until it is needed: the ticker list and dates are loaded on first use
+    and the price matrix is memory-mapped, so `load` only touches the requested columns.
+    """
+
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self._tickers = None
+        self._index_name = None
+        self._dates = None
+        self._prices = None
+        self._valid_bits = None
+
+    @property
+    def tickers(self):
+        if self._tickers is None:
+            with open(os.path.join(self.store_path, TICKERS_FILE)) as f:
+                meta = json.load(f)
+            self._tickers = pd.Index(meta['tickers'])
+            self._index_name = meta.get('index_name')
+        return self._tickers
+
+    @property
+    def dates(self):
+        if self._dates is None:
+            dates = np.load(os.path.join(self.store_path, DATES_FILE))
+            self._dates = pd.DatetimeIndex(dates.view('datetime64[ns]'), name=self.index_name)
+        return self._dates
+
+    @property
+    def index_name(self):
+        self.tickers
+        return self._index_name
+
+    @property
+    def prices(self):
+        """The full (dates x tickers) price matrix, memory-mapped copy-on-write."""
+        if self._prices is None:
+            self._prices = np.load(os.path.join(self.store_path, PRICES_FILE), mmap_mode='c')
+        return self._prices
+
+    @property
+    def valid_bits(self):
+        """Packed validity bitmask (tickers x bytes), or None for stores written without one."""
+        if self._valid_bits is None:
+            path = os.path.join(self.store_path, VALID_FILE)
+            if not os.path.exists(path):
+                return None
+            self._valid_bits = np.load(path, mmap_mode='r')
+        return self._valid_bits
+
+    def date_slice(self, start=None, end=None):
+        """Returns the row slice covering dates in [start, end] (both inclusive)."""
+        lo = 0 if start is None else self.dates.searchsorted(pd.Timestamp(start), side='left')
+        hi = len(self.dates) if end is None else self.dates.searchsorted(pd.Timestamp(end), side='right')
+        return slice(lo, hi)
+
+    def load(self, tickers=None, start=None, end=None):
+        """Loads prices for a ticker subset and date range as a DataFrame.
+
+        A date range, or a run of adjacent tickers, is a view on the memory map; only an
+        arbitrary ticker subset copies, and then just the selected columns.
+        """
+        rows = self.date_slice(start, end)
+        if tickers is None:
+            cols = slice(None)
+            columns = self.tickers
+        else:
+            positions = self.tickers.get_indexer(list(tickers))
+            if (positions < 0).any():
+                missing = [t for t, p in zip(tickers, positions) if p < 0]
+                raise KeyError(f"Tickers not in price store: {missing}")
+            columns = self.tickers[positions]
+            if len(positions) and np.array_equal(positions, np.arange(positions[0], positions[0] + len(positions))):
+                cols = slice(positions[0], positions[0] + len(positions))
+            else:
+                cols = positions
+        values = self.prices[rows, cols]
+        return pd.DataFrame(values, index=self.dates[rows], columns=columns, copy=False)
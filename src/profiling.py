@@ -0,0 +1,233 @@
+import json
+import math
+import os
+import platform
+import threading
+import time
+import tracemalloc
+import cProfile
+import pstats
+import io
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+RSS_SAMPLE_SECONDS = 0.01
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its finished child processes, in MB.
+
+    This is a high-water mark over the whole life of the process (and of its largest
+    child), not of any one stage; see `RssSampler` for the peak within a stage.
+    """
+    if resource is None:
+        return float('nan')
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 / 2 ** 20 if platform.system() == 'Darwin' else 1 / 2 ** 10
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * scale
+
+def current_rss_mb():
+    """Current resident set size of this process in MB, or NaN where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return float('nan')
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+class RssSampler:
+    """Samples the RSS of this process in a background thread and keeps the highest value.
+
+    Used around a stage, `peak_mb` is that stage's own peak (to within the sampling
+    interval), unlike `ru_maxrss`. Memory of worker processes is not included.
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.peak_mb = float('nan')
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if math.isnan(self.peak_mb) or rss > self.peak_mb:
+            self.peak_mb = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._sample()
+        # Without /proc there is nothing to sample
+        if not math.isnan(self.peak_mb):
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops sampling and returns the peak RSS in MB."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._sample()
+        return self.peak_mb
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+class StageRecord:
+    """Measurements of one pipeline stage. Set `items` inside the stage to get a throughput."""
+
+    def __init__(self, name, items=None, unit='items'):
+        self.name = name
+        self.items = items
+        self.unit = unit
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_mb = float('nan')
+        self.process_peak_rss_mb_so_far = float('nan')
+        self.peak_traced_mb = None
+        self.profile = None
+
+    def to_dict(self):
+        record = {
+            'stage': self.name,
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'peak_rss_mb': self.peak_rss_mb,
+            'process_peak_rss_mb_so_far': self.process_peak_rss_mb_so_far,
+        }
+        if self.items is not None:
+            record['items'] = self.items
+            record['unit'] = self.unit
+            record['items_per_second'] = self.items / self.wall_seconds if self.wall_seconds > 0 else None
+        if self.peak_traced_mb is not None:
+            record['peak_traced_mb'] = self.peak_traced_mb
+        if self.profile is not None:
+            record['profile'] = self.profile
+        return record
+
+class RunProfiler:
+    """Times the stages of a run and writes them to a JSON report.
+
+    Each `stage` records wall time, CPU time (of this process), the peak RSS of this
+    process during the stage (sampled by `RssSampler`; NaN where /proc is not available)
+    and, separately, the process-wide peak RSS reached so far. With `trace_memory=True` the peak Python allocation of each stage is traced
+    with tracemalloc, and with `profile=True` each stage runs under cProfile and the
+    report lists its `profile_top` most expensive functions. Both hooks slow the run
+    down, so they are off by default.
+    """
+
+    def __init__(self, profile=False, trace_memory=False, profile_top=15):
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.profile_top = profile_top
+        self.stages = []
+        self.started = datetime.now()
+        self._start = time.perf_counter()
+        self._start_cpu = time.process_time()
+
+    @contextmanager
+    def stage(self, name, items=None, unit='items'):
+        """Context manager that measures the enclosed block as one stage."""
+        record = StageRecord(name, items, unit)
+        if self.trace_memory:
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+        profiler = cProfile.Profile() if self.profile else None
+        sampler = RssSampler().start()
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record.wall_seconds = time.perf_counter() - start_wall
+            record.cpu_seconds = time.process_time() - start_cpu
+            record.peak_rss_mb = sampler.stop()
+            record.process_peak_rss_mb_so_far = peak_rss_mb()
+            if self.trace_memory:
+                record.peak_traced_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            if profiler is not None:
+                record.profile = self._top_functions(profiler)
+            self.stages.append(record)
+
+    def _top_functions(self, profiler):
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        rows = []
+        for (file_name, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+            rows.append({
+                'function': f"{os.path.basename(file_name)}:{line}({function})",
+                'calls': calls,
+                'own_seconds': own,
+                'cumulative_seconds': cumulative,
+            })
+        rows.sort(key=lambda row: row['cumulative_seconds'], reverse=True)
+        return rows[:self.profile_top]
+
+    def report(self):
+        """Returns the run report as a JSON-serializable dict."""
+        return {
+            'started': self.started.isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'wall_seconds': time.perf_counter() - self._start,
+            'cpu_seconds': time.process_time() - self._start_cpu,
+            'process_peak_rss_mb': peak_rss_mb(),
+            'stages': [record.to_dict() for record in self.stages],
+        }
+
+    def write_report(self, path):
+        """Writes the run report to `path` as JSON and returns the report."""
+        report = self.report()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, default=float)
+        return report
+
+    def summary(self):
+        """One line per stage with its wall time and throughput, for printing."""
+        lines = []
+        for record in self.stages:
+            line = f"{record.name:<20} {record.wall_seconds:8.2f}s wall {record.cpu_seconds:8.2f}s cpu"
+            if record.items is not None and record.wall_seconds > 0:
+                line += f"  {record.items / record.wall_seconds:,.0f} {record.unit}/s"
+            lines.append(line)
+        return "\n".join(lines)
+
+if __name__ == "__main__":
+    from utils import load_data, get_data_dir
+    from pair_identification import find_cointegrated_pairs
+
+    data_dir = get_data_dir()
+    data_file_path = os.path.join(data_dir, "sp500_adj_close.csv")
+
+    profiler = RunProfiler(profile=True, trace_memory=True)
+    with profiler.stage('load_data') as stage:
+        stock_data = load_data(data_file_path)
+        stage.items, stage.unit = stock_data.shape[1], 'tickers'
+    with profiler.stage('screen_pairs') as stage:
+        pairs, stats = find_cointegrated_pairs(stock_data, return_stats=True)
+        stage.items, stage.unit = stats['pairs_tested'], 'pairs'
+    print(profiler.summary())
+    report_path = os.path.join(data_dir, "profile_report.json")
+    profiler.write_report(report_path)
+    print(f"Report saved to {report_path}")
@@ -0,0 +1,153 @@
+import pandas as pd
+import numpy as np
+import hashlib
+import pickle
+import os
+
+MISSING = object()
+
+def hash_array(values):
+    """Content hash of a NumPy array (values, shape and dtype)."""
+    values = np.ascontiguousarray(values)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((values.shape, values.dtype.str)).encode())
+    digest.update(values.view(np.uint8).reshape(-1))
+    return digest.hexdigest()
+
+def hash_object(obj):
+    """Content hash of an array, Series, DataFrame, index or plain picklable value."""
+    if isinstance(obj, pd.DataFrame):
+        parts = (hash_array(obj.to_numpy()), hash_object(obj.index), hash_object(obj.columns))
+    elif isinstance(obj, pd.Series):
+        parts = (hash_array(obj.to_numpy()), hash_object(obj.index), repr(obj.name))
+    elif isinstance(obj, pd.DatetimeIndex):
+        parts = (hash_array(obj.as_unit('ns').asi8),)
+    elif isinstance(obj, pd.Index):
+        parts = (repr(obj.tolist()),)
+    elif isinstance(obj, np.ndarray):
+        return hash_array(obj)
+    else:
+        parts = (repr(obj),)
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+def make_key(name, *parts, **params):
+    """Cache key for a named computation over some inputs and keyword parameters."""
+    hashed = [name] + [hash_object(part) for part in parts] + [f"{k}={params[k]!r}" for k in sorted(params)]
+    return hashlib.blake2b("|".join(hashed).encode(), digest_size=20).hexdigest()
+
+class ResultCache:
+    """Size-bounded on-disk memoization of pipeline results.
+
+    Each entry is one pickle file named by its key. Reading an entry touches its
+    modification time, and `put` evicts the least recently used entries once the
+    directory holds more than `max_bytes`. The size of the directory is listed once and
+    then tracked as entries are written, so a `put` only scans the directory when the
+    running total goes over the limit; eviction then frees down to `EVICT_TO` of it so the
+    next scan is many entries away. Keys are content hashes of the inputs (see
+    `make_key`), so results computed from data that did not change stay valid when
+    new bars arrive for other tickers.
+    """
+
+    EVICT_TO = 0.9
+
+    def __init__(self, cache_dir, max_bytes=512 * 2 ** 20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._total_bytes = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def get(self, key, default=None):
+        """Returns the cached value for `key`, or `default` if there is none or it cannot be read."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        # A truncated entry or one pickled by other code versions is a miss, not an error
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, ValueError):
+            return default
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        """Stores a value under `key` and evicts old entries if the cache is over its size."""
+        path = self._path(key)
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for _, size, _ in self.entries())
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            written = f.tell()
+        os.replace(tmp_path, path)
+        self._total_bytes += written - replaced
+        if self._total_bytes > self.max_bytes:
+            self.evict(self.max_bytes * self.EVICT_TO)
+
+    def memoize(self, name, func, *args, **kwargs):
+        """Returns func(*args, **kwargs), computing it only if no result is cached for these inputs."""
+        key = make_key(name, *args, **kwargs)
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            value = func(*args, **kwargs)
+            self.put(key, value)
+        return value
+
+    def entries(self):
+        """Returns (path, size, last used) for every entry, least recently used first."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".pkl"):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self, target_bytes=None):
+        """Deletes least recently used entries until the cache fits in `target_bytes` (default `max_bytes`)."""
+        target_bytes = self.max_bytes if target_bytes is None else target_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= target_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._total_bytes = total
+
+    def clear(self):
+        """Removes every cached entry."""
+        for path, _, _ in self.entries():
+            os.remove(path)
+        self._total_bytes = 0
+
+if __name__ == "__main__":
+    import time
+
+    from utils import load_data, get_data_dir
+    from pair_identification import find_cointegrated_pairs
+
+    data_dir = get_data_dir()
+    data_file_path = os.path.join(data_dir, "sp500_adj_close.csv")
+    stock_data = load_data(data_file_path)
+    cache = ResultCache(os.path.join(data_dir, "cache"))
+
+    for run in ("cold", "warm"):
+        start = time.perf_counter()
+        pairs, stats = find_cointegrated_pairs(stock_data, prefilter='correlation', return_stats=True, cache=cache)
+        print(f"{run}: {len(pairs)} pairs in {time.perf_counter() - start:.2f}s "
+              f"({stats['pairs_from_cache']} of {stats['pairs_tested']} p-values from cache)")
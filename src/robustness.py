@@ -0,0 +1,239 @@
+import pandas as pd
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+from statsmodels.stats.multitest import multipletests
+
+from utils import load_data, get_data_dir, share_array, attach_shared_array
+from strategy_development import calculate_hedge_ratio_and_spread, generate_signals
+from backtesting_engine import pair_backtest_batch
+from performance_analysis import performance_matrix
+from alignment import AlignmentIndex
+from price_panel import PricePanel
+
+def block_bootstrap_indices(n, n_paths, block_size=20, rng=None):
+    """Row indices of `n_paths` circular block-bootstrap resamples of a length-`n` series.
+
+    Each path is built from blocks of `block_size` consecutive rows starting at random
+    positions (wrapping around the end), which keeps the short-range autocorrelation and
+    volatility clustering of the original series. Returns an (n, n_paths) array.
+    """
+    rng = np.random.default_rng(rng)
+    n_blocks = -(-n // block_size)
+    starts = rng.integers(0, n, size=(n_blocks, n_paths))
+    offsets = np.arange(block_size)
+    rows = (starts[:, None, :] + offsets[None, :, None]) % n
+    return rows.reshape(n_blocks * block_size, n_paths)[:n]
+
+def block_permutation_indices(n, n_paths, block_size=20, rng=None):
+    """Row indices of `n_paths` block permutations of a length-`n` series.
+
+    The series is cut into consecutive blocks of `block_size` rows and the blocks are put
+    in a random order, so every row appears exactly once and runs within a block stay
+    intact. Returns an (n, n_paths) array.
+    """
+    rng = np.random.default_rng(rng)
+    n_blocks = -(-n // block_size)
+    order = rng.random((n_paths, n_blocks)).argsort(axis=1)
+    rows = (order[:, :, None] * block_size + np.arange(block_size)).reshape(n_paths, -1)
+    # Only the last block can be short; dropping its missing rows leaves n rows per path
+    return rows[rows < n].reshape(n_paths, n).T
+
+def adjust_p_values(p_values, method='fdr_bh', n_tests=None):
+    """Corrects p-values for multiple testing with `statsmodels` (`fdr_bh`, `holm`, `bonferroni`, ...).
+
+    `n_tests` is the number of hypotheses that were searched, e.g. every pair screened
+    rather than only the pairs passed in; the untested ones count as p = 1, which is the
+    conservative choice. NaN p-values stay NaN.
+    """
+    p_values = np.asarray(p_values, dtype=float)
+    adjusted = np.full(len(p_values), np.nan)
+    finite = ~np.isnan(p_values)
+    n_tests = max(n_tests or 0, finite.sum())
+    if finite.any():
+        padded = np.concatenate((p_values[finite], np.ones(n_tests - finite.sum())))
+        adjusted[finite] = multipletests(padded, method=method)[1][:finite.sum()]
+    return adjusted
+
+def _batched_metrics(run_batch, n_paths, batch_size, periods_per_year):
+    """Concatenates `performance_matrix` over batches of paths so memory stays bounded."""
+    frames = []
+    for start in range(0, n_paths, batch_size):
+        values, positions = run_batch(start, min(start + batch_size, n_paths))
+        frames.append(performance_matrix(values, positions=positions, periods_per_year=periods_per_year))
+    return pd.concat(frames, ignore_index=True)
+
+def pair_robustness(price1, price2, flags, n_paths=1000, block_size=20, capital=100000, seed=None,
+                    batch_size=250, periods_per_year=252):
+    """Resampling tests of one pair strategy on its aligned price arrays.
+
+    `flags` are the four signal arrays (long/short entry, long/short exit) of the strategy.
+    Two sets of `n_paths` simulated backtests are run through `pair_backtest_batch`:
+
+    - permuted: the signals are block-permuted against the prices, which keeps how often
+      and how long the strategy trades but breaks any link between its signals and the
+      following price moves. The share of permuted Sharpe ratios at least as high as the
+      observed one is the permutation p-value.
+    - bootstrap: the strategy's own returns are block-bootstrapped into new equity paths,
+      giving the sampling distribution (and confidence intervals) of every metric. The
+      same resampling of the de-meaned returns gives a bootstrap p-value for Sharpe > 0.
+
+    Returns a dict with the observed metrics (Series), the permuted and bootstrap metric
+    distributions (DataFrames with one row per path) and the two p-values. A strategy
+    that never trades has no Sharpe ratio to test: its distributions are empty and its
+    p-values NaN.
+    """
+    rng = np.random.default_rng(seed)
+    flags = [np.asarray(flag, dtype=bool) for flag in flags]
+    n = len(price1)
+
+    values, positions, n_trades = pair_backtest_batch(price1, price2, *[flag[:, None] for flag in flags], capital)
+    observed = performance_matrix(values, positions=positions, periods_per_year=periods_per_year).iloc[0]
+    sharpe = observed['sharpe_ratio']
+    if n_trades[0] == 0 or np.isnan(sharpe):
+        empty = pd.DataFrame(columns=observed.index, dtype=float)
+        return {'observed': observed, 'permuted': empty, 'bootstrap': empty.copy(),
+                'permutation_p_value': np.nan, 'bootstrap_p_value': np.nan}
+
+    def permuted_batch(start, stop):
+        rows = block_permutation_indices(n, stop - start, block_size, rng)
+        values, positions, _ = pair_backtest_batch(price1, price2, *[flag[rows] for flag in flags], capital)
+        return values, positions
+
+    returns = values[1:, 0] / values[:-1, 0] - 1
+    # Positions are resampled with the returns so turnover stays meaningful
+    held = positions[1:, 0]
+
+    def bootstrap_batch(start, stop):
+        rows = block_bootstrap_indices(len(returns), stop - start, block_size, rng)
+        paths = np.empty((n, stop - start))
+        paths[0] = capital
+        paths[1:] = capital * np.cumprod(1 + returns[rows], axis=0)
+        return paths, np.vstack((np.zeros((1, stop - start)), held[rows]))
+
+    permuted = _batched_metrics(permuted_batch, n_paths, batch_size, periods_per_year)
+    bootstrap = _batched_metrics(bootstrap_batch, n_paths, batch_size, periods_per_year)
+
+    # Null distribution of the Sharpe ratio: same resampling, returns shifted to mean zero
+    centered = returns - returns.mean()
+    null_sharpe = np.empty(n_paths)
+    for start in range(0, n_paths, batch_size):
+        resampled = centered[block_bootstrap_indices(len(returns), min(batch_size, n_paths - start), block_size,
+                                                     rng)]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            null_sharpe[start:start + batch_size] = (resampled.mean(axis=0) / resampled.std(axis=0)
+                                                     * np.sqrt(periods_per_year))
+
+    return {
+        'observed': observed,
+        'permuted': permuted,
+        'bootstrap': bootstrap,
+        'permutation_p_value': (1 + np.sum(permuted['sharpe_ratio'].to_numpy() >= sharpe)) / (n_paths + 1),
+        'bootstrap_p_value': (1 + np.sum(null_sharpe >= sharpe)) / (n_paths + 1),
+    }
+
+def _pair_flags(both, asset1_ticker, asset2_ticker, entry_zscore, exit_zscore, window):
+    """Price arrays and signal flags of the z-score strategy on a pair's common bars."""
+    _, spread = calculate_hedge_ratio_and_spread(both[asset1_ticker], both[asset2_ticker])
+    signals = generate_signals(spread, entry_zscore=entry_zscore, exit_zscore=exit_zscore, window=window)
+    flags = [signals[col].to_numpy(dtype=bool) for col in ('long_entry', 'short_entry', 'long_exit', 'short_exit')]
+    return both[asset1_ticker].to_numpy(dtype=float), both[asset2_ticker].to_numpy(dtype=float), flags
+
+def _summarize(result, confidence):
+    bootstrap_sharpe = result['bootstrap']['sharpe_ratio']
+    tail = (1 - confidence) / 2
+    return {
+        'sharpe_ratio': result['observed']['sharpe_ratio'],
+        'sharpe_ci_low': bootstrap_sharpe.quantile(tail),
+        'sharpe_ci_high': bootstrap_sharpe.quantile(1 - tail),
+        'total_return': result['observed']['total_return'],
+        'permuted_sharpe_median': result['permuted']['sharpe_ratio'].median(),
+        'permutation_p_value': result['permutation_p_value'],
+        'bootstrap_p_value': result['bootstrap_p_value'],
+    }
+
+def _pair_prices(prices, rows, i, j):
+    """The (rows x 2) prices of columns i and j; only those two columns are gathered."""
+    return np.column_stack((prices[rows, i], prices[rows, j]))
+
+def _robustness_worker(prices_spec, columns, i, j, rows, dates, seed, params):
+    """Process-pool entry point: runs `pair_robustness` for one pair of the shared price matrix."""
+    shm, prices = attach_shared_array(prices_spec)
+    try:
+        both = pd.DataFrame(_pair_prices(prices, rows, i, j), index=dates, columns=[columns[i], columns[j]])
+        return _run_pair(both, columns[i], columns[j], seed, **params)
+    finally:
+        del prices
+        shm.close()
+
+def _run_pair(both, asset1_ticker, asset2_ticker, seed, entry_zscore, exit_zscore, window, min_obs, confidence,
+              **kwargs):
+    if len(both) < min_obs:
+        return None
+    price1, price2, flags = _pair_flags(both, asset1_ticker, asset2_ticker, entry_zscore, exit_zscore, window)
+    return _summarize(pair_robustness(price1, price2, flags, seed=seed, **kwargs), confidence)
+
+def robustness_test(stock_data, pairs, n_paths=1000, block_size=20, n_jobs=1, seed=0, entry_zscore=2.0,
+                    exit_zscore=0.0, window=60, min_obs=60, capital=100000, confidence=0.95, method='fdr_bh',
+                    n_tests=None, significance_level=0.05, batch_size=250, periods_per_year=252):
+    """Tests which screened pairs trade better than chance, correcting for the size of the search.
+
+    Every pair runs the `PortfolioBacktester` workflow (hedge ratio and z-score signals on
+    its common bars) through `pair_robustness`. Pairs are spread over `n_jobs` processes
+    that read the price matrix from shared memory; each pair gets its own random stream
+    derived from `seed`, so results do not depend on `n_jobs`. The permutation p-values
+    are then adjusted with `adjust_p_values`; pass the number of pairs screened as
+    `n_tests` to account for the whole search, not just the pairs that passed it.
+    Returns a DataFrame with one row per pair.
+    """
+    columns = list(stock_data.columns)
+    positions = {ticker: k for k, ticker in enumerate(columns)}
+    prices = stock_data.to_numpy(dtype=float)
+    index = stock_data.index
+    alignment = stock_data.alignment if isinstance(stock_data, PricePanel) else AlignmentIndex.from_prices(prices)
+    pair_rows = [alignment.common_rows(positions[asset1_ticker], positions[asset2_ticker])
+                 for asset1_ticker, asset2_ticker, *_ in pairs]
+    seeds = np.random.SeedSequence(seed).spawn(len(pairs))
+    params = dict(entry_zscore=entry_zscore, exit_zscore=exit_zscore, window=window, min_obs=min_obs,
+                  confidence=confidence, n_paths=n_paths, block_size=block_size, capital=capital,
+                  batch_size=batch_size, periods_per_year=periods_per_year)
+
+    n_jobs = (os.cpu_count() or 1) if n_jobs == -1 else n_jobs
+    if n_jobs > 1 and len(pairs) > 1:
+        shm, spec = share_array(prices)
+        try:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [executor.submit(_robustness_worker, spec, columns, positions[pair[0]], positions[pair[1]],
+                                           rows, index[rows], pair_seed, params)
+                           for pair, rows, pair_seed in zip(pairs, pair_rows, seeds)]
+                results = [future.result() for future in futures]
+        finally:
+            shm.close()
+            shm.unlink()
+    else:
+        results = []
+        for (asset1_ticker, asset2_ticker, *_), rows, pair_seed in zip(pairs, pair_rows, seeds):
+            i, j = positions[asset1_ticker], positions[asset2_ticker]
+            both = pd.DataFrame(_pair_prices(prices, rows, i, j), index=index[rows],
+                                columns=[asset1_ticker, asset2_ticker])
+            results.append(_run_pair(both, asset1_ticker, asset2_ticker, pair_seed, **params))
+
+    table = pd.DataFrame([{'asset1': pair[0], 'asset2': pair[1], **(result or {})}
+                          for pair, result in zip(pairs, results)])
+    for column in ('sharpe_ratio', 'permutation_p_value', 'bootstrap_p_value'):
+        if column not in table:
+            table[column] = np.nan
+    table['adjusted_p_value'] = adjust_p_values(table['permutation_p_value'], method=method, n_tests=n_tests)
+    table['significant'] = table['adjusted_p_value'] < significance_level
+    return table
+
+if __name__ == "__main__":
+    data_dir = get_data_dir()
+    data_file_path = os.path.join(data_dir, "sp500_adj_close.csv")
+    stock_data = load_data(data_file_path)
+
+    # Demonstrate with a hardcoded pair, counting the whole screen as the number of tests
+    n_tickers = stock_data.shape[1]
+    results = robustness_test(stock_data, [("AMZN", "NVDA")], n_paths=1000, n_jobs=-1,
+                              n_tests=n_tickers * (n_tickers - 1) // 2)
+    print(results.to_string(index=False))
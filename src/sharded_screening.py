@@ -0,0 +1,315 @@
+import pandas as pd
+import numpy as np
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import load_data, get_data_dir, share_array, attach_shared_array
+from alignment import AlignmentIndex
+from price_panel import PricePanel
+from cointegration import engle_granger_pvalues
+from result_cache import hash_array
+
+MANIFEST_FILE = "manifest.json"
+SHARD_DIR = "shards"
+
+def shard_bounds(n_pairs, n_shards):
+    """Splits pair positions 0..n_pairs into `n_shards` contiguous, deterministic ranges."""
+    edges = np.linspace(0, n_pairs, n_shards + 1).round().astype(np.int64)
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+def shard_pairs(n_tickers, start, stop):
+    """The (i, j) column pairs at positions [start, stop) of the upper-triangle pair order.
+
+    Pair positions follow `np.triu_indices(n_tickers, k=1)`, the order of the full scan in
+    `find_cointegrated_pairs`; rows are located in closed form so no shard has to build
+    the whole pair list.
+    """
+    positions = np.arange(start, stop, dtype=np.int64)
+    n = n_tickers
+    # Row i starts at position i * (2n - i - 1) / 2; invert that and correct float rounding
+    i = np.floor(((2 * n - 1) - np.sqrt((2 * n - 1) ** 2 - 8.0 * positions)) / 2).astype(np.int64)
+    i -= positions < i * (2 * n - i - 1) // 2
+    i += positions >= (i + 1) * (2 * n - i - 2) // 2
+    j = positions - i * (2 * n - i - 1) // 2 + i + 1
+    return np.column_stack((i, j)).astype(np.intp)
+
+def data_fingerprint(data):
+    """Content hash of the prices and tickers, so every worker can check it screens the same data."""
+    return hash_array(np.ascontiguousarray(data.to_numpy(dtype=float))) + ":" + hash_array(
+        np.array([str(t) for t in data.columns]))
+
+def _shard_path(run_dir, shard):
+    return os.path.join(run_dir, SHARD_DIR, f"shard_{shard:05d}.npy")
+
+def _lock_path(run_dir, shard):
+    return os.path.join(run_dir, SHARD_DIR, f"shard_{shard:05d}.lock")
+
+def init_run(data, run_dir, n_shards=64, min_obs=20, data_path=None):
+    """Creates (or reopens) a sharded screening run in `run_dir` and returns its manifest.
+
+    The manifest fixes the tickers, a fingerprint of the data, the shard boundaries and
+    the test settings, so every worker and every restart splits the pair space the same
+    way. Reopening a run with different data or settings raises ValueError instead of
+    mixing results.
+    """
+    n_pairs = len(data.columns) * (len(data.columns) - 1) // 2
+    manifest = {
+        'tickers': [str(t) for t in data.columns],
+        'fingerprint': data_fingerprint(data),
+        'n_pairs': n_pairs,
+        'shards': shard_bounds(n_pairs, n_shards),
+        'min_obs': min_obs,
+        'data_path': data_path,
+    }
+    path = os.path.join(run_dir, MANIFEST_FILE)
+    if os.path.exists(path):
+        existing = load_manifest(run_dir)
+        for key in ('tickers', 'fingerprint', 'shards', 'min_obs'):
+            if existing[key] != manifest[key]:
+                raise ValueError(f"Run in {run_dir} was started with a different {key}; use a new run directory")
+        return existing
+
+    os.makedirs(os.path.join(run_dir, SHARD_DIR), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+    return manifest
+
+def load_manifest(run_dir):
+    with open(os.path.join(run_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    manifest['shards'] = [tuple(bounds) for bounds in manifest['shards']]
+    return manifest
+
+def _worker_id():
+    """Identifies one worker across hosts sharing the run directory."""
+    return f"{socket.gethostname()} {os.getpid()} {uuid.uuid4().hex}"
+
+def _lock_owner(lock):
+    try:
+        with open(lock) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+def _take_lock(lock, owner):
+    """Removes `lock` if `owner` holds it, and returns whether it did.
+
+    The lock is first renamed to a name no other worker uses, which only one worker can
+    do, and its owner is checked on the renamed file. A lock that turns out to belong to
+    someone else is put back (without overwriting a newer one).
+    """
+    taken = f"{lock}.{uuid.uuid4().hex}.taken"
+    try:
+        os.rename(lock, taken)
+    except FileNotFoundError:
+        return False
+    if _lock_owner(taken) != owner:
+        try:
+            os.link(taken, lock)
+        except OSError:
+            pass
+        os.remove(taken)
+        return False
+    os.remove(taken)
+    return True
+
+def _claim(run_dir, shard, stale_after, worker_id):
+    """Takes the lock of a shard for `worker_id`. Locks not refreshed for `stale_after` seconds are abandoned."""
+    lock = _lock_path(run_dir, shard)
+    for _ in range(2):
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            owner = _lock_owner(lock)
+            try:
+                if time.time() - os.path.getmtime(lock) < stale_after:
+                    return False
+            except FileNotFoundError:
+                continue
+            # Only the worker that removes this owner's lock goes on to claim the shard
+            if owner is None or not _take_lock(lock, owner):
+                return False
+            continue
+        with os.fdopen(fd, 'w') as f:
+            f.write(f"{worker_id}\n")
+        return True
+    return False
+
+def _release(run_dir, shard, worker_id):
+    """Removes the lock of a shard if this worker still holds it."""
+    _take_lock(_lock_path(run_dir, shard), worker_id)
+
+class _Heartbeat:
+    """Refreshes the modification time of a held lock so long-running shards are not taken over."""
+
+    def __init__(self, lock, worker_id, interval):
+        self.lock = lock
+        self.worker_id = worker_id
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if _lock_owner(self.lock) != self.worker_id:
+                return
+            try:
+                os.utime(self.lock)
+            except FileNotFoundError:
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def run_shard(prices, run_dir, manifest, shard, alignment=None):
+    """Screens one shard and writes its p-values to the shard's checkpoint file."""
+    start, stop = manifest['shards'][shard]
+    pairs = shard_pairs(len(manifest['tickers']), start, stop)
+    p_values = engle_granger_pvalues(prices, pairs, min_obs=manifest['min_obs'], alignment=alignment)
+    path = _shard_path(run_dir, shard)
+    tmp_path = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, p_values)
+    os.replace(tmp_path, path)
+    return len(pairs)
+
+def run_worker(data, run_dir, stale_after=3600, max_shards=None):
+    """Processes pending shards of a run until none are left (or `max_shards` are done).
+
+    Any number of workers, on one machine or on hosts sharing `run_dir`, can run at once:
+    each shard is claimed with an exclusive lock file before it is screened, and finished
+    shards are skipped, so an interrupted run continues from the completed checkpoints.
+    The lock holds the worker's id and is refreshed while its shard runs; a lock left by
+    a worker that died is taken over after `stale_after` seconds.
+    Returns the number of shards this worker completed.
+    """
+    manifest = load_manifest(run_dir)
+    if data_fingerprint(data) != manifest['fingerprint']:
+        raise ValueError(f"Data does not match the run in {run_dir}")
+    prices = data.to_numpy(dtype=float)
+    alignment = data.alignment if isinstance(data, PricePanel) else AlignmentIndex.from_prices(prices)
+
+    worker_id = _worker_id()
+    done = 0
+    for shard in range(len(manifest['shards'])):
+        if max_shards is not None and done >= max_shards:
+            break
+        if os.path.exists(_shard_path(run_dir, shard)) or not _claim(run_dir, shard, stale_after, worker_id):
+            continue
+        try:
+            if not os.path.exists(_shard_path(run_dir, shard)):
+                with _Heartbeat(_lock_path(run_dir, shard), worker_id, stale_after / 4):
+                    run_shard(prices, run_dir, manifest, shard, alignment)
+                done += 1
+        finally:
+            _release(run_dir, shard, worker_id)
+    return done
+
+def run_status(run_dir):
+    """Counts of completed, claimed and pending shards of a run."""
+    manifest = load_manifest(run_dir)
+    status = {'completed': 0, 'claimed': 0, 'pending': 0}
+    for shard in range(len(manifest['shards'])):
+        if os.path.exists(_shard_path(run_dir, shard)):
+            status['completed'] += 1
+        elif os.path.exists(_lock_path(run_dir, shard)):
+            status['claimed'] += 1
+        else:
+            status['pending'] += 1
+    return status
+
+def merge_results(run_dir, significance_level=0.05):
+    """Combines all shard checkpoints into the final pair list, ranked by p-value.
+
+    Returns (asset1, asset2, p_value) tuples like `find_cointegrated_pairs`, lowest
+    p-value first. Raises RuntimeError if any shard is not finished yet.
+    """
+    manifest = load_manifest(run_dir)
+    missing = [shard for shard in range(len(manifest['shards'])) if not os.path.exists(_shard_path(run_dir, shard))]
+    if missing:
+        raise RuntimeError(f"{len(missing)} shard(s) not finished yet, e.g. {missing[:5]}")
+
+    tickers = manifest['tickers']
+    pairs = []
+    for shard, (start, stop) in enumerate(manifest['shards']):
+        p_values = np.load(_shard_path(run_dir, shard))
+        for (i, j), p_value in zip(shard_pairs(len(tickers), start, stop), p_values):
+            if p_value < significance_level:
+                pairs.append((tickers[i], tickers[j], float(p_value)))
+    pairs.sort(key=lambda pair: pair[2])
+    return pairs
+
+def _local_worker(spec, columns, run_dir, stale_after):
+    shm, prices = attach_shared_array(spec)
+    try:
+        data = pd.DataFrame(prices, columns=columns, copy=False)
+        return run_worker(data, run_dir, stale_after=stale_after)
+    finally:
+        del prices
+        shm.close()
+
+def run_local(data, run_dir, n_workers=None, n_shards=64, min_obs=20, significance_level=0.05,
+              stale_after=3600):
+    """Runs a whole sharded screening on this machine and returns the merged pair list.
+
+    The price matrix is shared with `n_workers` processes (default: all cores), which work
+    through the shards like remote workers would. Re-running after an interruption only
+    screens the shards that have no checkpoint yet.
+    """
+    init_run(data, run_dir, n_shards=n_shards, min_obs=min_obs)
+    n_workers = n_workers or os.cpu_count() or 1
+    if n_workers == 1:
+        run_worker(data, run_dir, stale_after=stale_after)
+    else:
+        shm, spec = share_array(data.to_numpy(dtype=float))
+        try:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                futures = [executor.submit(_local_worker, spec, list(data.columns), run_dir, stale_after)
+                           for _ in range(n_workers)]
+                for future in futures:
+                    future.result()
+        finally:
+            shm.close()
+            shm.unlink()
+    return merge_results(run_dir, significance_level=significance_level)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded, resumable cointegration screening.")
+    parser.add_argument('command', choices=['init', 'worker', 'local', 'status', 'merge'])
+    parser.add_argument('--run-dir', default=os.path.join(get_data_dir(), "screening_run"))
+    parser.add_argument('--data', default=os.path.join(get_data_dir(), "sp500_adj_close.csv"))
+    parser.add_argument('--shards', type=int, default=64)
+    parser.add_argument('--jobs', type=int, default=None, help="Local worker processes (default: all cores)")
+    parser.add_argument('--significance', type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.command in ('status', 'merge'):
+        if args.command == 'status':
+            print(run_status(args.run_dir))
+        else:
+            for asset1, asset2, p_value in merge_results(args.run_dir, args.significance):
+                print(f"  {asset1} - {asset2} (p-value: {p_value:.4f})")
+    else:
+        stock_data = load_data(args.data)
+        if args.command == 'init':
+            manifest = init_run(stock_data, args.run_dir, n_shards=args.shards, data_path=os.path.abspath(args.data))
+            print(f"Run with {manifest['n_pairs']} pairs in {len(manifest['shards'])} shards at {args.run_dir}")
+        elif args.command == 'worker':
+            print(f"Completed {run_worker(stock_data, args.run_dir)} shard(s)")
+        else:
+            pairs = run_local(stock_data, args.run_dir, n_workers=args.jobs, n_shards=args.shards,
+                              significance_level=args.significance)
+            print(f"Found {len(pairs)} cointegrated pairs")
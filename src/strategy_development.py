@@ -1,9 +1,11 @@
 import pandas as pd
 import numpy as np
 import statsmodels.api as sm
+import datetime
 import os
 
 from utils import load_data, get_data_dir
+from bar_frequency import infer_frequency
 
 def calculate_hedge_ratio_and_spread(series1, series2):
     """Calculates the hedge ratio (beta) and spread using OLS regression."""
@@ -14,14 +16,54 @@ def calculate_hedge_ratio_and_spread(series1, series2):
     spread = series1 - beta * series2
     return beta, spread
 
-def generate_signals(spread, entry_zscore=2.0, exit_zscore=0.0):
-    """Generates trading signals based on the z-score of the spread."""
-    # Use a rolling window to calculate z-scores
-    window = 60
-    rolling_mean = spread.rolling(window=window).mean()
-    rolling_std = spread.rolling(window=window).std()
-    
-    z_score = (spread - rolling_mean) / rolling_std
+def time_window(window):
+    """Checks a z-score window that is not a bar count and returns it as a Timedelta."""
+    if not isinstance(window, (str, pd.Timedelta, datetime.timedelta, np.timedelta64)):
+        raise TypeError(f"window must be a number of bars (int) or a time span such as '30D', "
+                        f"not {type(window).__name__}: {window!r}")
+    window = pd.Timedelta(window)
+    if window <= pd.Timedelta(0):
+        raise ValueError(f"Time window must be positive: {window}")
+    return window
+
+def check_window(window, index):
+    """Validates a z-score window for bars at `index` (see `rolling_zscore`); returns an int or a Timedelta."""
+    if isinstance(window, (int, np.integer)):
+        if window < 2:
+            raise ValueError(f"Window must be at least 2 bars: {window}")
+        return int(window)
+    window = time_window(window)
+    bar = infer_frequency(index)
+    if len(index) > 1 and window <= bar:
+        raise ValueError(f"Window {window} does not span more than one bar of {bar}")
+    return window
+
+def rolling_zscore(spread, window=60, start=None):
+    """Z-score of the spread against its trailing mean and standard deviation.
+
+    `window` is a number of bars, or a time span such as '2h' or '30D' (any pandas offset)
+    for a window that covers the same stretch of time whatever the bar frequency and
+    across overnight gaps. A time window needs a DatetimeIndex and, like a bar window,
+    gives NaN until the data covers one full window from `start` (default: the first bar).
+    Floats are rejected rather than read as nanoseconds. A window must hold at least two
+    bars, since a shorter one has no standard deviation: bar counts below 2 and time
+    windows no longer than one bar of the index raise ValueError.
+    """
+    window = check_window(window, spread.index)
+    if isinstance(window, int):
+        rolling = spread.rolling(window=window)
+        return (spread - rolling.mean()) / rolling.std()
+    rolling = spread.rolling(window=window)
+    z_score = (spread - rolling.mean()) / rolling.std()
+    start = spread.index[0] if start is None else pd.Timestamp(start)
+    return z_score.where(spread.index >= start + window)
+
+def generate_signals(spread, entry_zscore=2.0, exit_zscore=0.0, window=60):
+    """Generates trading signals based on the z-score of the spread.
+
+    `window` is a number of bars or a time span (see `rolling_zscore`).
+    """
+    z_score = rolling_zscore(spread, window)
     
     signals = pd.DataFrame(index=spread.index)
     signals['long_entry'] = z_score < -entry_zscore
@@ -31,6 +73,100 @@ def generate_signals(spread, entry_zscore=2.0, exit_zscore=0.0):
     
     return signals
 
+class OnlineSignalGenerator:
+    """Bar-by-bar version of `generate_signals` for live trading.
+
+    Keeps the last `window` spread values in a ring buffer with a running mean and sum of
+    squared deviations (Welford's method with removal), so each `update` is O(1) instead
+    of recomputing the rolling window over the whole history. The hedge ratio `beta` is
+    an attribute and can be changed between bars, e.g. from a walk-forward estimator.
+    `window` is a number of bars; convert a time span with `bar_frequency.window_bars`.
+    """
+
+    def __init__(self, beta, window=60, entry_zscore=2.0, exit_zscore=0.0):
+        if not isinstance(window, (int, np.integer)):
+            raise TypeError(f"OnlineSignalGenerator needs a window in bars (int), not {window!r}; "
+                            f"convert a time span with bar_frequency.window_bars")
+        if window < 2:
+            raise ValueError(f"Window must be at least 2 bars: {window}")
+        self.beta = beta
+        self.window = window
+        self.entry_zscore = entry_zscore
+        self.exit_zscore = exit_zscore
+        self.buffer = np.full(window, np.nan)
+        self.position = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.removals = 0
+
+    def _add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def _remove(self, value):
+        if self.count == 1:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        old_mean = self.mean
+        self.count -= 1
+        self.mean = (old_mean * (self.count + 1) - value) / self.count
+        self.m2 = max(self.m2 - (value - old_mean) * (value - self.mean), 0.0)
+
+    def _resync(self):
+        """Recomputes the running statistics from the buffer to stop rounding drift."""
+        values = self.buffer[~np.isnan(self.buffer)]
+        self.count = len(values)
+        self.mean = values.mean() if self.count else 0.0
+        self.m2 = ((values - self.mean) ** 2).sum() if self.count else 0.0
+
+    def update_spread(self, spread):
+        """Adds one spread value and returns the signal flags and z-score for this bar."""
+        spread = float(spread)
+        old = self.buffer[self.position]
+        if not np.isnan(old):
+            self._remove(old)
+            self.removals += 1
+        self.buffer[self.position] = spread
+        self.position = (self.position + 1) % self.window
+        if not np.isnan(spread):
+            self._add(spread)
+        if self.removals >= self.window:
+            self.removals = 0
+            self._resync()
+
+        # Like rolling(window), the z-score needs a full window without gaps
+        z_score = np.nan
+        if self.count == self.window and self.window > 1:
+            std = np.sqrt(self.m2 / (self.window - 1))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                z_score = (spread - self.mean) / std
+        return {
+            'long_entry': bool(z_score < -self.entry_zscore),
+            'short_entry': bool(z_score > self.entry_zscore),
+            'long_exit': bool(z_score >= self.exit_zscore),
+            'short_exit': bool(z_score <= self.exit_zscore),
+            'z_score': z_score,
+        }
+
+    def update(self, price1, price2):
+        """Adds one bar of prices and returns the signal flags and z-score for it."""
+        return self.update_spread(price1 - self.beta * price2)
+
+def replay_signals(spread, entry_zscore=2.0, exit_zscore=0.0, window=60):
+    """Feeds a spread through `OnlineSignalGenerator` and returns the same frame as `generate_signals`.
+
+    Like the generator, it takes `window` in bars only.
+    """
+    generator = OnlineSignalGenerator(beta=0.0, window=window, entry_zscore=entry_zscore,
+                                      exit_zscore=exit_zscore)
+    rows = [generator.update_spread(value) for value in spread.to_numpy(dtype=float)]
+    signals = pd.DataFrame(rows, index=spread.index,
+                           columns=['long_entry', 'short_entry', 'long_exit', 'short_exit'])
+    return signals.astype(bool)
+
 if __name__ == "__main__":
     data_dir = get_data_dir()
     data_file_path = os.path.join(data_dir, "sp500_adj_close.csv")
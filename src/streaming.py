@@ -0,0 +1,119 @@
+import pandas as pd
+import numpy as np
+import os
+
+from utils import get_data_dir
+from price_panel import PricePanel
+from strategy_development import rolling_zscore
+from backtesting_engine import pair_backtest_kernel
+from bar_frequency import infer_frequency, periods_per_year
+from performance_analysis import performance_matrix
+
+def iter_signals(data, asset1_ticker, asset2_ticker, beta, window=60, entry_zscore=2.0, exit_zscore=0.0,
+                 chunk_rows=1_000_000, start=None, end=None):
+    """Generates the z-score signals of a pair chunk by chunk, for series too long to hold in memory.
+
+    The spread `price1 - beta * price2` is computed on each block of `chunk_rows` bars from
+    `PricePanel.iter_chunks` (a memory-mapped panel reads only the current block). Only the
+    tail of the spread the rolling window still needs is carried from block to block, so
+    the z-scores equal those of `generate_signals` on the whole spread, up to rounding.
+    `window` is a number of bars or a time span (see `rolling_zscore`).
+    Yields (dates, prices, valid, z_score, flags) per block: the block's (bars x 2) prices,
+    the bars where both prices are present, and the four signal arrays (long/short entry,
+    long/short exit) over all bars of the block, False where either price is missing.
+    """
+    if not isinstance(data, PricePanel):
+        data = PricePanel.from_frame(data[[asset1_ticker, asset2_ticker]])
+    tail = pd.Series(dtype=float, index=pd.DatetimeIndex([]))
+    first_date = None
+    for dates, block, valid in data.iter_chunks(chunk_rows, tickers=[asset1_ticker, asset2_ticker], start=start,
+                                                end=end):
+        both = valid.all(axis=1)
+        spread = pd.Series(block[both, 0].astype(float) - beta * block[both, 1].astype(float), index=dates[both])
+        if first_date is None and len(spread):
+            first_date = spread.index[0]
+        combined = pd.concat([tail, spread]) if len(tail) else spread
+        z_score = np.full(len(dates), np.nan)
+        if len(combined):
+            z_score[both] = rolling_zscore(combined, window, start=first_date).to_numpy()[len(tail):]
+            if isinstance(window, (int, np.integer)):
+                tail = combined.iloc[-(window - 1):] if window > 1 else combined.iloc[:0]
+            else:
+                tail = combined[combined.index > combined.index[-1] - pd.Timedelta(window)]
+        flags = [both & (z_score < -entry_zscore), both & (z_score > entry_zscore),
+                 both & (z_score >= exit_zscore), both & (z_score <= exit_zscore)]
+        yield dates, block, both, z_score, flags
+
+def stream_pair_backtest(data, asset1_ticker, asset2_ticker, beta, window=60, entry_zscore=2.0, exit_zscore=0.0,
+                         initial_capital=100000, chunk_rows=1_000_000, start=None, end=None, out=None):
+    """Backtests a pair over an arbitrarily long bar series in streamed chunks.
+
+    Signals come from `iter_signals`, and each block is run through `pair_backtest_kernel`
+    with the capital, shares and open position carried over from the previous block, so
+    the portfolio values equal one `Backtester.run_backtest` over the whole range. With a
+    fixed hedge ratio `beta` nothing larger than one block is built in memory except the
+    output: `out` may be an array to fill, or a path to write the values to as a
+    memory-mapped .npy file.
+    Returns (portfolio values, (capital, shares1, shares2, in_trade), trades), with trades
+    as (entry bar, exit bar or None, side) positions in the range.
+    """
+    if not isinstance(data, PricePanel):
+        data = PricePanel.from_frame(data[[asset1_ticker, asset2_ticker]])
+    n = len(range(*data.date_slice(start, end).indices(len(data))))
+    if isinstance(out, str):
+        out = np.lib.format.open_memmap(out, mode='w+', dtype=np.float64, shape=(n,))
+    values = np.empty(n) if out is None else out
+
+    state = (initial_capital, 0.0, 0.0, False)
+    trades = []
+    pos = 0
+    for dates, prices, both, _, flags in iter_signals(data, asset1_ticker, asset2_ticker, beta, window,
+                                                      entry_zscore, exit_zscore, chunk_rows, start, end):
+        price1 = np.where(both, prices[:, 0].astype(float), np.nan)
+        price2 = np.where(both, prices[:, 1].astype(float), np.nan)
+        if pos == 0:
+            block_values, state, block_trades = pair_backtest_kernel(price1, price2, *flags, *state)
+            offset = 0
+        else:
+            # The kernel treats its first bar as the starting bar, so a placeholder bar is put
+            # in front and every bar of the block is traded
+            capital, shares1, shares2, in_trade = state
+            if in_trade:
+                exits = flags[2] if shares1 > 0 else flags[3]
+                exit_bars = np.flatnonzero(exits) if shares1 != 0 else []
+                if len(exit_bars) and trades:
+                    trades[-1][1] = pos + exit_bars[0]
+            block_values, state, block_trades = pair_backtest_kernel(
+                np.concatenate(([np.nan], price1)), np.concatenate(([np.nan], price2)),
+                *[np.concatenate(([False], flag)) for flag in flags], *state)
+            block_values = block_values[1:]
+            # Bars before the first valid one carry the last value of the previous block
+            first_valid = np.argmax(both) if both.any() else len(both)
+            block_values[:first_valid] = values[pos - 1]
+            offset = -1
+        values[pos:pos + len(dates)] = block_values
+        trades.extend([pos + entry + offset, None if exit_bar is None else pos + exit_bar + offset, side]
+                      for entry, exit_bar, side in block_trades)
+        pos += len(dates)
+    return values, state, [tuple(trade) for trade in trades]
+
+if __name__ == "__main__":
+    from scipy.signal import lfilter
+
+    # Two years of 1-minute bars (about 200k) for a synthetic cointegrated pair
+    rng = np.random.default_rng(1)
+    n_bars = 2 * 252 * 390
+    dates = pd.date_range("2024-01-02 09:30", periods=n_bars, freq="1min")
+    price2 = 100 * np.exp(np.cumsum(rng.normal(0, 0.0005, n_bars)))
+    spread = lfilter([1.0], [1.0, -0.995], rng.normal(0, 0.05, n_bars))
+    stock_data = pd.DataFrame({'AAA': 1.5 * price2 + spread + 10, 'BBB': price2}, index=dates)
+    panel = PricePanel.from_frame(stock_data)
+    beta = np.polyfit(stock_data['BBB'], stock_data['AAA'], 1)[0]
+
+    out_path = os.path.join(get_data_dir(), "streamed_portfolio_value.npy")
+    values, state, trades = stream_pair_backtest(panel, 'AAA', 'BBB', beta, window='1D', chunk_rows=50_000,
+                                                 out=out_path)
+    frequency = infer_frequency(panel.index)
+    metrics = performance_matrix(values, periods_per_year=periods_per_year(frequency)).iloc[0]
+    print(f"{len(values)} bars of {frequency}, {len(trades)} trades, final value {values[-1]:.2f}, "
+          f"Sharpe {metrics['sharpe_ratio']:.2f}")
@@ -1,16 +1,74 @@
 import pandas as pd
+import numpy as np
 import os
+from multiprocessing import shared_memory
 
-def load_data(file_path):
-    """Loads historical adjusted close price data from a CSV file."""
+from price_store import (PriceStore, default_store_path, is_price_store, store_is_current,
+                         write_price_store)
+
+def read_price_csv(file_path):
+    """Parses a historical adjusted close price CSV into a (dates x tickers) frame."""
     data = pd.read_csv(file_path, index_col=0, parse_dates=True, low_memory=False, skiprows=2, header=0)
-    # Ensure all columns are numeric, coercing errors to NaN
-    for col in data.columns:
+    # Ensure all columns are numeric, coercing errors to NaN. Columns read_csv already
+    # parsed as numbers are left alone, so only the odd malformed column is converted.
+    for col in data.columns[~data.dtypes.map(pd.api.types.is_numeric_dtype)]:
         data[col] = pd.to_numeric(data[col], errors='coerce')
     # Drop columns that are entirely NaN (e.g., tickers with no data)
     data.dropna(axis=1, how='all', inplace=True)
     return data
 
+def write_price_csv(data, file_path):
+    """Writes a (dates x tickers) price frame in the CSV layout `read_price_csv` expects.
+
+    The two leading header rows match the (Price, Ticker) column levels that yfinance
+    downloads used to carry, followed by the Date/ticker header and the price rows.
+    """
+    with open(file_path, "w", newline="") as f:
+        f.write("Price," + ",".join(map(str, data.columns)) + "\n")
+        f.write("Ticker," + ",".join(map(str, data.columns)) + "\n")
+        data.rename_axis("Date").to_csv(f)
+
+def load_data(file_path, use_store=True):
+    """Loads historical adjusted close price data from a CSV file or a binary price store.
+
+    `file_path` may be a price store directory. For a CSV, the binary store next to it
+    (see `price_store`) is used when it is up to date; otherwise the CSV is parsed and, with
+    `use_store`, converted once so later runs skip the CSV parse.
+    """
+    if is_price_store(file_path):
+        return PriceStore(file_path).load()
+    store_path = default_store_path(file_path)
+    if use_store and store_is_current(store_path, file_path):
+        return PriceStore(store_path).load()
+
+    data = read_price_csv(file_path)
+    if use_store:
+        try:
+            write_price_store(data, store_path)
+        except OSError:
+            pass  # Read-only data directory: keep working from the CSV
+    return data
+
 def get_data_dir():
     """Returns the absolute path to the data directory."""
     return os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
+
+def share_array(array):
+    """Copies an array into shared memory and returns the segment and a picklable spec.
+
+    Worker processes rebuild the array with `attach_shared_array(spec)` instead of
+    receiving a pickled copy. The caller owns the segment and must close and unlink it.
+    """
+    array = np.asarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    shared[...] = array
+    spec = (shm.name, array.shape, array.dtype.str)
+    return shm, spec
+
+def attach_shared_array(spec):
+    """Attaches to an array created by `share_array`. Returns (segment, array)."""
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    return shm, array
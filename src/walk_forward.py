@@ -0,0 +1,126 @@
+import pandas as pd
+import numpy as np
+import os
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils import load_data, get_data_dir
+from cointegration import engle_granger_block
+from strategy_development import generate_signals
+from backtesting_engine import Backtester
+
+def rolling_hedge_ratio(series1, series2, window=None, min_obs=60):
+    """Estimates the OLS hedge ratio of series1 on series2 (with intercept) bar by bar.
+
+    Uses the trailing `window` bars, or every bar so far when `window` is None. The
+    regression is maintained through running sums of x, y, x^2 and xy, so each bar costs
+    O(1) regardless of the window length. The beta at bar t only uses data up to t; bars
+    with fewer than `min_obs` observations are NaN. Bars where either price is missing are
+    left out of the sums, so a gap only affects the windows that contain it.
+    """
+    x = series2.to_numpy(dtype=float)
+    y = series1.to_numpy(dtype=float)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    # Shift by the first observation so the running sums stay small (no look-ahead)
+    first = np.argmax(valid)
+    x = np.where(valid, x - x[first], 0.0)
+    y = np.where(valid, y - y[first], 0.0)
+    sums = [np.concatenate(([0.0], np.cumsum(v))) for v in (valid.astype(float), x, y, x * x, x * y)]
+
+    n = len(x)
+    end = np.arange(1, n + 1)
+    start = np.zeros(n, dtype=int) if window is None else np.maximum(end - window, 0)
+    count, sx, sy, sxx, sxy = (s[end] - s[start] for s in sums)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = (count * sxy - sx * sy) / (count * sxx - sx * sx)
+    beta[count < max(min_obs, 2)] = np.nan
+    return pd.Series(beta, index=series1.index, name='beta')
+
+def kalman_hedge_ratio(series1, series2, delta=1e-4, observation_variance=1e-3):
+    """Estimates a time-varying hedge ratio and intercept with a Kalman filter.
+
+    The state (beta, alpha) follows a random walk whose noise is set by `delta`. The
+    returned beta at bar t is the prediction made before seeing bar t, so it can be used
+    at t without look-ahead. Bars with a missing price only advance the prediction.
+    """
+    x = series2.to_numpy(dtype=float)
+    y = series1.to_numpy(dtype=float)
+    n = len(x)
+    state_noise = delta / (1 - delta) * np.eye(2)
+
+    betas = np.empty(n)
+    alphas = np.empty(n)
+    state = np.zeros(2)
+    covariance = np.zeros((2, 2))
+    for t in range(n):
+        # Predict
+        covariance = covariance + state_noise
+        betas[t], alphas[t] = state
+        if np.isnan(x[t]) or np.isnan(y[t]):
+            continue
+        # Update with the new bar
+        observation = np.array([x[t], 1.0])
+        error = y[t] - observation @ state
+        variance = observation @ covariance @ observation + observation_variance
+        gain = covariance @ observation / variance
+        state = state + gain * error
+        covariance = covariance - np.outer(gain, observation) @ covariance
+    return (pd.Series(betas, index=series1.index, name='beta'),
+            pd.Series(alphas, index=series1.index, name='alpha'))
+
+def walk_forward_spread(series1, series2, method='rolling', window=250, min_obs=60, delta=1e-4):
+    """Builds a spread with a hedge ratio that is re-estimated as time moves forward.
+
+    `method` is 'rolling' (trailing `window` bars), 'expanding' (all bars so far) or
+    'kalman'. The spread at bar t is series1 - beta * series2 with the beta estimated
+    through bar t - 1, so it can be passed straight to `generate_signals`.
+    Returns (beta, spread), both time-varying Series.
+    """
+    if method == 'rolling':
+        beta = rolling_hedge_ratio(series1, series2, window=window, min_obs=min_obs).shift(1)
+    elif method == 'expanding':
+        beta = rolling_hedge_ratio(series1, series2, window=None, min_obs=min_obs).shift(1)
+    elif method == 'kalman':
+        beta, _ = kalman_hedge_ratio(series1, series2, delta=delta)
+        beta.iloc[:min_obs] = np.nan
+    else:
+        raise ValueError(f"Unknown walk-forward method: {method}")
+    spread = series1 - beta * series2
+    return beta, spread
+
+def rolling_cointegration(series1, series2, window=250, step=20):
+    """Re-runs the Engle-Granger test on the trailing `window` bars every `step` bars.
+
+    All windows are tested in one batch. Returns a Series of p-values indexed by the last
+    date of each window.
+    """
+    x = series2.to_numpy(dtype=float)
+    y = series1.to_numpy(dtype=float)
+    ends = np.arange(window, len(x) + 1, step)
+    if len(ends) == 0:
+        return pd.Series(dtype=float, name='p_value')
+    # Column k of each view is the window ending at bar ends[k] - 1
+    x_windows = sliding_window_view(x, window)[ends - window].T
+    y_windows = sliding_window_view(y, window)[ends - window].T
+    _, p_values = engle_granger_block(y_windows, x_windows)
+    return pd.Series(p_values, index=series1.index[ends - 1], name='p_value')
+
+if __name__ == "__main__":
+    data_dir = get_data_dir()
+    data_file_path = os.path.join(data_dir, "sp500_adj_close.csv")
+    stock_data = load_data(data_file_path)
+
+    # Demonstrate with a hardcoded pair
+    asset1_ticker, asset2_ticker = "AMZN", "NVDA"
+    both = stock_data[[asset1_ticker, asset2_ticker]].dropna()
+
+    for method in ('rolling', 'expanding', 'kalman'):
+        beta, spread = walk_forward_spread(both[asset1_ticker], both[asset2_ticker], method=method)
+        signals = generate_signals(spread)
+        backtester = Backtester(initial_capital=100000)
+        portfolio_value = backtester.run_backtest(stock_data, signals, asset1_ticker, asset2_ticker)
+        print(f"{method:>9}: final beta {beta.iloc[-1]:.4f}, "
+              f"total return {(portfolio_value.iloc[-1] / backtester.initial_capital - 1) * 100:.2f}%")
+
+    p_values = rolling_cointegration(both[asset1_ticker], both[asset2_ticker])
+    print(f"\nRolling cointegration: significant in {(p_values < 0.05).mean() * 100:.1f}% of windows")
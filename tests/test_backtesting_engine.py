@@ -0,0 +1,61 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from backtesting_engine import Backtester
+from strategy_development import calculate_hedge_ratio_and_spread, generate_signals
+
+def _pair_data(n=400):
+    rng = np.random.default_rng(0)
+    price2 = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    price1 = 1.5 * price2 + rng.normal(0, 1, n) + 10
+    data = pd.DataFrame({'A': price1, 'B': price2}, index=pd.bdate_range("2020-01-01", periods=n))
+    # Gaps in either leg, including a late listing of A
+    data.iloc[:15, 0] = np.nan
+    data.iloc[[40, 41, 120, 250], 0] = np.nan
+    data.iloc[[90, 200, 201, 330], 1] = np.nan
+    return data
+
+def _run_both(data, signals, capital=100000):
+    fast = Backtester(initial_capital=capital)
+    loop = Backtester(initial_capital=capital)
+    fast_value = fast.run_backtest(data, signals, 'A', 'B')
+    loop_value = loop.run_backtest_loop(data, signals, 'A', 'B')
+    return fast, fast_value, loop, loop_value
+
+def _assert_same(fast, fast_value, loop, loop_value):
+    pd.testing.assert_series_equal(fast_value, loop_value, check_exact=True)
+    assert fast.trades == loop.trades
+    assert fast.positions == loop.positions
+    assert fast.capital == loop.capital
+    assert fast.in_trade == loop.in_trade
+
+def test_array_backtest_matches_loop_on_zscore_signals():
+    data = _pair_data()
+    both = data.dropna()
+    _, spread = calculate_hedge_ratio_and_spread(both['A'], both['B'])
+    signals = generate_signals(spread, entry_zscore=1.0, window=20)
+    fast, fast_value, loop, loop_value = _run_both(data, signals)
+    assert len(fast.trades) > 1
+    _assert_same(fast, fast_value, loop, loop_value)
+
+def test_array_backtest_matches_loop_with_open_position_at_end():
+    data = _pair_data()
+    rng = np.random.default_rng(1)
+    n = len(data)
+    signals = pd.DataFrame({
+        'long_entry': rng.random(n) < 0.05,
+        'short_entry': rng.random(n) < 0.05,
+        'long_exit': rng.random(n) < 0.1,
+        'short_exit': rng.random(n) < 0.1,
+    }, index=data.index)
+    # Enter on the last 40 bars and never exit, so a position is still open at the end
+    signals.iloc[-40:] = False
+    signals.iloc[-40, signals.columns.get_loc('short_entry')] = True
+    fast, fast_value, loop, loop_value = _run_both(data, signals)
+    assert fast.in_trade and fast.trades[-1][1] is None
+    _assert_same(fast, fast_value, loop, loop_value)
@@ -0,0 +1,51 @@
+import os
+import sys
+import warnings
+
+import numpy as np
+from statsmodels.tsa.stattools import coint
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cointegration import engle_granger_pvalues
+
+def _price_matrix(n=300, n_tickers=6):
+    rng = np.random.default_rng(0)
+    prices = 100 + np.cumsum(rng.normal(0, 1, (n, n_tickers)), axis=0)
+    # Two cointegrated pairs, so both small and large p-values are compared
+    prices[:, 1] = 1.3 * prices[:, 0] + rng.normal(0, 1, n)
+    prices[:, 3] = 0.7 * prices[:, 2] + rng.normal(0, 2, n)
+    # A late listing, and gaps inside the sample
+    prices[:80, 4] = np.nan
+    prices[[30, 31, 150, 220], 5] = np.nan
+    prices[[150, 260], 1] = np.nan
+    return prices
+
+def _statsmodels_pvalue(prices, i, j):
+    both = ~(np.isnan(prices[:, i]) | np.isnan(prices[:, j]))
+    return coint(prices[both, i], prices[both, j])[1]
+
+def test_pvalues_match_statsmodels_coint():
+    prices = _price_matrix()
+    pairs = [(i, j) for i in range(prices.shape[1]) for j in range(i + 1, prices.shape[1])]
+    p_values = engle_granger_pvalues(prices, pairs)
+    expected = [_statsmodels_pvalue(prices, i, j) for i, j in pairs]
+    np.testing.assert_allclose(p_values, expected, rtol=1e-6, atol=1e-10)
+
+def test_late_listing_is_tested_on_its_common_range():
+    prices = _price_matrix()
+    # Same pairs in another order and batch size, so the late-listed column is grouped differently
+    pairs = [(4, j) for j in (5, 0, 1, 2, 3)] + [(0, 1), (2, 3)]
+    p_values = engle_granger_pvalues(prices, pairs, block_size=2)
+    expected = [_statsmodels_pvalue(prices, i, j) for i, j in pairs]
+    np.testing.assert_allclose(p_values, expected, rtol=1e-6, atol=1e-10)
+
+def test_short_samples_do_not_warn():
+    prices = _price_matrix()
+    # Listed for exactly min_obs bars, where the longest ADF lag fits exactly, and one bar less
+    prices[:-20, 4] = np.nan
+    prices[:-19, 5] = np.nan
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', RuntimeWarning)
+        p_values = engle_granger_pvalues(prices, [(4, 0), (5, 0), (0, 1)], min_obs=20)
+    assert np.isnan(p_values[1]) and not np.isnan(p_values[2])
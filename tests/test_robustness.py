@@ -0,0 +1,34 @@
+import os
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from robustness import pair_robustness, robustness_test
+
+def _pair_data(n=300):
+    rng = np.random.default_rng(0)
+    price2 = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    price1 = 1.5 * price2 + rng.normal(0, 1, n) + 10
+    return pd.DataFrame({'A': price1, 'B': price2}, index=pd.bdate_range("2020-01-01", periods=n))
+
+def test_pair_without_trades_is_not_significant():
+    # An entry threshold no z-score reaches leaves the equity curve flat
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', RuntimeWarning)
+        table = robustness_test(_pair_data(), [('A', 'B')], n_paths=50, entry_zscore=50)
+    row = table.iloc[0]
+    assert np.isnan(row['permutation_p_value'])
+    assert np.isnan(row['bootstrap_p_value'])
+    assert np.isnan(row['adjusted_p_value'])
+    assert not row['significant']
+
+def test_pair_robustness_without_trades_skips_resampling():
+    data = _pair_data()
+    no_signal = np.zeros(len(data), dtype=bool)
+    result = pair_robustness(data['A'].to_numpy(), data['B'].to_numpy(), [no_signal] * 4, n_paths=50, seed=0)
+    assert np.isnan(result['permutation_p_value']) and np.isnan(result['bootstrap_p_value'])
+    assert result['permuted'].empty and result['bootstrap'].empty